@@ -1,16 +1,21 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 import os
+import json
+import time
 
 from utils.config import AppConfig
 from utils.logger import get_logger
-from utils.file_utils import compute_file_hash, detect_file_type, allowed_file, load_bytes
-from utils.parsers import parse_file_to_records
-from utils.cleaning import clean_records
-from utils.chunking import chunk_records
+from utils.file_utils import allowed_file, save_stream, commit_stream, discard_stream
+from utils.ingest import IngestionQueue, SpooledIngestion
+from utils.workers import resolve_role
 from utils.embeddings import EmbeddingService
-from utils.vectorstore import VectorStore
+from utils.vectorstore import VectorStore, ReadOnlyVectorStore
 from utils.retrieval import HybridRetriever
+from utils.fusion import FUSION_METHODS
+from utils.context import ContextPacker
+from utils.answers import AnswerCache
 from utils.llm import LLMService
+from utils.scheduler import QueueFull
 from utils.tabular import TabularQueryEngine
 
 try:
@@ -28,11 +33,55 @@ if CORS:
 os.makedirs(config.upload_dir, exist_ok=True)
 os.makedirs(config.vector_dir, exist_ok=True)
 
-embedding_service = EmbeddingService(config, logger)
-vector_store = VectorStore(config, logger, embedding_service)
-retriever = HybridRetriever(config, logger, vector_store, embedding_service)
-llm_service = LLMService(config, logger)
-tabular_engine = TabularQueryEngine(logger)
+# Seconds spent constructing each component; models are timed by their loaders
+startup_timings = {}
+
+
+def _timed(name, build):
+    start = time.perf_counter()
+    component = build()
+    startup_timings[name] = round(time.perf_counter() - start, 3)
+    return component
+
+
+def _init_services():
+    global embedding_service, role, vector_store, retriever, llm_service, context_packer, answer_cache, \
+        tabular_engine, ingestion_queue, models
+    embedding_service = _timed('embedding_service', lambda: EmbeddingService(config, logger))
+    # Readers serve a memory-mapped copy of the index and hand writes to the writer process
+    role = resolve_role(config, logger)
+    logger.info('Index role: %s', role)
+    store_class = ReadOnlyVectorStore if role == 'reader' else VectorStore
+    vector_store = _timed('vector_store', lambda: store_class(config, logger, embedding_service))
+    retriever = _timed('retriever', lambda: HybridRetriever(config, logger, vector_store, embedding_service))
+    llm_service = _timed('llm_service', lambda: LLMService(config, logger))
+    context_packer = ContextPacker(config, logger, llm_service)
+    answer_cache = _timed('answer_cache', lambda: AnswerCache(config, logger, vector_store, llm_service))
+    tabular_engine = TabularQueryEngine(config, logger)
+    if role == 'reader':
+        ingestion_queue = SpooledIngestion(config, logger)
+    else:
+        ingestion_queue = IngestionQueue(config, logger, vector_store, shared=(role == 'writer'))
+
+    models = {
+        'embedding': embedding_service.model_loader,
+        'reranker': retriever.cross_loader,
+        'generator': llm_service.generator_loader,
+    }
+    for name in config.warmup:
+        if name in models:
+            models[name].warm_up()
+        else:
+            logger.warning('Unknown WARMUP model %r (expected one of %s)', name, ', '.join(models))
+    logger.info('Startup timings (s): %s', startup_timings)
+
+
+def create_app():
+    # Services are built here rather than at import, so processes that merely import this
+    # module (e.g. spawned parser workers) load no models or index
+    if not startup_timings:
+        _init_services()
+    return app
 
 
 @app.route('/health', methods=['GET'])
@@ -40,6 +89,19 @@ def health():
     return jsonify({"status": "ok"}), 200
 
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    # Ready once every model named in WARMUP has loaded; others load on first use
+    statuses = {name: loader.status() for name, loader in models.items()}
+    is_ready = all(models[name].loaded for name in config.warmup if name in models)
+    return jsonify({
+        "ready": is_ready,
+        "models": statuses,
+        "warmup": config.warmup,
+        "startup_seconds": startup_timings
+    }), 200 if is_ready else 503
+
+
 # Serve frontend files without modifying them
 _frontend_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'Frontend')
 
@@ -70,68 +132,222 @@ def upload():
         if not allowed_file(filename):
             return jsonify({"status": "error", "error": "Unsupported file type"}), 400
 
-        save_path = os.path.join(config.upload_dir, filename)
-        file.save(save_path)
-
-        file_bytes = load_bytes(save_path)
-        file_hash = compute_file_hash(file_bytes)
-        file_type = detect_file_type(filename, file_bytes)
-
-        records = parse_file_to_records(filename, file_bytes, file_type, logger)
-        cleaned_records = clean_records(records, logger)
-        chunks = chunk_records(cleaned_records, file_type, logger)
-
-        vector_store.index_chunks(chunks, file_hash=file_hash, filename=filename, file_type=file_type)
-        # invalidate BM25 cache after mutation
-        retriever.invalidate_bm25()
+        # Spooled under a name private to this request, then kept per content hash, so a later
+        # upload with the same name can't replace the file a queued job has yet to read
+        spool_path, file_hash = save_stream(file.stream, config.upload_dir)
+
+        # Content already indexed: skip parsing and embedding entirely
+        existing = vector_store.chunk_count(file_hash)
+        if existing:
+            discard_stream(spool_path)
+            return jsonify({
+                "status": "success",
+                "message": "File already indexed",
+                "filename": filename,
+                "file_hash": file_hash,
+                "num_chunks": existing,
+                "duplicate": True
+            }), 200
+        save_path = os.path.join(config.upload_dir, file_hash, os.path.basename(filename))
+        # The same bytes under the same name are already on disk (e.g. still queued): reuse that
+        # file; the job itself skips content that got indexed in the meantime
+        commit_stream(spool_path, save_path)
+
+        job_id, future = ingestion_queue.submit(save_path, filename, file_hash=file_hash)
+        if str(request.form.get('sync', 'false')).lower() == 'true':
+            # Blocking mode for scripts that want the indexing summary inline
+            result = future.result() if future else _wait_for_job(job_id)
+            # A reader sees the new chunks right away instead of on its next reload
+            vector_store.refresh()
+            return jsonify({
+                "status": "success",
+                "message": "File processed and indexed",
+                "job_id": job_id,
+                **result
+            }), 200
 
         return jsonify({
-            "status": "success",
-            "message": "File processed and indexed",
-            "filename": filename,
-            "file_hash": file_hash,
-            "file_type": file_type,
-            "num_chunks": len(chunks)
-        }), 200
+            "status": "queued",
+            "message": "File accepted for indexing",
+            "job_id": job_id,
+            "filename": filename
+        }), 202
     except Exception as exc:
         logger.exception("/upload failed")
         return jsonify({"status": "error", "error": str(exc)}), 500
 
 
+def _wait_for_job(job_id, timeout=600):
+    deadline = time.time() + timeout
+    while True:
+        if time.time() > deadline:
+            raise RuntimeError(f'Timed out waiting for job {job_id}; is the index writer running?')
+        job = ingestion_queue.get(job_id)
+        if job is None:
+            raise RuntimeError('Ingestion job disappeared')
+        if job['status'] == 'failed':
+            raise RuntimeError(job['error'])
+        if job['status'] == 'done':
+            return job['result']
+        time.sleep(0.2)
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job), 200
+
+
+def _retrieve(q, payload):
+    return retriever.retrieve(
+        q, top_k=int(payload.get('top_k', 5)), use_bm25=bool(payload.get('use_bm25', True)),
+        use_multiquery=bool(payload.get('use_multiquery', True)), use_rerank=bool(payload.get('use_rerank', True)),
+        restrict_filename=payload.get('filename'), restrict_file_hash=payload.get('file_hash'),
+        nprobe=payload.get('nprobe'), ef_search=payload.get('ef_search'),
+        fusion=payload.get('fusion'), semantic_weight=payload.get('semantic_weight')
+    )
+
+
+def _retrieval_error(payload):
+    # Client-supplied fusion options are checked up front so bad values get a 400
+    fusion = payload.get('fusion')
+    if fusion is not None and fusion not in FUSION_METHODS:
+        return f"'fusion' must be one of {', '.join(FUSION_METHODS)}"
+    weight = payload.get('semantic_weight')
+    if weight is not None:
+        try:
+            weight = float(weight)
+        except (TypeError, ValueError):
+            weight = None
+        if weight is None or not 0.0 <= weight <= 1.0:
+            return "'semantic_weight' must be a number between 0 and 1"
+    return _search_param_error(payload)
+
+
+def _search_param_error(payload):
+    # nprobe/ef_search go straight into the FAISS search parameters
+    for name in ('nprobe', 'ef_search'):
+        value = payload.get(name)
+        if value is None:
+            continue
+        if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+            value = None
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            value = None
+        if value is None or value < 1:
+            return f"'{name}' must be a positive integer"
+    return None
+
+
+def _tables(payload):
+    # Tabular queries see only the file(s) the request is scoped to
+    return vector_store.get_tables(file_hash=payload.get('file_hash'), filename=payload.get('filename'))
+
+
+def _answer(q, retrieved, context):
+    # Returns (answer, served from cache)
+    key = answer_cache.key(q, retrieved)
+    answer = answer_cache.get(key)
+    if answer is not None:
+        return answer, True
+    answer = llm_service.answer(q, context)
+    answer_cache.put(key, answer)
+    return answer, False
+
+
+def _busy(body):
+    response = jsonify(body)
+    response.headers['Retry-After'] = '1'
+    return response, 429
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
 @app.route('/query', methods=['POST'])
 def query():
     try:
         payload = request.get_json(force=True, silent=False)
         q = payload.get('query')
-        top_k = int(payload.get('top_k', 5))
         mode = payload.get('mode', 'auto')
-        use_bm25 = bool(payload.get('use_bm25', True))
-        use_multiquery = bool(payload.get('use_multiquery', True))
-        use_rerank = bool(payload.get('use_rerank', True))
 
         if not q:
             return jsonify({"error": "Missing 'query'"}), 400
+        error = _retrieval_error(payload)
+        if error:
+            return jsonify({"error": error}), 400
 
         if mode in ('auto', 'tabular') and tabular_engine.looks_tabular_query(q):
-            tabular_result = tabular_engine.execute(q, vector_store.get_tabular_frames())
+            tabular_result = tabular_engine.execute(q, _tables(payload))
             if tabular_result is not None:
                 return jsonify({"answer": tabular_result, "mode": "tabular"}), 200
 
-        restrict_hash = payload.get('file_hash')
-        restrict_name = payload.get('filename')
-        retrieved = retriever.retrieve(
-            q, top_k=top_k, use_bm25=use_bm25, use_multiquery=use_multiquery, use_rerank=use_rerank,
-            restrict_filename=restrict_name, restrict_file_hash=restrict_hash
-        )
-        context = retriever.format_context(retrieved)
-        answer = llm_service.answer(q, context)
+        retrieved = _retrieve(q, payload)
+        context, usage = context_packer.pack(q, retrieved)
+        answer, cached = _answer(q, retrieved, context)
 
-        return jsonify({"answer": answer, "chunks": retrieved, "mode": "text"}), 200
+        return jsonify({"answer": answer, "chunks": retrieved, "mode": "text", "context": usage, "cached": cached}), 200
+    except QueueFull:
+        return _busy({"error": "Generation queue is full, retry shortly"})
     except Exception as exc:
         logger.exception("/query failed")
         return jsonify({"error": str(exc)}), 500
 
 
+@app.route('/query/stream', methods=['POST'])
+def query_stream():
+    payload = request.get_json(force=True, silent=True) or {}
+    q = payload.get('query')
+    mode = payload.get('mode', 'auto')
+    if not q:
+        return jsonify({"error": "Missing 'query'"}), 400
+    error = _retrieval_error(payload)
+    if error:
+        return jsonify({"error": error}), 400
+    # Refuse before the stream opens; once it has, the status code is already sent
+    if llm_service.scheduler.full():
+        return _busy({"error": "Generation queue is full, retry shortly"})
+
+    def events():
+        try:
+            if mode in ('auto', 'tabular') and tabular_engine.looks_tabular_query(q):
+                tabular_result = tabular_engine.execute(q, _tables(payload))
+                if tabular_result is not None:
+                    yield _sse('answer', {"answer": tabular_result, "mode": "tabular"})
+                    return
+            # Chunks go out as soon as retrieval finishes, before generation starts
+            retrieved = _retrieve(q, payload)
+            context, usage = context_packer.pack(q, retrieved)
+            yield _sse('chunks', {"chunks": retrieved, "mode": "text", "context": usage})
+            key = answer_cache.key(q, retrieved)
+            cached = answer_cache.get(key)
+            if cached is not None:
+                yield _sse('token', {"text": cached})
+                yield _sse('done', {"answer": cached, "cached": True})
+                return
+            parts = []
+            for text in llm_service.stream_answer(q, context):
+                parts.append(text)
+                yield _sse('token', {"text": text})
+            answer = ''.join(parts)
+            answer_cache.put(key, answer)
+            yield _sse('done', {"answer": answer, "cached": False})
+        except QueueFull:
+            # Filled up during retrieval
+            yield _sse('error', {"error": "Generation queue is full, retry shortly"})
+        except Exception as exc:
+            logger.exception("/query/stream failed")
+            yield _sse('error', {"error": str(exc)})
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers=headers)
+
+
 # Compatibility endpoint for frontend's /ask contract
 @app.route('/ask', methods=['POST'])
 def ask():
@@ -145,7 +361,7 @@ def ask():
             return jsonify({"type": "text", "answer": "Missing question"}), 400
 
         if tabular_engine.looks_tabular_query(question):
-            tab_res = tabular_engine.execute(question, vector_store.get_tabular_frames())
+            tab_res = tabular_engine.execute(question, vector_store.get_tables(file_hash=restrict_hash, filename=restrict_name))
             if isinstance(tab_res, list):
                 if not tab_res:
                     return jsonify({"type": "text", "answer": "No data available"}), 200
@@ -159,17 +375,18 @@ def ask():
             question, top_k=5, use_bm25=True, use_multiquery=True, use_rerank=True,
             restrict_filename=restrict_name, restrict_file_hash=restrict_hash
         )
-        context = retriever.format_context(results)
-        answer = llm_service.answer(question, context)
+        context, usage = context_packer.pack(question, results)
+        logger.info("/ask context: %d tokens of %d, %d chunks full, %d partial",
+                    usage['context_tokens'], usage['budget_tokens'], usage['chunks_full'], usage['chunks_partial'])
+        answer, _ = _answer(question, results, context)
         return jsonify({"type": "text", "answer": answer}), 200
+    except QueueFull:
+        return _busy({"type": "text", "answer": "The server is busy, please retry shortly"})
     except Exception as exc:
         logger.exception("/ask failed")
         return jsonify({"type": "text", "answer": f"Error: {str(exc)}"}), 500
 
 
-if __name__ == '__main__':
-    app.run(host=config.host, port=config.port, debug=config.debug)
-
 # Management APIs
 @app.route('/files', methods=['GET'])
 def list_files():
@@ -179,9 +396,44 @@ def list_files():
 def delete_file():
     try:
         payload = request.get_json(force=True, silent=False)
-        removed = vector_store.remove_file(file_hash=payload.get('file_hash'), filename=payload.get('filename'))
-        retriever.invalidate_bm25()
+        if role == 'reader':
+            job_id, _ = ingestion_queue.submit_delete(file_hash=payload.get('file_hash'), filename=payload.get('filename'))
+            removed = _wait_for_job(job_id)['removed_chunks']
+            vector_store.refresh()
+        else:
+            removed = vector_store.remove_file(file_hash=payload.get('file_hash'), filename=payload.get('filename'))
         return jsonify({"removed_chunks": removed}), 200
     except Exception as exc:
         logger.exception("/files DELETE failed")
         return jsonify({"error": str(exc)}), 500
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        "query_embedding_cache": embedding_service.query_cache.stats(),
+        "chunk_embedding_cache": embedding_service.cache.stats(),
+        "rerank_cache": retriever.rerank_cache.stats(),
+        "index": {"role": role, **vector_store.status()},
+        "answer_cache": answer_cache.stats(),
+        "generation": llm_service.scheduler.stats()
+    }), 200
+
+@app.route('/index/recall', methods=['POST'])
+def index_recall():
+    try:
+        payload = request.get_json(force=True, silent=True) or {}
+        error = _search_param_error(payload)
+        if error:
+            return jsonify({"error": error}), 400
+        report = vector_store.recall_check(
+            k=int(payload.get('k', 10)), sample=int(payload.get('sample', 100)), queries=payload.get('queries'),
+            nprobe=payload.get('nprobe'), ef_search=payload.get('ef_search')
+        )
+        return jsonify(report), 200
+    except Exception as exc:
+        logger.exception("/index/recall failed")
+        return jsonify({"error": str(exc)}), 500
+
+
+if __name__ == '__main__':
+    create_app().run(host=config.host, port=config.port, debug=config.debug)
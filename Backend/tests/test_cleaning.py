@@ -0,0 +1,30 @@
+import pandas as pd
+
+from utils.cleaning import StreamingTableCleaner
+
+
+def _batches():
+    return [pd.DataFrame({'Region': ['north', 'south', 'north'], 'Qty': [1, 2, 1]}),
+            pd.DataFrame({'Region': ['south', 'east'], 'Qty': [2, 3]})]
+
+
+def _clean(cleaner):
+    for batch in _batches():
+        cleaner.observe(batch)
+    return [cleaner.clean(batch) for batch in _batches()]
+
+
+def test_streaming_cleaner_drops_duplicates_across_batches():
+    first, second = _clean(StreamingTableCleaner())
+    # (qty is clipped to the 1st-99th percentile, so only regions are compared)
+    assert first['region'].tolist() == ['north', 'south']
+    assert second['region'].tolist() == ['east']
+
+
+def test_streaming_cleaner_stops_remembering_rows_past_dedup_rows():
+    cleaner = StreamingTableCleaner(dedup_rows=1)
+    first, second = _clean(cleaner)
+    assert cleaner.dedup_full
+    # Within a batch duplicates still go; only the first distinct row is remembered
+    assert len(first) == 2
+    assert second['region'].tolist() == ['south', 'east']
@@ -0,0 +1,48 @@
+import logging
+from types import SimpleNamespace
+
+from utils.context import ContextPacker
+
+
+class _LLM:
+    # One token per word
+    def max_input_tokens(self):
+        return 512
+
+    def count_tokens(self, texts):
+        return [len(t.split()) for t in texts]
+
+    def prompt_tokens(self, question):
+        return 10
+
+
+def _packer(max_input_tokens=0):
+    config = SimpleNamespace(max_input_tokens=max_input_tokens, max_context_chars=8000)
+    return ContextPacker(config, logging.getLogger('test'), _LLM())
+
+
+def _table(rows):
+    return {'filename': 'sales.csv', 'chunk_type': 'tabular', 'text': 'region,revenue\n' + '\n'.join(rows) + '\n'}
+
+
+def test_tabular_chunks_keep_their_header_row():
+    context, usage = _packer().pack('revenue by region', [_table(['north,10', 'south,40']), _table(['east,5'])])
+    assert context == ('[sales.csv | tabular]\nregion,revenue\nnorth,10\nsouth,40\n\n'
+                       '[sales.csv | tabular]\nregion,revenue\neast,5')
+    assert usage['duplicate_sentences'] == 0
+
+
+def test_text_sentences_are_deduplicated():
+    results = [{'filename': 'a.txt', 'chunk_type': 'text', 'text': 'The cat sat. Dogs bark.'},
+               {'filename': 'b.txt', 'chunk_type': 'text', 'text': 'The cat sat. Cats purr.'}]
+    context, usage = _packer().pack('cats', results)
+    assert context == '[a.txt | text]\nThe cat sat. Dogs bark.\n\n[b.txt | text]\nCats purr.'
+    assert usage['duplicate_sentences'] == 1
+
+
+def test_partial_tabular_chunk_keeps_header_and_matching_rows():
+    rows = [f'r{i},{i}' for i in range(40)] + ['west,99']
+    context, usage = _packer(max_input_tokens=16).pack('west revenue', [_table(rows)])
+    assert context.split('\n')[:3] == ['[sales.csv | tabular]', 'region,revenue', 'r0,0']
+    assert 'west,99' in context.split('\n')
+    assert usage['chunks_partial'] == 1
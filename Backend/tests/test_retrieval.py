@@ -0,0 +1,41 @@
+import logging
+
+import pytest
+
+pytest.importorskip('torch')
+
+from utils.config import AppConfig
+from utils.retrieval import HybridRetriever
+
+
+class _Store:
+    def subscribe(self, callback):
+        pass
+
+
+class _Cross:
+    # Scores passages by their number, so reranking reverses the fused order
+    def predict(self, pairs, batch_size=None):
+        return [float(p.split()[-1]) for _, p in pairs]
+
+
+def _retriever(max_candidates):
+    config = AppConfig()
+    config.rerank_max_candidates = max_candidates
+    retriever = HybridRetriever(config, logging.getLogger('test'), _Store(), None)
+    retriever.cross_loader._value = _Cross()
+    return retriever
+
+
+def test_rerank_fills_top_k_past_the_candidate_cap():
+    candidates = [{'vector_id': i, 'text': f'passage {i}'} for i in range(30)]
+    results = _retriever(20)._rerank('query', candidates, 30)
+    assert len(results) == 30
+    # The capped candidates are reranked, the rest follow in fused order
+    assert [r['vector_id'] for r in results[:20]] == list(range(19, -1, -1))
+    assert [r['vector_id'] for r in results[20:]] == list(range(20, 30))
+
+
+def test_rerank_keeps_top_k_within_the_cap():
+    candidates = [{'vector_id': i, 'text': f'passage {i}'} for i in range(30)]
+    assert [r['vector_id'] for r in _retriever(20)._rerank('query', candidates, 3)] == [19, 18, 17]
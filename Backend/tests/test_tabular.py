@@ -0,0 +1,75 @@
+import logging
+
+import pandas as pd
+import pytest
+
+from utils.config import AppConfig
+from utils.tables import TableStore
+from utils.tabular import TabularQueryEngine
+
+
+@pytest.fixture
+def tables(tmp_path):
+    config = AppConfig()
+    config.vector_dir = str(tmp_path)
+    store = TableStore(config, logging.getLogger('test'))
+    store.append('A', 'sales.csv', pd.DataFrame({
+        'product': ['pen', 'ink', 'pad', 'cap', 'box', 'tag'],
+        'region': ['north', 'south', 'north', 'east', 'south', 'north'],
+        'revenue': [10.0, 40.0, 25.0, 5.0, 30.0, 20.0],
+    }))
+    return [store.get('A')]
+
+
+@pytest.fixture
+def engine():
+    config = AppConfig()
+    config.tabular_max_rows = 100
+    return TabularQueryEngine(config, logging.getLogger('test'))
+
+
+def test_top_n_by_column_sorts_descending(engine, tables):
+    plan = engine.plan('top 2 products by revenue', tables)
+    assert plan.sort == ('revenue', False) and plan.limit == 2
+    assert [r['revenue'] for r in engine.execute('top 2 products by revenue', tables)] == [40.0, 30.0]
+
+
+def test_top_n_rows_sorted_by_takes_top_direction(engine, tables):
+    result = engine.execute('show top 3 rows sorted by revenue', tables)
+    assert [r['revenue'] for r in result] == [40.0, 30.0, 25.0]
+
+
+def test_bottom_n_sorts_ascending(engine, tables):
+    result = engine.execute('bottom 2 products by revenue', tables)
+    assert [r['revenue'] for r in result] == [5.0, 10.0]
+
+
+def test_explicit_direction_beats_top(engine, tables):
+    plan = engine.plan('top 3 rows sorted by revenue ascending', tables)
+    assert plan.sort == ('revenue', True)
+
+
+def test_top_n_groups_by_aggregate(engine, tables):
+    plan = engine.plan('top 3 regions by total revenue', tables)
+    assert (plan.op, plan.column, plan.group_by, plan.sort, plan.limit) == ('sum', 'revenue', 'region', (None, False), 3)
+    assert engine.execute('top 3 regions by total revenue', tables) == [
+        {'region': 'south', 'sum_revenue': 70.0},
+        {'region': 'north', 'sum_revenue': 55.0},
+        {'region': 'east', 'sum_revenue': 5.0},
+    ]
+
+
+def test_count_of_text_column_by_group(engine, tables):
+    result = engine.execute('count of product by region', tables)
+    assert result == [{'region': 'east', 'count_product': 1}, {'region': 'north', 'count_product': 3},
+                      {'region': 'south', 'count_product': 2}]
+
+
+def test_filter_with_without_where(engine, tables):
+    result = engine.execute('rows with revenue above 25', tables)
+    assert sorted(r['revenue'] for r in result) == [30.0, 40.0]
+
+
+def test_unparsed_comparison_falls_back(engine, tables):
+    # No clause keyword before the comparison: retrieval answers instead of an unfiltered table
+    assert engine.plan('top 5 rows revenue above 25', tables) is None
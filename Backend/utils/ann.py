@@ -0,0 +1,54 @@
+import math
+from typing import Optional
+
+import numpy as np
+import faiss
+
+
+INDEX_TYPES = ('flat', 'hnsw', 'ivf_flat', 'ivf_pq')
+
+
+def _nlist_for(config, n: int) -> int:
+    if config.ivf_nlist > 0:
+        # k-means needs at least one training point per list
+        return min(config.ivf_nlist, n)
+    # Usual rule of thumb: ~4*sqrt(n) lists, keeping >= 39 training points per list
+    return max(1, min(int(4 * math.sqrt(n)), n // 39 or 1))
+
+
+def build_ann_index(config, vectors: np.ndarray, ids: np.ndarray):
+    kind = config.faiss_index_type
+    d = vectors.shape[1]
+    if kind == 'hnsw':
+        hnsw = faiss.IndexHNSWFlat(d, config.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = config.hnsw_ef_construction
+        # HNSW has no add_with_ids of its own
+        index = faiss.IndexIDMap(hnsw)
+    elif kind in ('ivf_flat', 'ivf_pq'):
+        nlist = _nlist_for(config, len(vectors))
+        quantizer = faiss.IndexFlatIP(d)
+        if kind == 'ivf_flat':
+            index = faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            m = config.pq_m if d % config.pq_m == 0 else 1
+            # 8-bit codes train 256 centroids per sub-quantizer; fewer vectors get smaller codebooks
+            nbits = max(1, min(8, int(math.log2(len(vectors)))))
+            index = faiss.IndexIVFPQ(quantizer, d, nlist, m, nbits, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+    else:
+        raise ValueError(f'Unsupported FAISS_INDEX type: {kind}')
+    index.add_with_ids(vectors, ids)
+    return index
+
+
+def supports_remove(index) -> bool:
+    return not isinstance(index, faiss.IndexIDMap)
+
+
+def search_params(config, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    kind = config.faiss_index_type
+    if kind == 'hnsw':
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search or config.ef_search))
+    if kind in ('ivf_flat', 'ivf_pq'):
+        return faiss.SearchParametersIVF(nprobe=int(nprobe or config.nprobe))
+    return None
@@ -0,0 +1,61 @@
+import os
+import json
+import threading
+from typing import Any, Dict, List, Optional
+
+from utils.cache import TTLCache, normalize_query
+from utils.segments import _atomic_write
+
+
+class AnswerCache:
+    # Generated answers keyed by (normalized question, sorted chunk ids, model).
+    # Entries are tagged with their chunk ids, so adding or removing any of
+    # those chunks drops the answer. Optionally mirrored to a JSON file.
+    def __init__(self, config, logger, vector_store, llm_service) -> None:
+        self.config = config
+        self.logger = logger
+        self.llm = llm_service
+        self.cache = TTLCache(config.answer_cache_size, config.answer_cache_ttl)
+        self.path = config.answer_cache_path
+        self._write_lock = threading.Lock()
+        if self.path and os.path.exists(self.path):
+            self._load()
+        vector_store.subscribe(self._on_store_change)
+
+    def key(self, question: str, results: List[Dict[str, Any]]) -> tuple:
+        ids = tuple(sorted(int(r['vector_id']) for r in results if r.get('vector_id') is not None))
+        return (normalize_query(question), ids, self.llm.model_name)
+
+    def get(self, key: tuple) -> Optional[str]:
+        return self.cache.get(key)
+
+    def put(self, key: tuple, answer: str) -> None:
+        self.cache.put(key, answer, tags=key[1])
+        self._save()
+
+    def _on_store_change(self, event: str, vector_ids: List[int]) -> None:
+        if self.cache.invalidate_tags(vector_ids):
+            self._save()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            self.cache.restore((tuple([q, tuple(ids), model]), answer, expires, tuple(tags))
+                               for (q, ids, model), answer, expires, tags in entries)
+            self.logger.info('Loaded %d cached answers', len(self.cache))
+        except Exception:
+            self.logger.warning('Failed to load answer cache from %s, starting empty', self.path)
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        entries = [[[k[0], list(k[1]), k[2]], v, exp, list(tags)] for k, v, exp, tags in self.cache.snapshot()]
+        try:
+            with self._write_lock:
+                _atomic_write(self.path, lambda f: json.dump(entries, f))
+        except Exception:
+            self.logger.warning('Failed to persist answer cache to %s', self.path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.cache.stats(), 'persisted': bool(self.path)}
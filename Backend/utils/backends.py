@@ -0,0 +1,62 @@
+from typing import Any
+
+import torch
+from sentence_transformers import SentenceTransformer, CrossEncoder
+from transformers import AutoTokenizer, pipeline
+
+BACKENDS = ('torch', 'int8', 'onnx')
+
+
+def check_backend(kind: str, backend: str) -> str:
+    if backend not in BACKENDS:
+        raise ValueError(f'Unsupported {kind} backend: {backend} (expected one of {", ".join(BACKENDS)})')
+    return backend
+
+
+def quantize_int8(module: Any) -> Any:
+    # Dynamic int8 quantization of the Linear layers; weights are converted once,
+    # activations are quantized on the fly. CPU only.
+    module.eval()
+    return torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _onnx_error(kind: str, exc: Exception) -> RuntimeError:
+    return RuntimeError(f'ONNX {kind} backend unavailable ({exc}); it needs optimum[onnxruntime] '
+                        f'and, for the sentence-transformers models, sentence-transformers>=4.0')
+
+
+def load_sentence_transformer(name: str, backend: str):
+    if check_backend('embedding', backend) == 'onnx':
+        try:
+            return SentenceTransformer(name, backend='onnx')
+        except (TypeError, ImportError) as exc:
+            raise _onnx_error('embedding', exc)
+    model = SentenceTransformer(name, device='cpu' if backend == 'int8' else None)
+    return quantize_int8(model) if backend == 'int8' else model
+
+
+def load_cross_encoder(name: str, backend: str):
+    if check_backend('reranker', backend) == 'onnx':
+        try:
+            return CrossEncoder(name, backend='onnx')
+        except (TypeError, ImportError) as exc:
+            raise _onnx_error('reranker', exc)
+    model = CrossEncoder(name, device='cpu' if backend == 'int8' else None)
+    if backend == 'int8':
+        model.model = quantize_int8(model.model)
+    return model
+
+
+def load_text2text_pipeline(name: str, backend: str):
+    if check_backend('generator', backend) == 'onnx':
+        try:
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        except ImportError as exc:
+            raise _onnx_error('generator', exc)
+        model = ORTModelForSeq2SeqLM.from_pretrained(name, export=True)
+        return pipeline('text2text-generation', model=model, tokenizer=AutoTokenizer.from_pretrained(name))
+    if backend == 'int8':
+        generator = pipeline('text2text-generation', model=name, device=-1)
+        generator.model = quantize_int8(generator.model)
+        return generator
+    return pipeline('text2text-generation', model=name)
@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+import json
+import argparse
+import warnings
+import tempfile
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from utils.cleaning import _clean_dataframe_fast
+
+
+def reference_clean(df: pd.DataFrame) -> pd.DataFrame:
+    # The original per-column cleaning, kept only to compare against. Written for
+    # pandas 3: errors='ignore' and fillna(method=...) are gone, text columns may
+    # use the str dtype, and np.issubdtype rejects extension dtypes.
+    df = df.copy()
+    # Normalize headers
+    df.columns = [str(c).strip().lower().replace(' ', '_') for c in df.columns]
+    # Type inference: a column is converted only if every value parses
+    for col in df.columns:
+        if pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col]):
+            try:
+                with warnings.catch_warnings():
+                    # 'Could not infer format' for every text column
+                    warnings.simplefilter('ignore', UserWarning)
+                    df[col] = pd.to_datetime(df[col])
+            except (ValueError, TypeError):
+                try:
+                    df[col] = pd.to_numeric(df[col])
+                except (ValueError, TypeError):
+                    pass
+    # Missing values
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].fillna(df[col].median())
+        elif pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].ffill().bfill()
+        else:
+            df[col] = df[col].fillna('')
+    # Duplicates
+    df = df.drop_duplicates().reset_index(drop=True)
+    # Outliers (clip 1st-99th percentile)
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            low, high = df[col].quantile(0.01), df[col].quantile(0.99)
+            df[col] = df[col].clip(lower=low, upper=high)
+    return df
+
+
+def synthetic_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    # Mix of what uploads contain: ids, skewed prices with gaps and outliers,
+    # categories, dates (one column in mixed formats), numbers stored as text and
+    # ~5% repeated rows
+    rng = np.random.default_rng(seed)
+    price = rng.lognormal(3, 1, rows)
+    price[rng.random(rows) < 0.02] = np.nan
+    price[rng.random(rows) < 0.001] *= 1000
+    days = pd.date_range('2023-01-01', periods=730)
+    # Each of the 730 days spelled in three formats; rows pick a day and a format
+    spelled = np.stack([np.asarray(days.strftime(f), dtype=object) for f in ('%Y-%m-%d', '%d %b %Y', '%B %d, %Y')])
+    df = pd.DataFrame({
+        'Order ID': np.arange(rows),
+        'Price': price,
+        'Quantity': rng.integers(1, 50, rows),
+        'Region': rng.choice(np.array(['north', 'south', 'east', 'west', None], dtype=object), rows,
+                             p=[0.3, 0.3, 0.2, 0.15, 0.05]),
+        'Order Date': spelled[0][rng.integers(0, 730, rows)],
+        # Hand-entered dates in mixed formats: no single format can be inferred
+        'Ship Date': spelled[rng.choice(3, rows, p=[0.5, 0.25, 0.25]), rng.integers(0, 730, rows)],
+        'Discount': rng.integers(0, 30, rows).astype(str),
+        'Note': rng.choice(np.array(['', 'gift', 'express', 'returned customer'], dtype=object), rows),
+    })
+    # Some rows replaced by copies of others
+    source = np.arange(rows)
+    dup = rng.random(rows) < 0.05
+    source[dup] = rng.integers(0, rows, int(dup.sum()))
+    return df.iloc[source].reset_index(drop=True)
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - start
+
+
+def bench(rows: int, reference_max_rows: int, workdir: str) -> Dict[str, Any]:
+    path = os.path.join(workdir, f'synthetic-{rows}.csv')
+    if not os.path.exists(path):
+        synthetic_frame(rows).to_csv(path, index=False)
+    report: Dict[str, Any] = {'rows': rows, 'csv_mb': round(os.path.getsize(path) / 1e6, 1)}
+    df, seconds = _timed(lambda: pd.read_csv(path))
+    report['read_csv_s'] = round(seconds, 2)
+    out, seconds = _timed(lambda: _clean_dataframe_fast(df.copy()))
+    report['fast_s'] = round(seconds, 2)
+    report['fast_rows_per_s'] = int(rows / seconds)
+    report['rows_out'] = len(out)
+    if rows <= reference_max_rows:
+        reference, seconds = _timed(lambda: reference_clean(df))
+        report['reference_s'] = round(seconds, 2)
+        report['reference_rows_per_s'] = int(rows / seconds)
+        report['speedup'] = round(report['reference_s'] / max(report['fast_s'], 1e-9), 1)
+        report['reference_rows_out'] = len(reference)
+    return report
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Time dataframe cleaning on synthetic CSV files')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000, 5000000])
+    parser.add_argument('--reference-max-rows', type=int, default=1000000,
+                        help='largest size also timed with the original cleaning path')
+    parser.add_argument('--workdir', default=None, help='where the CSV files are written (default: a temp dir)')
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bench-cleaning-')
+    os.makedirs(workdir, exist_ok=True)
+    for rows in args.rows:
+        print(json.dumps(bench(rows, args.reference_max_rows, workdir)), flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+import os
+import math
+import hashlib
+from typing import List, Dict, Tuple, Optional
+
+import numpy as np
+
+
+def tokenize(text: str) -> List[str]:
+    return text.lower().split()
+
+
+def term_hash(term: str) -> int:
+    # Saved postings are keyed by a 64-bit hash of the term, so the vocabulary is a
+    # sorted number array instead of strings
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+# Arrays of a saved index: sorted term hashes, each term's start in docs/tfs,
+# postings grouped by term, the ids of all indexed docs and doc lengths by id
+_SAVED = ('terms', 'starts', 'docs', 'tfs', 'doc_ids', 'doc_len')
+
+
+class BM25Index:
+    # Okapi BM25 over an inverted index that is updated in place as chunks are
+    # added or removed, so queries never pay for a corpus-wide rebuild and only
+    # touch the postings of their own terms. An index saved with save() is
+    # loaded memory-mapped as a frozen base; later changes live in the dicts
+    # and removals of base docs in a set.
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        # term -> {doc id: term frequency}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        # doc id -> distinct terms, needed to unlink a doc from its postings
+        self._doc_terms: Dict[int, Tuple[str, ...]] = {}
+        # doc lengths indexed by doc id (vector ids are dense and increasing)
+        self._doc_len = np.zeros(1024, dtype='float32')
+        self._total_len = 0.0
+        self._base: Optional[Dict[str, np.ndarray]] = None
+        self._base_removed: set = set()
+        self._removed_ids: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._doc_terms) + len(self.base_ids) - len(self._base_removed)
+
+    @property
+    def base_ids(self) -> np.ndarray:
+        return self._base['doc_ids'] if self._base is not None else np.zeros(0, dtype='int64')
+
+    def _in_base(self, doc_id: int) -> bool:
+        ids = self.base_ids
+        i = int(np.searchsorted(ids, doc_id))
+        return i < len(ids) and int(ids[i]) == doc_id and doc_id not in self._base_removed
+
+    def add(self, doc_id: int, text: str) -> None:
+        if doc_id in self._doc_terms or self._in_base(doc_id):
+            self.remove(doc_id)
+        tokens = tokenize(text)
+        tfs: Dict[str, int] = {}
+        for tok in tokens:
+            tfs[tok] = tfs.get(tok, 0) + 1
+        for term, tf in tfs.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        self._doc_terms[doc_id] = tuple(tfs)
+        if doc_id >= len(self._doc_len):
+            grown = np.zeros(max(doc_id + 1, 2 * len(self._doc_len)), dtype='float32')
+            grown[:len(self._doc_len)] = self._doc_len
+            self._doc_len = grown
+        self._doc_len[doc_id] = len(tokens)
+        self._total_len += len(tokens)
+
+    def remove(self, doc_id: int) -> None:
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            if self._in_base(doc_id):
+                self._base_removed.add(doc_id)
+                self._removed_ids = None
+                self._total_len -= float(self._base['doc_len'][doc_id])
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_len -= float(self._doc_len[doc_id])
+        self._doc_len[doc_id] = 0
+
+    def _term_postings(self, term: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # (doc ids, term frequencies, doc lengths) from the base and the changes
+        parts = []
+        if self._base is not None:
+            base = self._base
+            h = np.uint64(term_hash(term))
+            i = int(np.searchsorted(base['terms'], h))
+            if i < len(base['terms']) and base['terms'][i] == h:
+                start, stop = int(base['starts'][i]), int(base['starts'][i + 1])
+                ids = np.asarray(base['docs'][start:stop])
+                tfs = np.asarray(base['tfs'][start:stop])
+                if self._base_removed:
+                    if self._removed_ids is None:
+                        self._removed_ids = np.fromiter(self._base_removed, dtype='int64',
+                                                        count=len(self._base_removed))
+                    keep = ~np.isin(ids, self._removed_ids)
+                    ids, tfs = ids[keep], tfs[keep]
+                parts.append((ids, tfs, base['doc_len'][ids]))
+        postings = self._postings.get(term)
+        if postings:
+            ids = np.fromiter(postings.keys(), dtype='int64', count=len(postings))
+            tfs = np.fromiter(postings.values(), dtype='float32', count=len(postings))
+            parts.append((ids, tfs, self._doc_len[ids]))
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return np.zeros(0, dtype='int64'), np.zeros(0, dtype='float32'), np.zeros(0, dtype='float32')
+        return tuple(np.concatenate(cols) for cols in zip(*parts))
+
+    def search(self, query: str, top_k: int, allowed_ids: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        n_docs = len(self)
+        if n_docs == 0 or top_k <= 0:
+            return []
+        avgdl = max(self._total_len / n_docs, 1e-6)
+        id_parts: List[np.ndarray] = []
+        score_parts: List[np.ndarray] = []
+        for term in set(tokenize(query)):
+            ids, tfs, lens = self._term_postings(term)
+            if not len(ids):
+                continue
+            # Non-negative IDF variant so scores stay comparable as the corpus changes
+            df = len(ids)
+            if allowed_ids is not None:
+                mask = np.isin(ids, allowed_ids)
+                ids, tfs, lens = ids[mask], tfs[mask], lens[mask]
+                if not len(ids):
+                    continue
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * lens / avgdl)
+            id_parts.append(ids)
+            score_parts.append(idf * tfs * (self.k1 + 1.0) / (tfs + norm))
+        if not id_parts:
+            return []
+        uniq, inverse = np.unique(np.concatenate(id_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+        if len(uniq) > top_k:
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            top = np.arange(len(uniq))
+        top = top[np.argsort(-scores[top])]
+        return [(int(uniq[i]), float(scores[i])) for i in top]
+
+    # Persistence
+
+    def snapshot(self) -> 'BM25Index':
+        # Copy to save in the background: the frozen base is shared, changes are copied
+        other = BM25Index(self.k1, self.b)
+        other._postings = {term: dict(p) for term, p in self._postings.items()}
+        other._doc_terms = dict(self._doc_terms)
+        other._doc_len = self._doc_len.copy()
+        other._total_len = self._total_len
+        other._base = self._base
+        other._base_removed = set(self._base_removed)
+        return other
+
+    def save(self, path: str) -> None:
+        # Base (minus removed docs) and changes merged into one set of flat arrays
+        os.makedirs(path, exist_ok=True)
+        hashes, docs, tfs, doc_ids = [], [], [], []
+        if self._base is not None:
+            base = self._base
+            h = np.repeat(np.asarray(base['terms']), np.diff(base['starts']))
+            d, t = np.asarray(base['docs']), np.asarray(base['tfs'])
+            ids = np.asarray(base['doc_ids'])
+            if self._base_removed:
+                removed = np.fromiter(self._base_removed, dtype='int64', count=len(self._base_removed))
+                keep = ~np.isin(d, removed)
+                h, d, t = h[keep], d[keep], t[keep]
+                ids = ids[~np.isin(ids, removed)]
+            hashes.append(h)
+            docs.append(d)
+            tfs.append(t)
+            doc_ids.append(ids)
+        if self._postings:
+            terms = list(self._postings)
+            counts = [len(self._postings[term]) for term in terms]
+            total = sum(counts)
+            hashes.append(np.repeat(np.fromiter((term_hash(term) for term in terms), dtype='uint64',
+                                                count=len(terms)), counts))
+            docs.append(np.fromiter((d for term in terms for d in self._postings[term]), dtype='int64', count=total))
+            tfs.append(np.fromiter((tf for term in terms for tf in self._postings[term].values()),
+                                   dtype='float32', count=total))
+        doc_ids.append(np.fromiter(self._doc_terms, dtype='int64', count=len(self._doc_terms)))
+        h = np.concatenate(hashes) if hashes else np.zeros(0, dtype='uint64')
+        d = np.concatenate(docs) if docs else np.zeros(0, dtype='int64')
+        t = np.concatenate(tfs) if tfs else np.zeros(0, dtype='float32')
+        order = np.lexsort((d, h))
+        h, d, t = h[order], d[order], t[order]
+        terms, starts = np.unique(h, return_index=True)
+        ids = np.unique(np.concatenate(doc_ids))
+        doc_len = np.zeros(int(ids[-1]) + 1 if len(ids) else 0, dtype='float32')
+        if self._base is not None:
+            doc_len[doc_ids[0]] = self._base['doc_len'][doc_ids[0]]
+        doc_len[doc_ids[-1]] = self._doc_len[doc_ids[-1]]
+        arrays = {'terms': terms, 'starts': np.append(starts, len(h)).astype('int64'), 'docs': d, 'tfs': t,
+                  'doc_ids': ids, 'doc_len': doc_len}
+        for name in _SAVED:
+            with open(os.path.join(path, f'{name}.npy'), 'wb') as f:
+                np.save(f, arrays[name])
+                f.flush()
+                os.fsync(f.fileno())
+
+    @classmethod
+    def load(cls, path: str, k1: float = 1.5, b: float = 0.75) -> 'BM25Index':
+        # Memory-mapped, so processes loading the same files share their pages
+        index = cls(k1, b)
+        index._base = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in _SAVED}
+        ids = index._base['doc_ids']
+        index._total_len = float(np.asarray(index._base['doc_len'][ids], dtype='float64').sum())
+        return index
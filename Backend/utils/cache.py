@@ -0,0 +1,111 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List
+
+
+def normalize_query(q: str) -> str:
+    # Case and whitespace differences should hit the same cache entry
+    return ' '.join(q.lower().split())
+
+
+class TTLCache:
+    # Bounded LRU with per-entry expiry. Entries can carry tags (e.g. vector ids)
+    # so everything derived from a removed chunk can be dropped in one call.
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._data: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._tags: Dict[Hashable, set] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires, _ = entry
+            if self.ttl and expires < time.time():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, tags: Iterable[Hashable] = (), expires: float = None) -> None:
+        if self.max_entries <= 0:
+            return
+        tags = tuple(tags)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, expires if expires is not None else time.time() + self.ttl, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.max_entries:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def _drop(self, key: Hashable) -> None:
+        _, _, tags = self._data.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate_tags(self, tags: Iterable[Hashable]) -> int:
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    if key in self._data:
+                        self._drop(key)
+                        removed += 1
+            self.invalidations += removed
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def snapshot(self) -> List[tuple]:
+        # (key, value, expires, tags) for live entries, least recently used first
+        now = time.time()
+        with self._lock:
+            return [(k, v, exp, tags) for k, (v, exp, tags) in self._data.items() if not self.ttl or exp >= now]
+
+    def restore(self, entries: Iterable[tuple]) -> None:
+        now = time.time()
+        for key, value, expires, tags in entries:
+            if not self.ttl or expires >= now:
+                self.put(key, value, tags=tags, expires=expires)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
@@ -1,36 +1,240 @@
-from typing import List, Dict, Any
+import warnings
+from typing import List, Dict, Any, Optional
 import pandas as pd
 import numpy as np
 
 
-def _clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    # Normalize headers
+# Non-null values per text column used to guess its type before converting it whole
+INFER_SAMPLE_ROWS = 1000
+
+
+def _normalize_headers(df: pd.DataFrame) -> None:
     df.columns = [str(c).strip().lower().replace(' ', '_') for c in df.columns]
-    # Type inference
+
+
+def _infer_column(values: pd.Series) -> pd.Series:
+    # Numeric, then datetime, decided on a sample; the column is converted only if
+    # every non-null value parses, otherwise it is returned unchanged
+    sample = values.iloc[:INFER_SAMPLE_ROWS * 10].dropna().iloc[:INFER_SAMPLE_ROWS]
+    if sample.empty:
+        sample = values.dropna().iloc[:INFER_SAMPLE_ROWS]
+        if sample.empty:
+            return values
+    nulls = int(values.isna().sum())
+    if pd.to_numeric(sample, errors='coerce').notna().all():
+        converted = pd.to_numeric(values, errors='coerce')
+        if int(converted.isna().sum()) == nulls:
+            return converted
+        return values
+    with warnings.catch_warnings():
+        # Format inference falls back to per-value parsing with a warning
+        warnings.simplefilter('ignore')
+        if pd.to_datetime(sample, errors='coerce').notna().all():
+            fmt = None
+        elif pd.to_datetime(sample, errors='coerce', format='mixed').notna().all():
+            fmt = 'mixed'
+        else:
+            return values
+        # Dates repeat a lot, so each distinct value is parsed once and mapped back
+        codes, uniques = pd.factorize(values)
+        parsed = pd.DatetimeIndex(pd.to_datetime(pd.Series(uniques, dtype=object), errors='coerce', format=fmt))
+    if parsed.isna().any():
+        return values
+    return pd.Series(parsed.take(codes, allow_fill=True, fill_value=pd.NaT), index=values.index, name=values.name)
+
+
+def _infer_types(df: pd.DataFrame) -> None:
     for col in df.columns:
-        if df[col].dtype == object:
-            df[col] = pd.to_datetime(df[col], errors='ignore')
-            if not np.issubdtype(df[col].dtype, np.datetime64):
-                df[col] = pd.to_numeric(df[col], errors='ignore')
-    # Missing values
+        if not (pd.api.types.is_numeric_dtype(df[col]) or pd.api.types.is_datetime64_any_dtype(df[col])
+                or pd.api.types.is_bool_dtype(df[col])):
+            df[col] = _infer_column(df[col])
+
+
+def _numeric_columns(df: pd.DataFrame) -> List[str]:
+    return [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])]
+
+
+def _fill_missing(df: pd.DataFrame, numeric: List[str], median: pd.Series) -> None:
     for col in df.columns:
-        if np.issubdtype(df[col].dtype, np.number):
-            df[col] = df[col].fillna(df[col].median())
-        elif np.issubdtype(df[col].dtype, np.datetime64):
-            df[col] = df[col].fillna(method='ffill').fillna(method='bfill')
+        if not df[col].hasnans:
+            continue
+        if col in numeric:
+            df[col] = df[col].fillna(median[col])
+        elif pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].ffill().bfill()
         else:
             df[col] = df[col].fillna('')
-    # Duplicates
-    df = df.drop_duplicates().reset_index(drop=True)
-    # Outliers (clip 1st-99th percentile)
-    for col in df.columns:
-        if np.issubdtype(df[col].dtype, np.number):
-            low, high = df[col].quantile(0.01), df[col].quantile(0.99)
-            df[col] = df[col].clip(lower=low, upper=high)
+
+
+def _row_hashes(df: pd.DataFrame, stable: bool = False) -> np.ndarray:
+    # One 64-bit hash per row. By default text columns are hashed through their
+    # factorized codes, which is much cheaper than hashing every string but only
+    # comparable within this frame; stable=True hashes values so rows of different
+    # batches can be compared.
+    keys = {}
+    for i, col in enumerate(df.columns):
+        values = df[col]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            keys[i] = values.to_numpy(dtype='datetime64[ns]')
+        elif pd.api.types.is_bool_dtype(values):
+            keys[i] = values.to_numpy()
+        elif pd.api.types.is_numeric_dtype(values):
+            # ints and floats of equal value hash alike across batches
+            keys[i] = values.to_numpy(dtype='float64', na_value=np.nan) if stable else values.to_numpy()
+        else:
+            keys[i] = values if stable else pd.factorize(values)[0]
+    return pd.util.hash_pandas_object(pd.DataFrame(keys, index=df.index), index=False).to_numpy()
+
+
+def _clean_dataframe_fast(df: pd.DataFrame) -> pd.DataFrame:
+    # Header normalization, type inference, missing values, duplicates and
+    # outlier clipping with a bounded number of passes over the data:
+    # types guessed on a sample, one quantile call for every numeric column,
+    # duplicates found through a 64-bit hash per row, and no full copy of the frame.
+    _normalize_headers(df)
+    _infer_types(df)
+    numeric = _numeric_columns(df)
+    median = None
+    if numeric:
+        # 1st percentile, median and 99th percentile of all numeric columns at once
+        low, median, high = (row for _, row in df[numeric].quantile([0.01, 0.5, 0.99]).iterrows())
+    _fill_missing(df, numeric, median)
+    duplicated = pd.Series(_row_hashes(df)).duplicated().to_numpy()
+    if duplicated.any():
+        df = df.loc[~duplicated]
+    df = df.reset_index(drop=True)
+    if numeric:
+        df[numeric] = df[numeric].clip(lower=low, upper=high, axis=1)
     return df
 
 
+class _RowHashSet:
+    # Set of 64-bit row hashes in one open-addressing uint64 table (0 marks an
+    # empty slot, linear probing), updated in place with vectorized probe rounds.
+    # Doubles at half load up to room for max_rows hashes; once full, hashes are
+    # still looked up but no longer added.
+    def __init__(self, max_rows: int, capacity: int = 1 << 16) -> None:
+        self.max_rows = max_rows
+        self.size = 0
+        self._table = np.zeros(capacity, dtype='uint64')
+
+    @property
+    def full(self) -> bool:
+        return self.size >= self.max_rows
+
+    def add(self, hashes: np.ndarray) -> np.ndarray:
+        # Adds distinct hashes; returns the mask of those already in the set
+        keys = np.where(hashes == 0, np.uint64(1), hashes).astype('uint64')
+        seen = self._probe(keys, insert=False)
+        new = keys[~seen][:max(0, self.max_rows - self.size)]
+        if len(new):
+            capacity = len(self._table)
+            while 2 * (self.size + len(new)) > capacity:
+                capacity *= 2
+            if capacity != len(self._table):
+                old = self._table[self._table != 0]
+                self._table = np.zeros(capacity, dtype='uint64')
+                self._probe(old, insert=True)
+            self._probe(new, insert=True)
+            self.size += len(new)
+        return seen
+
+    def _probe(self, keys: np.ndarray, insert: bool) -> np.ndarray:
+        # Each round moves every unresolved key one slot on; keys are resolved by
+        # finding themselves, an empty slot (absent), or winning one (inserted)
+        table = self._table
+        mask = np.uint64(len(table) - 1)
+        slots = (keys & mask).astype('int64')
+        found = np.zeros(len(keys), dtype=bool)
+        todo = np.arange(len(keys))
+        while len(todo):
+            at, key = slots[todo], keys[todo]
+            current = table[at]
+            hit = current == key
+            empty = current == 0
+            found[todo[hit]] = True
+            if insert:
+                table[at[empty]] = key[empty]
+                # Of several keys reaching the same empty slot one wins; the rest probe on
+                done = table[at] == key
+            else:
+                done = hit | empty
+            todo = todo[~done]
+            slots[todo] = (slots[todo] + 1) & (len(table) - 1)
+        return found
+
+
+class StreamingTableCleaner:
+    # Cleans a table read in batches (CSV chunks) the way _clean_dataframe_fast
+    # cleans a whole frame, in memory bounded by the batch size. A first pass over
+    # the batches (observe) counts rows and keeps a uniform sample of at most
+    # sample_rows values per numeric column for the percentiles; the second pass
+    # (clean) fills, drops rows already seen in this or any earlier batch (an
+    # 8-byte hash per distinct row, in a table sized for at most dedup_rows rows)
+    # and clips.
+    def __init__(self, sample_rows: int = 200000, seed: int = 0, dedup_rows: int = 8000000) -> None:
+        self.rows = 0
+        self.sample_rows = sample_rows
+        self._rng = np.random.default_rng(seed)
+        # column -> (random keys, values); the values with the smallest keys form the sample
+        self._samples: Dict[str, Any] = {}
+        self._stats: Optional[pd.DataFrame] = None
+        self._seen = _RowHashSet(dedup_rows)
+        # Last datetime per column, carried into the next batch's forward fill
+        self._last: Dict[str, Any] = {}
+
+    def observe(self, batch: pd.DataFrame) -> None:
+        _normalize_headers(batch)
+        _infer_types(batch)
+        self.rows += len(batch)
+        for col in _numeric_columns(batch):
+            values = batch[col].to_numpy(dtype='float64', na_value=np.nan)
+            values = values[~np.isnan(values)]
+            keys = self._rng.random(len(values))
+            if col in self._samples:
+                old_keys, old_values = self._samples[col]
+                keys, values = np.concatenate([old_keys, keys]), np.concatenate([old_values, values])
+            if len(values) > self.sample_rows:
+                keep = np.argpartition(keys, self.sample_rows - 1)[:self.sample_rows]
+                keys, values = keys[keep], values[keep]
+            self._samples[col] = (keys, values)
+
+    def _percentiles(self) -> pd.DataFrame:
+        if self._stats is None:
+            self._stats = pd.DataFrame({col: np.quantile(values, [0.01, 0.5, 0.99]) if len(values) else [np.nan] * 3
+                                        for col, (_, values) in self._samples.items()},
+                                       index=[0.01, 0.5, 0.99])
+            self._samples = {}
+        return self._stats
+
+    def clean(self, batch: pd.DataFrame) -> pd.DataFrame:
+        stats = self._percentiles()
+        _normalize_headers(batch)
+        _infer_types(batch)
+        numeric = [c for c in _numeric_columns(batch) if c in stats.columns]
+        for col in batch.columns:
+            if pd.api.types.is_datetime64_any_dtype(batch[col]) and batch[col].hasnans and col in self._last:
+                batch[col] = batch[col].ffill().fillna(self._last[col])
+        _fill_missing(batch, numeric, stats.loc[0.5])
+        for col in batch.columns:
+            if pd.api.types.is_datetime64_any_dtype(batch[col]) and len(batch) and pd.notna(batch[col].iloc[-1]):
+                self._last[col] = batch[col].iloc[-1]
+        hashes = _row_hashes(batch, stable=True)
+        duplicated = pd.Series(hashes).duplicated().to_numpy(copy=True)
+        duplicated[~duplicated] = self._seen.add(hashes[~duplicated])
+        if duplicated.any():
+            batch = batch.loc[~duplicated]
+        batch = batch.reset_index(drop=True)
+        if numeric:
+            batch[numeric] = batch[numeric].clip(lower=stats.loc[0.01, numeric], upper=stats.loc[0.99, numeric], axis=1)
+        return batch
+
+    @property
+    def dedup_full(self) -> bool:
+        # Rows past dedup_rows distinct ones are no longer checked against later batches
+        return self._seen.full
+
+
 def _clean_text(text: str) -> str:
     # Normalize whitespace and multi-line artifacts
     if not isinstance(text, str):
@@ -45,7 +249,7 @@ def clean_records(records: List[Dict[str, Any]], logger) -> List[Dict[str, Any]]
     for rec in records:
         rtype = rec.get('type')
         if rtype == 'tabular' and 'dataframe' in rec:
-            df = _clean_dataframe(rec['dataframe'])
+            df = _clean_dataframe_fast(rec['dataframe'])
             cleaned.append({**rec, 'dataframe': df})
         elif rtype in {'text', 'code'} and 'text' in rec:
             cleaned.append({**rec, 'text': _clean_text(rec['text'])})
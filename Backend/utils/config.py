@@ -14,9 +14,97 @@ class AppConfig:
         self.embedding_model_name = os.environ.get('EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
         self.cross_encoder_name = os.environ.get('CROSS_ENCODER', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
         self.generation_model_name = os.environ.get('GEN_MODEL', 'google/flan-t5-base')
+        # Inference backend per model: torch (fp32), int8 (dynamic quantization) or onnx
+        self.embed_backend = os.environ.get('EMBED_BACKEND', 'torch').lower()
+        self.rerank_backend = os.environ.get('RERANK_BACKEND', 'torch').lower()
+        self.gen_backend = os.environ.get('GEN_BACKEND', 'torch').lower()
+
+        # Rows in the memory-mapped per-chunk embedding cache (LRU beyond this)
+        self.emb_cache_rows = int(os.environ.get('EMB_CACHE_ROWS', 100000))
+
+        # In-process caches for query vectors and cross-encoder scores
+        self.query_cache_size = int(os.environ.get('QUERY_CACHE_SIZE', 1024))
+        self.query_cache_ttl = float(os.environ.get('QUERY_CACHE_TTL', 3600))
+        self.rerank_cache_size = int(os.environ.get('RERANK_CACHE_SIZE', 20000))
+        self.rerank_cache_ttl = float(os.environ.get('RERANK_CACHE_TTL', 3600))
+
+        # Hybrid fusion: 'rrf' (1 / (k + rank)) or 'weighted' (min-max normalised scores)
+        self.fusion_method = os.environ.get('FUSION', 'rrf').lower()
+        self.rrf_k = int(os.environ.get('RRF_K', 60))
+        self.semantic_weight = float(os.environ.get('SEMANTIC_WEIGHT', 0.5))
+
+        # Generated answers; ANSWER_CACHE_PATH set to a file keeps them across restarts
+        self.answer_cache_size = int(os.environ.get('ANSWER_CACHE_SIZE', 512))
+        self.answer_cache_ttl = float(os.environ.get('ANSWER_CACHE_TTL', 86400))
+        self.answer_cache_path = os.environ.get('ANSWER_CACHE_PATH', '')
+
+        # Models are loaded on first use; WARMUP lists those to load in background
+        # threads at startup (embedding, reranker, generator, or 'all')
+        warmup = os.environ.get('WARMUP', '').lower()
+        self.warmup = ['embedding', 'reranker', 'generator'] if warmup == 'all' else \
+            [m.strip() for m in warmup.split(',') if m.strip()]
+
+        # Cross-encoder budget: candidates scored, words per (query, passage) pair,
+        # predict batch size and a deadline after which the fused order is kept
+        self.rerank_max_candidates = int(os.environ.get('RERANK_MAX_CANDIDATES', 20))
+        self.rerank_max_words = int(os.environ.get('RERANK_MAX_WORDS', 256))
+        self.rerank_batch_size = int(os.environ.get('RERANK_BATCH_SIZE', 16))
+        self.rerank_deadline_ms = int(os.environ.get('RERANK_DEADLINE_MS', 1500))
+
+        # Generation micro-batching: prompts arriving within GEN_MAX_WAIT_MS share one
+        # generate call of up to GEN_MAX_BATCH; beyond GEN_QUEUE_SIZE pending, 429
+        self.gen_max_batch = int(os.environ.get('GEN_MAX_BATCH', 8))
+        self.gen_max_wait_ms = int(os.environ.get('GEN_MAX_WAIT_MS', 20))
+        self.gen_queue_size = int(os.environ.get('GEN_QUEUE_SIZE', 64))
+
+        # Seconds /query/stream waits for the next generated token before giving up
+        self.stream_timeout = float(os.environ.get('STREAM_TIMEOUT', 120))
+
+        # Most rows a tabular query (filtered/sorted rows, groups) returns
+        self.tabular_max_rows = int(os.environ.get('TABULAR_MAX_ROWS', 100))
 
         self.faiss_dim = int(os.environ.get('FAISS_DIM', 384))
         self.max_context_chars = int(os.environ.get('MAX_CONTEXT_CHARS', 8000))
+        # Generator input cap in tokens; 0 uses the tokenizer's model_max_length
+        self.max_input_tokens = int(os.environ.get('MAX_INPUT_TOKENS', 0))
+        # Multi-process serving: standalone (one process does everything), writer
+        # (owns ingestion and compaction), reader (memory-mapped, read-only index) or
+        # auto (the first process to take vectorstore/writer.lock writes, the rest read)
+        self.index_role = os.environ.get('INDEX_ROLE', 'standalone').lower()
+        # Seconds between reader checks of the manifest generation
+        self.reload_interval = float(os.environ.get('RELOAD_INTERVAL', 1.0))
+        # Number of appended segments that triggers a background compaction
+        self.compact_segments = int(os.environ.get('COMPACT_SEGMENTS', 16))
+
+        # Vector index: flat (exact), hnsw, ivf_flat or ivf_pq
+        self.faiss_index_type = os.environ.get('FAISS_INDEX', 'flat').lower()
+        self.ann_train_threshold = int(os.environ.get('ANN_TRAIN_THRESHOLD', 50000))
+        self.ivf_nlist = int(os.environ.get('IVF_NLIST', 0))
+        self.nprobe = int(os.environ.get('IVF_NPROBE', 16))
+        self.pq_m = int(os.environ.get('PQ_M', 48))
+        self.hnsw_m = int(os.environ.get('HNSW_M', 32))
+        self.hnsw_ef_construction = int(os.environ.get('HNSW_EF_CONSTRUCTION', 80))
+        self.ef_search = int(os.environ.get('HNSW_EF_SEARCH', 64))
+
+        # Background ingestion
+        self.ingest_workers = int(os.environ.get('INGEST_WORKERS', 2))
+        self.max_jobs = int(os.environ.get('MAX_JOBS', 1000))
+        self.embed_batch_size = int(os.environ.get('EMBED_BATCH_SIZE', 256))
+        # CSVs of at least CSV_STREAM_BYTES are read, cleaned and indexed CSV_CHUNK_ROWS
+        # rows at a time instead of whole (0 disables streaming)
+        self.csv_stream_bytes = int(os.environ.get('CSV_STREAM_BYTES', 50 * 1024 * 1024))
+        self.csv_chunk_rows = int(os.environ.get('CSV_CHUNK_ROWS', 50000))
+        # Distinct rows remembered for dropping duplicates across batches (16-32 bytes each)
+        self.csv_dedup_rows = int(os.environ.get('CSV_DEDUP_ROWS', 8000000))
+        # PDF pages are extracted by up to PARSE_WORKERS processes, PARSE_PAGES_PER_TASK
+        # pages per task (1 extracts in the ingesting thread)
+        self.parse_workers = int(os.environ.get('PARSE_WORKERS', min(4, os.cpu_count() or 1)))
+        self.parse_pages_per_task = int(os.environ.get('PARSE_PAGES_PER_TASK', 16))
+        # Seconds one task may take before the upload fails (0 waits indefinitely)
+        self.parse_task_timeout = float(os.environ.get('PARSE_TASK_TIMEOUT', 300))
+        # Chunks of a document being parsed are indexed once EMBED_BATCH_SIZE are
+        # pending or INDEX_FLUSH_SECONDS after the last indexed batch
+        self.index_flush_seconds = float(os.environ.get('INDEX_FLUSH_SECONDS', 2))
 
         self.allowed_extensions = set(
             (os.environ.get('ALLOWED_EXT', 'csv,xlsx,json,txt,pdf,docx,py,js,ts,java,cpp,md')).split(',')
@@ -0,0 +1,91 @@
+import re
+from typing import Any, Dict, List, Tuple
+
+from utils.bm25 import tokenize
+
+
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+|\n+')
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_RE.split(text) if s and s.strip()]
+
+
+class ContextPacker:
+    # Fits retrieved chunks into the generator's input window. Chunks are taken
+    # in rank order; a chunk that does not fit whole contributes its sentences
+    # with the most query-term hits. Sentences already packed are skipped.
+    # Tabular chunks are CSV text: their lines are the units, kept on separate
+    # lines, and the header row is always kept (it repeats in every chunk).
+    def __init__(self, config, logger, llm_service) -> None:
+        self.config = config
+        self.logger = logger
+        self.llm = llm_service
+
+    def pack(self, question: str, results: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+        limit = self.llm.max_input_tokens()
+        if self.config.max_input_tokens > 0:
+            limit = min(limit, self.config.max_input_tokens)
+        # Template and question are spent before any context is added
+        overhead = self.llm.prompt_tokens(question)
+        budget = max(0, limit - overhead)
+        max_chars = self.config.max_context_chars
+        terms = set(tokenize(question))
+        seen = set()
+        blocks: List[str] = []
+        used_tokens = 0
+        used_chars = 0
+        usage = {'budget_tokens': budget, 'chunks_full': 0, 'chunks_partial': 0, 'chunks_dropped': 0,
+                 'duplicate_sentences': 0}
+        for r in results:
+            header = f"[{r.get('filename')} | {r.get('chunk_type')}]"
+            tabular = r.get('chunk_type') == 'tabular'
+            sentences = []
+            text = r.get('text') or ''
+            units = [line.strip() for line in text.split('\n') if line.strip()] if tabular else split_sentences(text)
+            for n, sent in enumerate(units):
+                if tabular and n == 0:
+                    sentences.append(sent)
+                    continue
+                key = ' '.join(sent.lower().split())
+                if key in seen:
+                    usage['duplicate_sentences'] += 1
+                    continue
+                seen.add(key)
+                sentences.append(sent)
+            if not sentences or (tabular and len(sentences) == 1):
+                usage['chunks_dropped'] += 1
+                continue
+            # Separator plus header, then one count per sentence in a single tokenizer call
+            counts = self.llm.count_tokens([f'\n\n{header}\n'] + sentences)
+            room_tokens = budget - used_tokens - counts[0]
+            room_chars = max_chars - used_chars - len(header) - 3
+            sent_tokens = counts[1:]
+            if sum(sent_tokens) <= room_tokens and sum(len(s) + 1 for s in sentences) <= room_chars:
+                chosen = list(range(len(sentences)))
+                usage['chunks_full'] += 1
+            else:
+                # Greedy: a table's header row, then highest query overlap first (CSV
+                # cells as words), earlier sentences break ties
+                overlap = [len(terms & set(tokenize(sent.replace(',', ' ') if tabular else sent))) for sent in sentences]
+                order = sorted(range(len(sentences)), key=lambda i: (not (tabular and i == 0), -overlap[i], i))
+                chosen = []
+                for i in order:
+                    if sent_tokens[i] <= room_tokens and len(sentences[i]) + 1 <= room_chars:
+                        chosen.append(i)
+                        room_tokens -= sent_tokens[i]
+                        room_chars -= len(sentences[i]) + 1
+                if not chosen or (tabular and (chosen[0] != 0 or len(chosen) == 1)):
+                    usage['chunks_dropped'] += 1
+                    continue
+                chosen.sort()
+                usage['chunks_partial'] += 1
+            body = ('\n' if tabular else ' ').join(sentences[i] for i in chosen)
+            blocks.append(f"{header}\n{body}")
+            used_tokens += counts[0] + sum(sent_tokens[i] for i in chosen)
+            used_chars += len(blocks[-1]) + 2
+        context = '\n\n'.join(blocks)
+        usage['context_tokens'] = used_tokens
+        usage['context_chars'] = len(context)
+        usage['prompt_tokens'] = overhead + used_tokens
+        return context, usage
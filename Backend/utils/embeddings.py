@@ -1,34 +1,163 @@
 import os
-import json
-from typing import List
+import glob
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+from utils.cache import TTLCache, normalize_query
+from utils.lazy import LazyModel
+from utils.backends import load_sentence_transformer
+
+
+class ChunkEmbeddingCache:
+    # Per-chunk vectors keyed by sha1(model name + chunk text), stored in a
+    # fixed-capacity memory-mapped file. Slots are recycled least-recently-used
+    # first, so the cache never grows past `capacity` rows.
+    def __init__(self, cache_dir: str, model_name: str, capacity: int, logger) -> None:
+        self.logger = logger
+        self.capacity = capacity
+        self.model_name = model_name
+        slug = hashlib.sha1(model_name.encode('utf-8')).hexdigest()[:12]
+        self._prefix = os.path.join(cache_dir, f'chunks-{slug}')
+        self._vectors = None
+        self._keys = None
+        # key -> slot, oldest first
+        self._slots: 'OrderedDict[bytes, int]' = OrderedDict()
+        self._free: List[int] = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Reopen a cache left by a previous run; the dim is part of the file name
+        existing = sorted(glob.glob(f'{self._prefix}-*.f32'), key=os.path.getmtime)
+        if existing:
+            try:
+                self._open(int(existing[-1][len(self._prefix) + 1:-len('.f32')]))
+            except Exception:
+                self.logger.warning('Failed to open embedding cache, starting empty')
+                self._vectors = None
+
+    def key(self, text: str) -> bytes:
+        return hashlib.sha1(f'{self.model_name}\0{text}'.encode('utf-8')).hexdigest().encode('ascii')
+
+    def _open(self, dim: int) -> None:
+        vec_path = f'{self._prefix}-{dim}.f32'
+        key_path = f'{self._prefix}-{dim}.keys'
+        expected = (self.capacity * dim * 4, self.capacity * 40)
+        reuse = os.path.exists(vec_path) and os.path.exists(key_path) and \
+            (os.path.getsize(vec_path), os.path.getsize(key_path)) == expected
+        mode = 'r+' if reuse else 'w+'
+        self._vectors = np.memmap(vec_path, dtype='float32', mode=mode, shape=(self.capacity, dim))
+        self._keys = np.memmap(key_path, dtype='S40', mode=mode, shape=(self.capacity,))
+        used = np.nonzero(self._keys != b'')[0]
+        self._slots = OrderedDict((bytes(self._keys[i]), int(i)) for i in used)
+        self._free = sorted(set(range(self.capacity)) - set(self._slots.values()), reverse=True)
+        if reuse:
+            self.logger.info('Opened embedding cache with %d cached chunks', len(self._slots))
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        with self._lock:
+            if self._vectors is None:
+                self.misses += len(keys)
+                return [None] * len(keys)
+            out: List[Optional[np.ndarray]] = []
+            for k in keys:
+                slot = self._slots.get(k)
+                if slot is None:
+                    self.misses += 1
+                    out.append(None)
+                else:
+                    self.hits += 1
+                    self._slots.move_to_end(k)
+                    out.append(np.array(self._vectors[slot]))
+            return out
+
+    def put_many(self, keys: List[bytes], vectors: np.ndarray) -> None:
+        with self._lock:
+            if self._vectors is None:
+                self._open(vectors.shape[1])
+            if vectors.shape[1] != self._vectors.shape[1]:
+                return
+            for k, vec in zip(keys, vectors):
+                if k in self._slots:
+                    self._slots.move_to_end(k)
+                    continue
+                if self._free:
+                    slot = self._free.pop()
+                else:
+                    _, slot = self._slots.popitem(last=False)
+                    self.evictions += 1
+                # Clear the key before overwriting the vector so a crash never
+                # pairs a key with another chunk's vector
+                self._keys[slot] = b''
+                self._vectors[slot] = vec
+                self._keys[slot] = k
+                self._slots[k] = slot
+            self._vectors.flush()
+            self._keys.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._slots), 'capacity': self.capacity,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
 
 
 class EmbeddingService:
     def __init__(self, config, logger) -> None:
         self.config = config
         self.logger = logger
-        self.model = SentenceTransformer(config.embedding_model_name)
+        self.model_loader = LazyModel(
+            'embedding', lambda: load_sentence_transformer(config.embedding_model_name, config.embed_backend), logger)
         self.cache_dir = os.path.join(config.vector_dir, 'emb_cache')
         os.makedirs(self.cache_dir, exist_ok=True)
+        # Quantized/ONNX vectors differ slightly from fp32 ones, so each backend gets its own cache
+        cache_model = config.embedding_model_name if config.embed_backend == 'torch' else \
+            f'{config.embedding_model_name}:{config.embed_backend}'
+        self.cache = ChunkEmbeddingCache(self.cache_dir, cache_model, config.emb_cache_rows, logger)
+        self.query_cache = TTLCache(config.query_cache_size, config.query_cache_ttl)
+
+    @property
+    def model(self):
+        return self.model_loader.get()
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return self.embed_queries([query])[0]
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        keys = [normalize_query(q) for q in queries]
+        vectors = [self.query_cache.get(k) for k in keys]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            # One batched encode call for every uncached query
+            encoded = np.asarray(self._encode([queries[i] for i in missing]), dtype='float32')
+            for i, vec in zip(missing, encoded):
+                vectors[i] = vec
+                self.query_cache.put(keys[i], vec)
+        return np.vstack(vectors)
 
-    def _cache_path(self, key: str) -> str:
-        return os.path.join(self.cache_dir, f'{key}.npy')
-
-    def embed(self, texts: List[str], cache_key: str = None) -> np.ndarray:
-        if cache_key:
-            path = self._cache_path(cache_key)
-            if os.path.exists(path):
-                try:
-                    return np.load(path)
-                except Exception:
-                    pass
-        vectors = self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
-        if cache_key:
+    def embed(self, texts: List[str], use_cache: bool = True) -> np.ndarray:
+        if not use_cache or not texts:
+            return self._encode(texts)
+        keys = [self.cache.key(t) for t in texts]
+        found = self.cache.get_many(keys)
+        missing = [i for i, v in enumerate(found) if v is None]
+        if missing:
+            # Encode each distinct unseen text once
+            pending = OrderedDict()
+            for i in missing:
+                pending.setdefault(keys[i], texts[i])
+            vectors = np.asarray(self._encode(list(pending.values())), dtype='float32')
             try:
-                np.save(self._cache_path(cache_key), vectors)
+                self.cache.put_many(list(pending.keys()), vectors)
             except Exception:
-                self.logger.warning('Failed to save embedding cache for %s', cache_key)
-        return vectors
+                self.logger.warning('Failed to save %d chunk embeddings to cache', len(pending))
+            by_key = dict(zip(pending.keys(), vectors))
+            for i in missing:
+                found[i] = by_key[keys[i]]
+        return np.vstack(found)
@@ -1,6 +1,8 @@
+import os
 import hashlib
 import mimetypes
-from typing import Optional
+import tempfile
+from typing import Optional, Tuple
 
 from utils.config import AppConfig
 
@@ -15,6 +17,14 @@ def compute_file_hash(data: bytes) -> str:
     return hashlib.sha256(data).hexdigest()
 
 
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
 def detect_file_type(filename: str, data: Optional[bytes] = None) -> str:
     ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
     if ext in {'csv', 'xlsx'}:
@@ -36,3 +46,39 @@ def detect_file_type(filename: str, data: Optional[bytes] = None) -> str:
 def load_bytes(path: str) -> bytes:
     with open(path, 'rb') as f:
         return f.read()
+
+
+def save_stream(stream, directory: str, chunk_size: int = 1 << 20) -> Tuple[str, str]:
+    # Hash while writing so the upload never has to be read back just to fingerprint it;
+    # the temp name is unique, so concurrent uploads never share a spool file
+    digest = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                block = stream.read(chunk_size)
+                if not block:
+                    break
+                digest.update(block)
+                f.write(block)
+    except BaseException:
+        discard_stream(tmp)
+        raise
+    return tmp, digest.hexdigest()
+
+
+def commit_stream(tmp: str, dest: str) -> bool:
+    # dest is keyed by the content hash, so an existing file already holds these bytes
+    if os.path.exists(dest):
+        discard_stream(tmp)
+        return False
+    os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+    os.replace(tmp, dest)
+    return True
+
+
+def discard_stream(tmp: str) -> None:
+    try:
+        os.remove(tmp)
+    except OSError:
+        pass
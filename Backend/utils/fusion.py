@@ -0,0 +1,78 @@
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+
+FUSION_METHODS = ('rrf', 'weighted')
+
+
+def _collect(result_lists: List[List[Dict[str, Any]]]):
+    # Map every distinct result (by vector id) to a slot and return, per list,
+    # the slot of each entry so scores can be accumulated with NumPy.
+    best: Dict[Any, Dict[str, Any]] = {}
+    order: List[Any] = []
+    slots_per_list: List[np.ndarray] = []
+    index_of: Dict[Any, int] = {}
+    for results in result_lists:
+        slots = []
+        for r in results:
+            rid = r.get('vector_id')
+            if rid not in index_of:
+                index_of[rid] = len(order)
+                order.append(rid)
+                best[rid] = r
+            elif r.get('score', float('-inf')) > best[rid].get('score', float('-inf')):
+                # Keep the strongest hit, e.g. the best inner product across query variants
+                best[rid] = r
+            slots.append(index_of[rid])
+        slots_per_list.append(np.asarray(slots, dtype='int64'))
+    return best, order, slots_per_list
+
+
+def _ranked(best, order, fused: np.ndarray) -> List[Dict[str, Any]]:
+    ranking = np.argsort(-fused, kind='stable')
+    return [{**best[order[i]], 'fused_score': float(fused[i])} for i in ranking]
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], k: int = 60,
+                           weights: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+    # RRF: score(d) = sum over lists of w / (k + rank), ranks starting at 1
+    if len(result_lists) == 1 and weights is None:
+        return list(result_lists[0])
+    best, order, slots_per_list = _collect(result_lists)
+    if not order:
+        return []
+    weights = weights or [1.0] * len(result_lists)
+    fused = np.zeros(len(order), dtype='float64')
+    for w, slots in zip(weights, slots_per_list):
+        if len(slots):
+            np.add.at(fused, slots, w / (k + np.arange(1, len(slots) + 1, dtype='float64')))
+    return _ranked(best, order, fused)
+
+
+def weighted_fusion(result_lists: List[List[Dict[str, Any]]],
+                    weights: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+    # Min-max normalise each list's raw scores to [0, 1], then take the weighted sum;
+    # a result missing from a list contributes 0 for that list
+    best, order, slots_per_list = _collect(result_lists)
+    if not order:
+        return []
+    weights = weights or [1.0] * len(result_lists)
+    fused = np.zeros(len(order), dtype='float64')
+    for w, results, slots in zip(weights, result_lists, slots_per_list):
+        if not len(slots):
+            continue
+        raw = np.asarray([r.get('score', 0.0) for r in results], dtype='float64')
+        span = raw.max() - raw.min()
+        norm = (raw - raw.min()) / span if span > 0 else np.ones_like(raw)
+        np.add.at(fused, slots, w * norm)
+    return _ranked(best, order, fused)
+
+
+def fuse(result_lists: List[List[Dict[str, Any]]], method: str = 'rrf',
+         weights: Optional[List[float]] = None, k: int = 60) -> List[Dict[str, Any]]:
+    if method == 'weighted':
+        return weighted_fusion(result_lists, weights=weights)
+    if method == 'rrf':
+        return reciprocal_rank_fusion(result_lists, k=k, weights=weights)
+    raise ValueError(f"Unknown fusion method '{method}', expected one of {', '.join(FUSION_METHODS)}")
@@ -0,0 +1,366 @@
+import os
+import re
+import glob
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable, Iterator, Tuple
+
+from utils.file_utils import compute_file_hash, hash_file, detect_file_type, load_bytes
+from utils.parsers import parse_file_to_records, iter_csv_batches, iter_document_pages
+from utils.cleaning import clean_records, StreamingTableCleaner
+from utils.chunking import chunk_records
+from utils.segments import _atomic_write
+
+
+# Share of the overall progress reached when each stage starts
+STAGES = {
+    'queued': 0.0,
+    'hashing': 0.05,
+    'parsing': 0.1,
+    'cleaning': 0.3,
+    'chunking': 0.35,
+    'indexing': 0.4,
+    'done': 1.0,
+}
+
+
+def ingest_file(path: str, filename: str, vector_store, logger, file_hash: str = None,
+                on_progress: Optional[Callable[[str, float], None]] = None) -> Dict[str, Any]:
+    def report(stage: str, within: float = 0.0) -> None:
+        if on_progress:
+            start = STAGES[stage]
+            nxt = min([v for v in STAGES.values() if v > start], default=1.0)
+            on_progress(stage, start + (nxt - start) * within)
+
+    report('hashing')
+    config = vector_store.config
+    file_type = detect_file_type(filename)
+    # Large CSVs and all PDF/DOCX files are read from disk a batch or page at a time
+    if file_type == 'tabular' and filename.lower().endswith('.csv') and config.csv_stream_bytes > 0 and \
+            os.path.getsize(path) >= config.csv_stream_bytes:
+        stream = 'csv'
+    elif file_type == 'document' and filename.lower().endswith(('.pdf', '.docx')):
+        stream = 'pages'
+    else:
+        stream = None
+    if stream:
+        if file_hash is None:
+            file_hash = hash_file(path)
+    else:
+        file_bytes = load_bytes(path)
+        if file_hash is None:
+            file_hash = compute_file_hash(file_bytes)
+        file_type = detect_file_type(filename, file_bytes)
+
+    existing = vector_store.chunk_count(file_hash)
+    if existing:
+        report('done')
+        return {
+            "filename": filename,
+            "file_hash": file_hash,
+            "file_type": file_type,
+            "num_chunks": existing,
+            "duplicate": True
+        }
+
+    if stream == 'csv':
+        num_chunks = _ingest_csv_stream(path, filename, file_hash, vector_store, logger, report)
+    elif stream == 'pages':
+        report('parsing')
+        num_chunks = _index_batches(_page_batches(path, filename, config, logger), filename, file_hash,
+                                    file_type, vector_store, report)
+    else:
+        report('parsing')
+        records = parse_file_to_records(filename, file_bytes, file_type, logger)
+        report('cleaning')
+        cleaned_records = clean_records(records, logger)
+        report('chunking')
+        chunks = chunk_records(cleaned_records, file_type, logger)
+
+        report('indexing')
+        vector_store.index_chunks(chunks, file_hash=file_hash, filename=filename, file_type=file_type,
+                                  progress=lambda frac: report('indexing', frac))
+        num_chunks = len(chunks)
+    report('done')
+    return {
+        "filename": filename,
+        "file_hash": file_hash,
+        "file_type": file_type,
+        "num_chunks": num_chunks,
+        "duplicate": False
+    }
+
+
+# Chunk batches paired with the share of the file done once they are indexed (None if unknown)
+ChunkBatches = Iterator[Tuple[List[Dict[str, Any]], Optional[float]]]
+
+
+def _index_batches(batches: ChunkBatches, filename: str, file_hash: str, file_type: str, vector_store,
+                   report) -> int:
+    # Each batch becomes searchable as soon as it is indexed, while the rest of
+    # the file is still being read. Chunk ids are numbered across the whole file.
+    num_chunks = 0
+    try:
+        for chunks, done in batches:
+            if chunks:
+                for i, ch in enumerate(chunks, num_chunks):
+                    ch['metadata']['chunk_id'] = i
+                vector_store.index_chunks(chunks, file_hash=file_hash, filename=filename, file_type=file_type,
+                                          append=True)
+                num_chunks += len(chunks)
+            report('indexing', done or 0.0)
+    except Exception:
+        # Never leave part of a file searchable
+        vector_store.remove_file(file_hash=file_hash)
+        raise
+    return num_chunks
+
+
+def _page_batches(path: str, filename: str, config, logger) -> ChunkBatches:
+    # Pages are cleaned and chunked as they are extracted and handed on about
+    # one embedding batch at a time, or sooner when pages arrive slowly
+    pending: List[Dict[str, Any]] = []
+    flushed = time.monotonic()
+    pages_iter = iter_document_pages(path, filename, config.parse_workers, config.parse_pages_per_task, logger,
+                                     task_timeout=config.parse_task_timeout or None)
+    for rec in pages_iter:
+        pending.extend(chunk_records(clean_records([rec], logger), 'document', logger))
+        if pending and (len(pending) >= config.embed_batch_size
+                        or time.monotonic() - flushed >= config.index_flush_seconds):
+            pages = rec.get('pages')
+            yield pending, rec['metadata']['page'] / pages if pages else None
+            pending = []
+            flushed = time.monotonic()
+    yield pending, 1.0
+
+
+def _ingest_csv_stream(path: str, filename: str, file_hash: str, vector_store, logger, report) -> int:
+    # Two passes over the file on disk: the first gathers what cleaning needs
+    # (row count, numeric percentiles), the second cleans, chunks, embeds and
+    # indexes one batch at a time, so memory does not grow with the file
+    chunk_rows = vector_store.config.csv_chunk_rows
+    cleaner = StreamingTableCleaner(dedup_rows=vector_store.config.csv_dedup_rows)
+    report('parsing')
+    for batch in iter_csv_batches(path, chunk_rows):
+        cleaner.observe(batch)
+    report('indexing')
+
+    def batches() -> ChunkBatches:
+        rows = 0
+        for batch in iter_csv_batches(path, chunk_rows):
+            rows += len(batch)
+            chunks = chunk_records([{'type': 'tabular', 'dataframe': cleaner.clean(batch)}], 'tabular', logger)
+            yield chunks, rows / max(cleaner.rows, 1)
+
+    num_chunks = _index_batches(batches(), filename, file_hash, 'tabular', vector_store, report)
+    logger.info('Streamed %s: %d rows in %d chunks', filename, cleaner.rows, num_chunks)
+    if cleaner.dedup_full:
+        logger.warning('%s has over %d distinct rows; later rows were deduplicated within their batch only',
+                       filename, vector_store.config.csv_dedup_rows)
+    return num_chunks
+
+
+_JOB_ID_RE = re.compile(r'[0-9a-f]{32}')
+
+
+def _new_job(job_id: str, filename: str) -> Dict[str, Any]:
+    return {
+        'job_id': job_id,
+        'filename': filename,
+        'status': 'queued',
+        'stage': 'queued',
+        'progress': 0.0,
+        'result': None,
+        'error': None,
+        'created_at': time.time(),
+        'finished_at': None,
+    }
+
+
+def _write_job(status_dir: str, job: Dict[str, Any]) -> None:
+    _atomic_write(os.path.join(status_dir, f"{job['job_id']}.json"), lambda f: json.dump(job, f))
+
+
+def _read_job(status_dir: str, job_id: str) -> Optional[Dict[str, Any]]:
+    # Follows 'same_as' links left when a request joined an identical in-flight job
+    for _ in range(2):
+        if not _JOB_ID_RE.fullmatch(job_id or ''):
+            return None
+        try:
+            with open(os.path.join(status_dir, f'{job_id}.json'), 'r', encoding='utf-8') as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not job.get('same_as'):
+            return job
+        job_id = job['same_as']
+    return job
+
+
+class IngestionQueue:
+    # With shared=True (the writer of a multi-process deployment) job status is
+    # mirrored to vectorstore/jobs/ and requests spooled by reader processes
+    # under vectorstore/spool/ are picked up and run here.
+    def __init__(self, config, logger, vector_store, shared: bool = False) -> None:
+        self.config = config
+        self.logger = logger
+        self.store = vector_store
+        self._executor = ThreadPoolExecutor(max_workers=config.ingest_workers, thread_name_prefix='ingest')
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        # file_hash -> job id of the job currently ingesting that content
+        self._inflight: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.status_dir = os.path.join(config.vector_dir, 'jobs') if shared else None
+        self.spool_dir = os.path.join(config.vector_dir, 'spool') if shared else None
+        if shared:
+            os.makedirs(self.status_dir, exist_ok=True)
+            os.makedirs(self.spool_dir, exist_ok=True)
+            threading.Thread(target=self._watch_spool, daemon=True, name='ingest-spool').start()
+
+    def submit(self, path: str, filename: str, file_hash: str = None, job_id: str = None):
+        job = _new_job(job_id or uuid.uuid4().hex, filename)
+        job_id = job['job_id']
+        with self._lock:
+            # Identical content already queued or running: hand back that job
+            inflight = self._inflight.get(file_hash) if file_hash else None
+            if inflight and inflight in self._jobs:
+                return inflight, None
+            self._jobs[job_id] = job
+            if file_hash:
+                self._inflight[file_hash] = job_id
+            self._prune()
+        self._persist(job)
+        future = self._executor.submit(self._run, job_id, path, filename, file_hash)
+        return job_id, future
+
+    def submit_delete(self, file_hash: str = None, filename: str = None, job_id: str = None):
+        job = _new_job(job_id or uuid.uuid4().hex, filename)
+        with self._lock:
+            self._jobs[job['job_id']] = job
+            self._prune()
+        self._persist(job)
+        future = self._executor.submit(self._run_delete, job['job_id'], file_hash, filename)
+        return job['job_id'], future
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return dict(job)
+        return _read_job(self.status_dir, job_id) if self.status_dir else None
+
+    def _persist(self, job: Dict[str, Any]) -> None:
+        if not self.status_dir:
+            return
+        try:
+            _write_job(self.status_dir, job)
+        except OSError:
+            self.logger.warning('Failed to write status of job %s', job['job_id'])
+
+    def _update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            if job_id not in self._jobs:
+                return
+            self._jobs[job_id].update(fields)
+            job = dict(self._jobs[job_id])
+        self._persist(job)
+
+    def _run_delete(self, job_id: str, file_hash: str = None, filename: str = None) -> Dict[str, Any]:
+        self._update(job_id, status='running', stage='indexing')
+        try:
+            removed = self.store.remove_file(file_hash=file_hash, filename=filename)
+        except Exception as exc:
+            self.logger.exception('Delete job %s failed', job_id)
+            self._update(job_id, status='failed', error=str(exc), finished_at=time.time())
+            raise
+        result = {'removed_chunks': removed}
+        self._update(job_id, status='done', stage='done', progress=1.0, result=result, finished_at=time.time())
+        return result
+
+    def _watch_spool(self) -> None:
+        while True:
+            time.sleep(self.config.reload_interval)
+            for path in sorted(glob.glob(os.path.join(self.spool_dir, '*.json')), key=os.path.getmtime):
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        req = json.load(f)
+                    os.remove(path)
+                    self._dispatch(req)
+                except Exception:
+                    self.logger.exception('Failed to process spooled request %s', path)
+
+    def _dispatch(self, req: Dict[str, Any]) -> None:
+        job_id = req['job_id']
+        if req['op'] == 'delete':
+            self.submit_delete(req.get('file_hash'), req.get('filename'), job_id=job_id)
+            return
+        accepted, _ = self.submit(req['path'], req['filename'], file_hash=req.get('file_hash'), job_id=job_id)
+        if accepted != job_id:
+            # Joined an identical in-flight job; point the reader's job id at it
+            self._persist({**_new_job(job_id, req['filename']), 'same_as': accepted})
+
+    def _run(self, job_id: str, path: str, filename: str, file_hash: str = None) -> Dict[str, Any]:
+        self._update(job_id, status='running')
+        try:
+            result = ingest_file(
+                path, filename, self.store, self.logger, file_hash=file_hash,
+                on_progress=lambda stage, frac: self._update(job_id, stage=stage, progress=round(frac, 3))
+            )
+        except Exception as exc:
+            self.logger.exception('Ingestion job %s (%s) failed', job_id, filename)
+            self._update(job_id, status='failed', error=str(exc), finished_at=time.time())
+            raise
+        finally:
+            with self._lock:
+                if file_hash and self._inflight.get(file_hash) == job_id:
+                    del self._inflight[file_hash]
+        self._update(job_id, status='done', stage='done', progress=1.0, result=result, finished_at=time.time())
+        return result
+
+    def _prune(self) -> None:
+        # Forget the oldest finished jobs once the table grows past max_jobs
+        excess = len(self._jobs) - self.config.max_jobs
+        if excess <= 0:
+            return
+        finished = [j for j in self._jobs.values() if j['finished_at'] is not None]
+        finished.sort(key=lambda j: j['finished_at'])
+        for job in finished[:excess]:
+            del self._jobs[job['job_id']]
+            if self.status_dir:
+                try:
+                    os.remove(os.path.join(self.status_dir, f"{job['job_id']}.json"))
+                except OSError:
+                    pass
+
+
+class SpooledIngestion:
+    # Reader-process stand-in for IngestionQueue: uploads and deletes are written
+    # to the spool directory for the writer, and job status is read back from
+    # the files the writer keeps up to date.
+    def __init__(self, config, logger) -> None:
+        self.config = config
+        self.logger = logger
+        self.status_dir = os.path.join(config.vector_dir, 'jobs')
+        self.spool_dir = os.path.join(config.vector_dir, 'spool')
+        os.makedirs(self.status_dir, exist_ok=True)
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+    def _request(self, op: str, filename: str, **fields) -> str:
+        job_id = uuid.uuid4().hex
+        # Status first, so the job is visible as queued before the writer sees it
+        _write_job(self.status_dir, _new_job(job_id, filename))
+        request = {'op': op, 'job_id': job_id, 'filename': filename, **fields}
+        _atomic_write(os.path.join(self.spool_dir, f'{job_id}.json'), lambda f: json.dump(request, f))
+        return job_id
+
+    def submit(self, path: str, filename: str, file_hash: str = None):
+        return self._request('ingest', filename, path=os.path.abspath(path), file_hash=file_hash), None
+
+    def submit_delete(self, file_hash: str = None, filename: str = None):
+        return self._request('delete', filename, file_hash=file_hash), None
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return _read_job(self.status_dir, job_id)
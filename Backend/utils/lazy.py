@@ -0,0 +1,55 @@
+import time
+import threading
+from typing import Any, Callable, Dict
+
+
+class LazyModel:
+    # Loads a model on first use. Concurrent callers wait for the one load in
+    # flight; a failed load is retried on the next call.
+    def __init__(self, name: str, loader: Callable[[], Any], logger) -> None:
+        self.name = name
+        self.loader = loader
+        self.logger = logger
+        self._value = None
+        self._lock = threading.Lock()
+        self.state = 'unloaded'
+        self.load_seconds = None
+        self.error = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._value is not None
+
+    def get(self) -> Any:
+        if self._value is not None:
+            return self._value
+        with self._lock:
+            if self._value is None:
+                self.state = 'loading'
+                start = time.perf_counter()
+                try:
+                    value = self.loader()
+                except Exception as exc:
+                    self.state = 'failed'
+                    self.error = str(exc)
+                    self.logger.exception('Loading %s model failed', self.name)
+                    raise
+                self.load_seconds = round(time.perf_counter() - start, 3)
+                self.error = None
+                self._value = value
+                self.state = 'ready'
+                self.logger.info('Loaded %s model in %.2fs', self.name, self.load_seconds)
+        return self._value
+
+    def warm_up(self) -> threading.Thread:
+        def run() -> None:
+            try:
+                self.get()
+            except Exception:
+                pass
+        thread = threading.Thread(target=run, daemon=True, name=f'warmup-{self.name}')
+        thread.start()
+        return thread
+
+    def status(self) -> Dict[str, Any]:
+        return {'state': self.state, 'load_seconds': self.load_seconds, 'error': self.error}
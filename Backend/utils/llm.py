@@ -1,17 +1,131 @@
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, pipeline
+from typing import Iterator, List
+
+import torch
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, TextIteratorStreamer, StoppingCriteria, \
+    StoppingCriteriaList
+
+from utils.scheduler import BatchScheduler
+from utils.lazy import LazyModel
+from utils.backends import load_text2text_pipeline
+
+
+class _StreamRequest(StoppingCriteria):
+    # A streamed answer queued on the generation scheduler. Also the stopping
+    # criterion of its generate() call: `stopped` is set once the client is gone.
+    def __init__(self, prompt: str, streamer) -> None:
+        super().__init__()
+        self.prompt = prompt
+        self.streamer = streamer
+        self.stopped = False
+        self.error = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.stopped, dtype=torch.bool, device=input_ids.device)
 
 
 class LLMService:
     def __init__(self, config, logger) -> None:
         self.config = config
         self.logger = logger
+        self._model_name = config.generation_model_name
+        self.generator_loader = LazyModel('generator', self._load_pipeline, logger)
+        # Concurrent answer() calls are coalesced into batched generate calls;
+        # streamed answers wait in the same bounded queue
+        self.scheduler = BatchScheduler(config, logger, self._generate_batch, name='generation')
+
+    def _load_pipeline(self):
+        backend = self.config.gen_backend
         try:
-            self.generator = pipeline('text2text-generation', model=config.generation_model_name)
+            generator = load_text2text_pipeline(self.config.generation_model_name, backend)
+            self._model_name = self.config.generation_model_name
         except Exception:
             # Fallback small model
-            self.generator = pipeline('text2text-generation', model='google/flan-t5-small')
+            generator = load_text2text_pipeline('google/flan-t5-small', backend)
+            self._model_name = 'google/flan-t5-small'
+        if backend != 'torch':
+            self._model_name = f'{self._model_name}:{backend}'
+        return generator
+
+    @property
+    def generator(self):
+        return self.generator_loader.get()
+
+    @property
+    def model_name(self) -> str:
+        # The fallback model is only known once the pipeline has loaded
+        self.generator_loader.get()
+        return self._model_name
+
+    def _prompt(self, question: str, context: str) -> str:
+        return f"You are a helpful dataset assistant. Use the provided context to answer.\nContext:\n{context}\n\nQuestion: {question}\nAnswer:"
+
+    def max_input_tokens(self) -> int:
+        limit = getattr(self.generator.tokenizer, 'model_max_length', None) or 512
+        # Tokenizers without a configured limit report a huge sentinel value
+        return limit if limit < 100000 else 512
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        encoded = self.generator.tokenizer(texts, add_special_tokens=False)['input_ids']
+        return [len(ids) for ids in encoded]
+
+    def prompt_tokens(self, question: str) -> int:
+        # Prompt with an empty context, including special tokens
+        return len(self.generator.tokenizer(self._prompt(question, ''))['input_ids'])
 
     def answer(self, question: str, context: str) -> str:
-        prompt = f"You are a helpful dataset assistant. Use the provided context to answer.\nContext:\n{context}\n\nQuestion: {question}\nAnswer:"
-        out = self.generator(prompt, max_new_tokens=256, do_sample=False)
-        return out[0]['generated_text']
+        return self.scheduler.submit(self._prompt(question, context)).result()
+
+    def _generate_batch(self, items: list) -> list:
+        # Plain prompts are generated together; streamed requests then run one
+        # at a time on the scheduler thread
+        prompts = [item for item in items if isinstance(item, str)]
+        try:
+            answers = iter(self._generate_prompts(prompts) if prompts else [])
+        except Exception:
+            # The plain prompts' futures get the error; streamed requests still run (and
+            # end their streamers), otherwise their clients would wait out stream_timeout
+            for item in items:
+                if not isinstance(item, str):
+                    self._generate_stream(item)
+            raise
+        return [next(answers) if isinstance(item, str) else self._generate_stream(item) for item in items]
+
+    def _generate_prompts(self, prompts: List[str]) -> List[str]:
+        out = self.generator(prompts, max_new_tokens=256, do_sample=False, batch_size=len(prompts), truncation=True)
+        # A list input yields one dict per prompt, or a one-item list per prompt
+        return [(o[0] if isinstance(o, list) else o)['generated_text'] for o in out]
+
+    def _generate_stream(self, request: _StreamRequest) -> None:
+        if request.stopped:
+            return None
+        try:
+            inputs = self.generator.tokenizer(request.prompt, return_tensors='pt', truncation=True)
+            self.generator.model.generate(**inputs, max_new_tokens=256, do_sample=False, streamer=request.streamer,
+                                          stopping_criteria=StoppingCriteriaList([request]))
+        except Exception as exc:
+            # Reported to the streaming caller; the rest of the batch is unaffected
+            self.logger.exception('Streamed generation failed')
+            request.error = exc
+            request.streamer.end()
+        return None
+
+    def stream_answer(self, question: str, context: str) -> Iterator[str]:
+        # Queue generate() on the scheduler and yield decoded text as the streamer
+        # receives new tokens. Raises QueueFull when the queue is full.
+        tokenizer = self.generator.tokenizer
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=self.config.stream_timeout)
+        request = _StreamRequest(self._prompt(question, context), streamer)
+        future = self.scheduler.submit(request)
+        try:
+            for text in streamer:
+                if text:
+                    yield text
+            if request.error is not None:
+                raise request.error
+        finally:
+            # On client disconnect (GeneratorExit) drop the request if it is still
+            # queued, or stop generate() at its next token
+            request.stopped = True
+            future.cancel()
@@ -0,0 +1,318 @@
+import os
+import mmap
+import json
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+import numpy as np
+
+
+# Fields kept as columns; anything else in a chunk's meta dict (the nested
+# 'metadata' and legacy keys) is stored as JSON next to its text.
+CORE_FIELDS = ('vector_id', 'file_hash', 'filename', 'file_type', 'chunk_type', 'text')
+
+_COLUMNS = {
+    'vector_id': 'int64',
+    'file_idx': 'int32',
+    'ctype': 'int8',
+    'offset': 'int64',
+    'text_len': 'int32',
+    'extra_len': 'int32',
+}
+
+
+class MetaStore:
+    # Columnar chunk metadata. Files and chunk types are interned into small
+    # tables and referenced by index; each chunk's text (followed by its extra
+    # JSON) lives in a byte blob addressed by offset. The blob of a compacted base
+    # is memory-mapped and read on demand; chunks appended later go to an
+    # in-memory tail. Rows stay ordered by vector id, so positions are found by
+    # binary search instead of a per-chunk dict.
+    def __init__(self) -> None:
+        self._files: List[Tuple[str, str, str]] = []
+        self._file_index: Dict[Tuple[str, str, str], int] = {}
+        self._types: List[str] = []
+        self._type_index: Dict[str, int] = {}
+        # file index -> vector ids of its chunks, as sorted arrays appended in pieces;
+        # kept on append/delete so per-file lookups don't scan every row
+        self._file_ids: Dict[int, List[np.ndarray]] = {}
+        self._cols = {name: np.zeros(1024, dtype=dtype) for name, dtype in _COLUMNS.items()}
+        self._n = 0
+        self._base_blob = b''
+        self._base_len = 0
+        self._tail = bytearray()
+        self._blob_file = None
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _col(self, name: str) -> np.ndarray:
+        return self._cols[name][:self._n]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._col('vector_id')
+
+    @property
+    def max_id(self) -> int:
+        return int(self._cols['vector_id'][self._n - 1]) if self._n else -1
+
+    # Interning
+
+    def _intern_file(self, m: Dict[str, Any]) -> int:
+        key = (m.get('file_hash'), m.get('filename'), m.get('file_type'))
+        idx = self._file_index.get(key)
+        if idx is None:
+            idx = self._file_index[key] = len(self._files)
+            self._files.append(key)
+        return idx
+
+    def _intern_type(self, chunk_type: str) -> int:
+        idx = self._type_index.get(chunk_type)
+        if idx is None:
+            if len(self._types) >= 127:
+                raise ValueError('Too many distinct chunk types')
+            idx = self._type_index[chunk_type] = len(self._types)
+            self._types.append(chunk_type)
+        return idx
+
+    # Mutation
+
+    def _reserve(self, extra: int) -> None:
+        need = self._n + extra
+        cap = len(self._cols['vector_id'])
+        if need <= cap:
+            return
+        cap = max(need, 2 * cap)
+        for name, col in self._cols.items():
+            grown = np.zeros(cap, dtype=col.dtype)
+            grown[:self._n] = col[:self._n]
+            self._cols[name] = grown
+
+    def append(self, metas: Iterable[Dict[str, Any]]) -> None:
+        metas = list(metas)
+        if not metas:
+            return
+        self._reserve(len(metas))
+        start = self._n
+        for i, m in enumerate(metas, start):
+            text = (m.get('text') or '').encode('utf-8')
+            extra = {k: v for k, v in m.items() if k not in CORE_FIELDS}
+            extra_bytes = json.dumps(extra, ensure_ascii=False).encode('utf-8') if extra else b''
+            self._cols['vector_id'][i] = int(m['vector_id'])
+            self._cols['file_idx'][i] = self._intern_file(m)
+            self._cols['ctype'][i] = self._intern_type(m.get('chunk_type'))
+            self._cols['offset'][i] = self._base_len + len(self._tail)
+            self._cols['text_len'][i] = len(text)
+            self._cols['extra_len'][i] = len(extra_bytes)
+            self._tail += text
+            self._tail += extra_bytes
+        self._n += len(metas)
+        self._index_files(start, self._n)
+        ids = self._col('vector_id')
+        if start and ids[start] <= ids[start - 1] or np.any(np.diff(ids[start:]) <= 0):
+            # Out-of-order ids (never produced by VectorStore itself): restore the order
+            order = np.argsort(ids, kind='stable')
+            for name in self._cols:
+                self._cols[name][:self._n] = self._cols[name][:self._n][order]
+
+    def _index_files(self, start: int, stop: int) -> None:
+        ids = self._cols['vector_id'][start:stop]
+        file_idx = self._cols['file_idx'][start:stop]
+        order = np.argsort(file_idx, kind='stable')
+        files, first = np.unique(file_idx[order], return_index=True)
+        for f, piece in zip(files.tolist(), np.split(ids[order], first[1:])):
+            self._file_ids.setdefault(f, []).append(np.sort(piece))
+
+    def _ids_of_file(self, f: int) -> np.ndarray:
+        pieces = self._file_ids.get(f)
+        if not pieces:
+            return np.zeros(0, dtype='int64')
+        if len(pieces) > 1:
+            pieces[:] = [np.sort(np.concatenate(pieces))]
+        return pieces[0]
+
+    def delete(self, ids: Iterable[int]) -> int:
+        ids = np.asarray(list(ids) if not isinstance(ids, np.ndarray) else ids, dtype='int64')
+        pos = self.positions(ids)
+        for f in np.unique(self._col('file_idx')[pos[pos >= 0]]).tolist():
+            kept_ids = self._ids_of_file(f)
+            kept_ids = kept_ids[~np.isin(kept_ids, ids)]
+            if len(kept_ids):
+                self._file_ids[f] = [kept_ids]
+            else:
+                del self._file_ids[f]
+        keep = ~np.isin(self._col('vector_id'), ids)
+        kept = int(keep.sum())
+        removed = self._n - kept
+        if removed:
+            for name in self._cols:
+                self._cols[name][:kept] = self._cols[name][:self._n][keep]
+            self._n = kept
+        return removed
+
+    # Lookups
+
+    def positions(self, ids: np.ndarray) -> np.ndarray:
+        # Row of each vector id, -1 where the id is not present
+        ids = np.asarray(ids, dtype='int64')
+        col = self._col('vector_id')
+        if not self._n:
+            return np.full(len(ids), -1, dtype='int64')
+        pos = np.minimum(np.searchsorted(col, ids), self._n - 1)
+        return np.where(col[pos] == ids, pos, -1)
+
+    def pos(self, vector_id: int) -> Optional[int]:
+        p = int(self.positions(np.asarray([vector_id]))[0])
+        return None if p < 0 else p
+
+    def __contains__(self, vector_id: int) -> bool:
+        return self.pos(vector_id) is not None
+
+    def _bytes(self, offset: int, length: int) -> bytes:
+        if offset >= self._base_len:
+            start = offset - self._base_len
+            return bytes(self._tail[start:start + length])
+        return self._base_blob[offset:offset + length]
+
+    def text(self, pos: int) -> str:
+        return self._bytes(int(self._cols['offset'][pos]), int(self._cols['text_len'][pos])).decode('utf-8')
+
+    def describe(self, pos: int) -> Tuple[str, str, str, str]:
+        # (file_hash, filename, file_type, chunk_type) without touching the blob
+        file_hash, filename, file_type = self._files[int(self._cols['file_idx'][pos])]
+        return file_hash, filename, file_type, self._types[int(self._cols['ctype'][pos])]
+
+    def get(self, pos: int) -> Dict[str, Any]:
+        file_hash, filename, file_type, chunk_type = self.describe(pos)
+        offset = int(self._cols['offset'][pos])
+        text_len = int(self._cols['text_len'][pos])
+        extra_len = int(self._cols['extra_len'][pos])
+        meta = {
+            'file_hash': file_hash,
+            'filename': filename,
+            'file_type': file_type,
+            'chunk_type': chunk_type,
+            'metadata': {},
+        }
+        if extra_len:
+            meta.update(json.loads(self._bytes(offset + text_len, extra_len).decode('utf-8')))
+        meta['text'] = self._bytes(offset, text_len).decode('utf-8')
+        meta['vector_id'] = int(self._cols['vector_id'][pos])
+        return meta
+
+    def iter_rows(self) -> Iterable[Dict[str, Any]]:
+        for pos in range(self._n):
+            yield self.get(pos)
+
+    def positions_of_type(self, chunk_type: str) -> np.ndarray:
+        idx = self._type_index.get(chunk_type)
+        if idx is None:
+            return np.zeros(0, dtype='int64')
+        return np.nonzero(self._col('ctype') == idx)[0]
+
+    def _file_indices(self, file_hash: str = None, filename: str = None) -> List[int]:
+        return [i for i, (h, name, _) in enumerate(self._files)
+                if (file_hash is None or h == file_hash) and (filename is None or name == filename)]
+
+    def ids_for(self, file_hash: str = None, filename: str = None) -> np.ndarray:
+        parts = [self._ids_of_file(f) for f in self._file_indices(file_hash, filename)]
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return np.zeros(0, dtype='int64')
+        return np.sort(np.concatenate(parts)) if len(parts) > 1 else parts[0].copy()
+
+    def count(self, file_hash: str) -> int:
+        return sum(sum(len(p) for p in self._file_ids.get(f, ()))
+                   for f in self._file_indices(file_hash=file_hash))
+
+    def has_file(self, file_hash: str) -> bool:
+        return self.count(file_hash) > 0
+
+    def files(self) -> List[Dict[str, Any]]:
+        counts = np.bincount(self._col('file_idx'), minlength=len(self._files))
+        summary: Dict[str, Dict[str, Any]] = {}
+        for idx in np.nonzero(counts)[0]:
+            file_hash, filename, file_type = self._files[idx]
+            key = file_hash or filename
+            if key not in summary:
+                summary[key] = {'file_hash': file_hash, 'filename': filename, 'file_type': file_type, 'num_chunks': 0}
+            summary[key]['num_chunks'] += int(counts[idx])
+        return list(summary.values())
+
+    def hashes(self, chunk_type: str = None) -> set:
+        file_idx = self._col('file_idx')
+        if chunk_type is not None:
+            file_idx = file_idx[self.positions_of_type(chunk_type)]
+        counts = np.bincount(file_idx, minlength=len(self._files))
+        return {self._files[i][0] for i in np.nonzero(counts)[0]}
+
+    # Persistence
+
+    def copy(self) -> 'MetaStore':
+        # Snapshot for compaction: columns are copied, the immutable base blob and
+        # the tail are shared (appends only add bytes after the snapshot's rows)
+        other = MetaStore()
+        other._files = list(self._files)
+        other._file_index = dict(self._file_index)
+        other._types = list(self._types)
+        other._type_index = dict(self._type_index)
+        other._file_ids = {f: list(pieces) for f, pieces in self._file_ids.items()}
+        other._cols = {name: col[:self._n].copy() for name, col in self._cols.items()}
+        other._n = self._n
+        other._base_blob = self._base_blob
+        other._base_len = self._base_len
+        other._tail = self._tail
+        return other
+
+    def save(self, path: str) -> None:
+        # Writes only live rows, so deleted chunks' bytes are dropped from the blob
+        os.makedirs(path, exist_ok=True)
+        offsets = np.zeros(self._n, dtype='int64')
+        written = 0
+        with open(os.path.join(path, 'blob.bin'), 'wb') as f:
+            for pos in range(self._n):
+                length = int(self._cols['text_len'][pos]) + int(self._cols['extra_len'][pos])
+                f.write(self._bytes(int(self._cols['offset'][pos]), length))
+                offsets[pos] = written
+                written += length
+            f.flush()
+            os.fsync(f.fileno())
+        cols = {name: col[:self._n] for name, col in self._cols.items()}
+        cols['offset'] = offsets
+        with open(os.path.join(path, 'columns.npz'), 'wb') as f:
+            np.savez(f, **cols)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(os.path.join(path, 'tables.json'), 'w', encoding='utf-8') as f:
+            json.dump({'files': self._files, 'types': self._types}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+
+    @classmethod
+    def load(cls, path: str) -> 'MetaStore':
+        store = cls()
+        with open(os.path.join(path, 'tables.json'), 'r', encoding='utf-8') as f:
+            tables = json.load(f)
+        store._files = [tuple(f) for f in tables['files']]
+        store._file_index = {key: i for i, key in enumerate(store._files)}
+        store._types = list(tables['types'])
+        store._type_index = {t: i for i, t in enumerate(store._types)}
+        with np.load(os.path.join(path, 'columns.npz')) as data:
+            store._cols = {name: np.array(data[name], dtype=dtype) for name, dtype in _COLUMNS.items()}
+        store._n = len(store._cols['vector_id'])
+        store._reserve(0)
+        store._index_files(0, store._n)
+        blob_path = os.path.join(path, 'blob.bin')
+        size = os.path.getsize(blob_path)
+        if size:
+            # Kept open for the life of the store; the pages are shared with other processes
+            store._blob_file = open(blob_path, 'rb')
+            store._base_blob = mmap.mmap(store._blob_file.fileno(), 0, access=mmap.ACCESS_READ)
+        store._base_len = size
+        return store
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]]) -> 'MetaStore':
+        store = cls()
+        store.append(rows)
+        return store
@@ -0,0 +1,122 @@
+import sys
+import time
+import json
+import argparse
+from typing import Any, Dict, List
+
+import numpy as np
+
+from utils.config import AppConfig
+from utils.logger import get_logger
+from utils.backends import BACKENDS, load_sentence_transformer, load_cross_encoder, load_text2text_pipeline
+
+
+# Used when the vector store is empty
+SAMPLE_TEXTS = [
+    'Quarterly revenue grew 12% driven by subscription renewals in Europe.',
+    'The ingestion service parses PDF, DOCX, CSV and spreadsheet uploads.',
+    'Customers in the west region placed the largest average orders.',
+    'FAISS keeps the dense vectors; BM25 scores exact keyword matches.',
+    'The warehouse shipped 4,200 units in March, up from 3,100 in February.',
+    'Employees can submit travel expenses through the finance portal.',
+    'Model latency on CPU is dominated by the generator forward pass.',
+    'Support tickets are triaged by severity and assigned within one hour.',
+]
+
+
+def embedding_drift(baseline: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    # Vectors are L2-normalized, so the row-wise dot product is the cosine
+    cos = np.sum(baseline * candidate, axis=1)
+    drift = 1.0 - cos
+    return {'mean_cosine': float(cos.mean()), 'min_cosine': float(cos.min()),
+            'mean_drift': float(drift.mean()), 'p95_drift': float(np.percentile(drift, 95)),
+            'max_drift': float(drift.max())}
+
+
+def kendall_tau(a: np.ndarray, b: np.ndarray) -> float:
+    if len(a) < 2:
+        return 1.0
+    i, j = np.triu_indices(len(a), k=1)
+    concordance = np.sign(a[i] - a[j]) * np.sign(b[i] - b[j])
+    return float(concordance.mean())
+
+
+def rank_agreement(baseline: List[np.ndarray], candidate: List[np.ndarray], k: int = 5) -> Dict[str, float]:
+    top1, overlap, taus = [], [], []
+    for base, cand in zip(baseline, candidate):
+        base_order, cand_order = np.argsort(-base), np.argsort(-cand)
+        top1.append(base_order[0] == cand_order[0])
+        overlap.append(len(set(base_order[:k]) & set(cand_order[:k])) / min(k, len(base)))
+        taus.append(kendall_tau(base, cand))
+    return {'queries': len(baseline), 'top1_agreement': float(np.mean(top1)),
+            f'top{k}_overlap': float(np.mean(overlap)), 'mean_kendall_tau': float(np.mean(taus))}
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    out = fn()
+    return out, round(time.perf_counter() - start, 3)
+
+
+def check_parity(config, logger, backend: str, texts: List[str], queries: List[str],
+                 candidates: int = 20, generator: bool = False) -> Dict[str, Any]:
+    report: Dict[str, Any] = {'backend': backend, 'texts': len(texts), 'queries': len(queries)}
+
+    encode = lambda m, xs: m.encode(xs, convert_to_numpy=True, normalize_embeddings=True)
+    base_emb = load_sentence_transformer(config.embedding_model_name, 'torch')
+    cand_emb = load_sentence_transformer(config.embedding_model_name, backend)
+    base_vecs, base_s = _timed(lambda: encode(base_emb, texts))
+    cand_vecs, cand_s = _timed(lambda: encode(cand_emb, texts))
+    report['embedding'] = {**embedding_drift(base_vecs, cand_vecs), 'fp32_seconds': base_s, 'candidate_seconds': cand_s}
+
+    # Rerank the baseline's nearest texts for each query with both cross-encoders
+    query_vecs = encode(base_emb, queries)
+    pools = [np.argsort(-(base_vecs @ qv))[:candidates] for qv in query_vecs]
+    pairs = [[[q, texts[i]] for i in pool] for q, pool in zip(queries, pools)]
+    base_ce = load_cross_encoder(config.cross_encoder_name, 'torch')
+    cand_ce = load_cross_encoder(config.cross_encoder_name, backend)
+    base_scores, base_s = _timed(lambda: [np.asarray(base_ce.predict(p)) for p in pairs])
+    cand_scores, cand_s = _timed(lambda: [np.asarray(cand_ce.predict(p)) for p in pairs])
+    report['rerank'] = {**rank_agreement(base_scores, cand_scores), 'fp32_seconds': base_s, 'candidate_seconds': cand_s}
+
+    if generator:
+        prompts = [f"Use the provided context to answer.\nContext:\n{texts[pool[0]]}\n\nQuestion: {q}\nAnswer:"
+                   for q, pool in zip(queries, pools)]
+        run = lambda g: [o['generated_text'] for o in g(prompts, max_new_tokens=64, do_sample=False)]
+        base_out, base_s = _timed(lambda: run(load_text2text_pipeline(config.generation_model_name, 'torch')))
+        cand_out, cand_s = _timed(lambda: run(load_text2text_pipeline(config.generation_model_name, backend)))
+        same = [a.strip() == b.strip() for a, b in zip(base_out, cand_out)]
+        report['generator'] = {'exact_match': float(np.mean(same)), 'fp32_seconds': base_s, 'candidate_seconds': cand_s}
+    logger.info('Parity report for %s: %s', backend, report)
+    return report
+
+
+def _store_texts(config, logger, limit: int) -> List[str]:
+    # Read-only view: never compacts, builds indexes or writes to a live store
+    from utils.vectorstore import ReadOnlyVectorStore
+    return ReadOnlyVectorStore(config, logger, None, watch=False).sample_texts(limit)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Compare an inference backend against the fp32 baseline')
+    parser.add_argument('--backend', choices=[b for b in BACKENDS if b != 'torch'], default='int8')
+    parser.add_argument('--texts', type=int, default=200, help='indexed chunks to sample')
+    parser.add_argument('--query', action='append', help='query to rerank for (repeatable)')
+    parser.add_argument('--generator', action='store_true', help='also compare generated answers')
+    parser.add_argument('--min-cosine', type=float, default=0.99)
+    parser.add_argument('--min-top1', type=float, default=0.8)
+    args = parser.parse_args(argv)
+
+    config = AppConfig()
+    logger = get_logger('parity', config)
+    texts = _store_texts(config, logger, args.texts) or SAMPLE_TEXTS
+    # Without explicit queries, the opening words of sampled texts stand in for questions
+    queries = args.query or [' '.join(t.split()[:8]) for t in texts[:10]]
+    report = check_parity(config, logger, args.backend, texts, queries, generator=args.generator)
+    print(json.dumps(report, indent=2))
+    ok = report['embedding']['mean_cosine'] >= args.min_cosine and report['rerank']['top1_agreement'] >= args.min_top1
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
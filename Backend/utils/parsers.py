@@ -1,12 +1,115 @@
 import io
 import json
-from typing import List, Dict, Any
+import multiprocessing
+from collections import deque
+from typing import List, Dict, Any, Iterator, Optional
 
 import pandas as pd
 from docx import Document
 from PyPDF2 import PdfReader
 
 
+def iter_csv_batches(path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    # Streams a CSV from disk chunk_rows rows at a time
+    with pd.read_csv(path, chunksize=chunk_rows) as reader:
+        for batch in reader:
+            yield batch
+
+
+def _page_record(text: str, page: int, pages: Optional[int]) -> Dict[str, Any]:
+    # 'pages' sits outside metadata: it drives progress and is not stored per chunk
+    return {"type": "text", "text": text, "pages": pages, "metadata": {"format": "document", "page": page}}
+
+
+def _extract_text(page) -> str:
+    try:
+        return page.extract_text() or ""
+    except Exception:
+        return ""
+
+
+def _extract_pdf_pages(path: str, start: int, stop: int) -> List[str]:
+    # Runs in a worker process; each task opens the file itself so only paths
+    # and page numbers are sent to it
+    reader = PdfReader(path)
+    return [_extract_text(reader.pages[i]) for i in range(start, stop)]
+
+
+def _pool_context():
+    # Not fork: the ingesting process runs threads (request handlers, model
+    # loaders, compaction) whose locks a forked child could inherit held.
+    # forkserver workers start from a clean server process with this module
+    # preloaded; they import the main module as __mp_main__, which builds no
+    # services at import.
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['utils.parsers'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def _iter_pdf_pages(path: str, workers: int, pages_per_task: int, logger,
+                    task_timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+    reader = PdfReader(path)
+    pages = len(reader.pages)
+    if workers <= 1 or pages <= pages_per_task:
+        for i, page in enumerate(reader.pages):
+            yield _page_record(_extract_text(page), i + 1, pages)
+        return
+    ranges = deque((start, min(start + pages_per_task, pages)) for start in range(0, pages, pages_per_task))
+    workers = min(workers, len(ranges))
+    logger.info('Extracting %d pages with %d processes', pages, workers)
+    # Leaving the block terminates the workers, so one stuck on a page (or a
+    # consumer that stops early) never keeps the shutdown waiting
+    with _pool_context().Pool(workers) as pool:
+        # A bounded window of tasks: pages come back in order and at most
+        # 2 * workers tasks' text is held at a time
+        pending = deque()
+        while ranges or pending:
+            while ranges and len(pending) < 2 * workers:
+                start, stop = ranges.popleft()
+                pending.append((start, pool.apply_async(_extract_pdf_pages, (path, start, stop))))
+            start, result = pending.popleft()
+            try:
+                texts = result.get(timeout=task_timeout)
+            except multiprocessing.TimeoutError:
+                logger.error('Extracting pages %d-%d took over %ss, giving up', start + 1,
+                             start + pages_per_task, task_timeout)
+                raise
+            for i, text in enumerate(texts, start):
+                yield _page_record(text, i + 1, pages)
+
+
+def _iter_docx_pages(source) -> Iterator[Dict[str, Any]]:
+    # DOCX has no page layout; pages are split at the page breaks Word saved
+    # (rendered ones if present, else explicit ones). The XML is parsed as a
+    # whole, so this part is not spread over processes.
+    doc = Document(source)
+    body = doc.element.body
+    rendered = bool(body.xpath('.//w:lastRenderedPageBreak'))
+    breaks = './/w:lastRenderedPageBreak' if rendered else './/w:br[@w:type="page"]'
+    page, lines = 1, []
+    for p in doc.paragraphs:
+        count = len(p._p.xpath(breaks))
+        if count and lines:
+            yield _page_record("\n".join(lines), page, None)
+            lines = []
+        page += count
+        lines.append(p.text)
+    if lines:
+        yield _page_record("\n".join(lines), page, None)
+
+
+def iter_document_pages(path: str, filename: str, workers: int, pages_per_task: int, logger,
+                        task_timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+    # One text record per page (1-based 'page' in metadata), yielded while the
+    # rest of the document is still being extracted
+    if filename.lower().endswith('.pdf'):
+        yield from _iter_pdf_pages(path, workers, pages_per_task, logger, task_timeout)
+    else:
+        yield from _iter_docx_pages(path)
+
+
 def parse_file_to_records(filename: str, data: bytes, file_type: str, logger) -> List[Dict[str, Any]]:
     if file_type == 'tabular':
         if filename.lower().endswith('.csv'):
@@ -23,21 +126,6 @@ def parse_file_to_records(filename: str, data: bytes, file_type: str, logger) ->
         text = json.dumps(obj, ensure_ascii=False, indent=2)
         return [{"type": "text", "text": text, "metadata": {"format": "json"}}]
 
-    if file_type == 'document':
-        if filename.lower().endswith('.pdf'):
-            reader = PdfReader(io.BytesIO(data))
-            pages = []
-            for i, page in enumerate(reader.pages):
-                try:
-                    pages.append(page.extract_text() or "")
-                except Exception:
-                    pages.append("")
-            text = "\n".join(pages)
-        else:
-            doc = Document(io.BytesIO(data))
-            text = "\n".join([p.text for p in doc.paragraphs])
-        return [{"type": "text", "text": text, "metadata": {"format": "document"}}]
-
     if file_type == 'code':
         try:
             text = data.decode('utf-8', errors='ignore')
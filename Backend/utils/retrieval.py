@@ -1,7 +1,26 @@
+import time
 from typing import List, Dict, Any
 
-from rank_bm25 import BM25Okapi
-from sentence_transformers import CrossEncoder
+import numpy as np
+
+from utils.cache import TTLCache, normalize_query
+from utils.fusion import reciprocal_rank_fusion, fuse
+from utils.bm25 import tokenize
+from utils.lazy import LazyModel
+from utils.backends import load_cross_encoder
+
+
+def best_window(text: str, query: str, max_words: int) -> str:
+    # Keep the contiguous window of max_words words with the most query-term hits
+    words = text.split()
+    if len(words) <= max_words:
+        return text
+    terms = set(tokenize(query))
+    hits = np.fromiter((w.lower().strip('.,;:!?()[]"\'') in terms for w in words), dtype='int64', count=len(words))
+    csum = np.concatenate(([0], np.cumsum(hits)))
+    window_hits = csum[max_words:] - csum[:-max_words]
+    start = int(np.argmax(window_hits))
+    return ' '.join(words[start:start + max_words])
 
 
 class HybridRetriever:
@@ -10,24 +29,19 @@ class HybridRetriever:
         self.logger = logger
         self.store = vector_store
         self.embedding = embedding_service
-        self.cross = CrossEncoder(config.cross_encoder_name)
-        self._bm25_corpus = []
-        self._bm25 = None
-
-    def _ensure_bm25(self):
-        if self._bm25 is None:
-            corpus = []
-            for m in getattr(self.store, '_metas', []):
-                # Prefer actual text content for BM25
-                text = m.get('text') or ' '.join([str(m.get('filename', '')), str(m.get('file_type', '')), str(m.get('chunk_type', ''))])
-                corpus.append(text)
-            self._bm25_corpus = [doc.split() for doc in corpus]
-            if self._bm25_corpus:
-                self._bm25 = BM25Okapi(self._bm25_corpus)
-
-    def invalidate_bm25(self) -> None:
-        self._bm25 = None
-        self._bm25_corpus = []
+        self.cross_loader = LazyModel(
+            'reranker', lambda: load_cross_encoder(config.cross_encoder_name, config.rerank_backend), logger)
+        # (normalized query, vector id) -> cross-encoder score
+        self.rerank_cache = TTLCache(config.rerank_cache_size, config.rerank_cache_ttl)
+        vector_store.subscribe(self._on_store_change)
+
+    @property
+    def cross(self):
+        return self.cross_loader.get()
+
+    def _on_store_change(self, event: str, vector_ids: List[int]) -> None:
+        if event == 'remove':
+            self.rerank_cache.invalidate_tags(vector_ids)
 
     def _expand_queries(self, q: str, enable: bool) -> List[str]:
         if not enable:
@@ -39,48 +53,66 @@ class HybridRetriever:
         return variants
 
     def retrieve(self, q: str, top_k: int, use_bm25: bool, use_multiquery: bool, use_rerank: bool,
-                 restrict_filename: str = None, restrict_file_hash: str = None) -> List[Dict[str, Any]]:
-        sem_results = self.store.search(q, top_k * 3)
+                 restrict_filename: str = None, restrict_file_hash: str = None,
+                 nprobe: int = None, ef_search: int = None,
+                 fusion: str = None, semantic_weight: float = None) -> List[Dict[str, Any]]:
+        # Scope by file up front so the restriction is applied inside both searches
+        allowed_ids = self.store.ids_for(file_hash=restrict_file_hash, filename=restrict_filename)
+        if allowed_ids is not None and len(allowed_ids) == 0:
+            return []
+        # Variants share one encode call and one multi-row FAISS search, then get fused
+        variants = self._expand_queries(q, use_multiquery)
+        sem_lists = self.store.search_many(variants, top_k * 3, allowed_ids=allowed_ids, nprobe=nprobe, ef_search=ef_search)
+        sem_results = reciprocal_rank_fusion(sem_lists, k=self.config.rrf_k)[: top_k * 3]
 
         bm25_results: List[Dict[str, Any]] = []
         if use_bm25:
-            self._ensure_bm25()
-            if self._bm25 is not None:
-                scores = self._bm25.get_scores(q.split())
-                pairs = sorted(list(enumerate(scores)), key=lambda x: x[1], reverse=True)[: top_k * 2]
-                for idx, sc in pairs:
-                    if idx < len(getattr(self.store, '_metas', [])):
-                        meta = self.store._metas[idx]
-                        bm25_results.append({'score': float(sc), **meta})
-
-        # optional restriction by file
-        def _allowed(m: Dict[str, Any]) -> bool:
-            if restrict_file_hash and m.get('file_hash') != restrict_file_hash:
-                return False
-            if restrict_filename and m.get('filename') != restrict_filename:
-                return False
-            return True
-
-        combined = [r for r in (sem_results + bm25_results) if _allowed(r)]
-        # Deduplicate by identity
-        seen = set()
-        unique = []
-        for r in combined:
-            key = (r.get('file_hash'), r.get('metadata', {}).get('chunk_id'), r.get('chunk_type'))
-            if key not in seen:
-                seen.add(key)
-                unique.append(r)
+            bm25_results = self.store.keyword_search(q, top_k * 2, allowed_ids=allowed_ids)
+
+        # Fuse dense and keyword hits on comparable scales; this also deduplicates by vector id
+        alpha = self.config.semantic_weight if semantic_weight is None else float(semantic_weight)
+        lists = [sem_results, bm25_results] if use_bm25 else [sem_results]
+        unique = fuse(lists, method=fusion or self.config.fusion_method,
+                      weights=[alpha, 1.0 - alpha][:len(lists)], k=self.config.rrf_k)
 
         if use_rerank and unique:
-            # Use underlying text for reranking when available
-            texts = [u.get('text') or f"{u.get('filename')} {u.get('chunk_type')}" for u in unique]
-            scores = self.cross.predict([[q, t] for t in texts])
-            rescored = [{**u, 'rerank_score': float(s)} for u, s in zip(unique, scores)]
-            rescored.sort(key=lambda x: x['rerank_score'], reverse=True)
-            return rescored[:top_k]
+            return self._rerank(q, unique, top_k)
 
         return unique[:top_k]
 
+    def _passage(self, q: str, r: Dict[str, Any]) -> str:
+        # Use underlying text for reranking when available
+        text = r.get('text') or f"{r.get('filename')} {r.get('chunk_type')}"
+        budget = self.config.rerank_max_words - len(q.split())
+        return best_window(text, q, max(budget, 16))
+
+    def _rerank(self, q: str, candidates: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        # Budgeted: capped candidate count, truncated passages, batched predict and a
+        # deadline after which the fused order is returned as is. Candidates past the
+        # cap follow the reranked ones in fused order, so top_k is still filled
+        rest = candidates[self.config.rerank_max_candidates:]
+        candidates = candidates[: self.config.rerank_max_candidates]
+        deadline = time.monotonic() + self.config.rerank_deadline_ms / 1000.0
+        # Only pairs not scored recently go through the cross-encoder
+        qkey = normalize_query(q)
+        scores = [self.rerank_cache.get((qkey, c.get('vector_id'))) for c in candidates]
+        todo = [i for i, s in enumerate(scores) if s is None]
+        batch = max(1, self.config.rerank_batch_size)
+        for start in range(0, len(todo), batch):
+            if time.monotonic() > deadline:
+                self.logger.info('Rerank deadline hit after %d/%d pairs, keeping fused order', start, len(todo))
+                scored = [{**c, 'rerank_score': s} if s is not None else dict(c) for c, s in zip(candidates, scores)]
+                return (scored + rest)[:top_k]
+            part = todo[start:start + batch]
+            predicted = self.cross.predict([[q, self._passage(q, candidates[i])] for i in part], batch_size=batch)
+            for i, s in zip(part, predicted):
+                vid = candidates[i].get('vector_id')
+                scores[i] = float(s)
+                self.rerank_cache.put((qkey, vid), float(s), tags=(vid,))
+        rescored = [{**c, 'rerank_score': float(s)} for c, s in zip(candidates, scores)]
+        rescored.sort(key=lambda x: x['rerank_score'], reverse=True)
+        return (rescored + rest)[:top_k]
+
     def format_context(self, results: List[Dict[str, Any]]) -> str:
         lines = []
         for r in results:
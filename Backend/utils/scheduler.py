@@ -0,0 +1,97 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+
+class QueueFull(Exception):
+    pass
+
+
+class BatchScheduler:
+    # Collects work items that arrive within a short window and hands them to
+    # `run_batch` together, so concurrent callers share one forward pass.
+    # `run_batch(items)` must return one result per item, in order.
+    def __init__(self, config, logger, run_batch: Callable[[List[Any]], List[Any]], name: str = 'batch') -> None:
+        self.config = config
+        self.logger = logger
+        self.run_batch = run_batch
+        self.max_batch = max(1, config.gen_max_batch)
+        self.max_wait = max(0, config.gen_max_wait_ms) / 1000.0
+        self._queue: 'queue.Queue' = queue.Queue(maxsize=max(1, config.gen_queue_size))
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.batches = 0
+        self.batched_items = 0
+        self.max_depth = 0
+        self.last_batch_ms = 0.0
+        self._worker = threading.Thread(target=self._loop, daemon=True, name=f'{name}-scheduler')
+        self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        future: Future = Future()
+        try:
+            self._queue.put_nowait((item, future))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise QueueFull(f'queue is full ({self._queue.maxsize} pending)')
+        with self._lock:
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+        return future
+
+    def full(self) -> bool:
+        # Admission check for callers that must answer 429 before submitting
+        return self._queue.full()
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            batch = [(item, fut) for item, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            start = time.perf_counter()
+            try:
+                results = self.run_batch([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f'batch returned {len(results)} results for {len(batch)} items')
+                for (_, fut), res in zip(batch, results):
+                    fut.set_result(res)
+            except Exception as exc:
+                self.logger.exception('Batch of %d items failed', len(batch))
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(exc)
+            with self._lock:
+                self.batches += 1
+                self.batched_items += len(batch)
+                self.last_batch_ms = (time.perf_counter() - start) * 1000.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'queue_capacity': self._queue.maxsize,
+                'max_queue_depth': self.max_depth,
+                'max_batch': self.max_batch,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'batches': self.batches,
+                'avg_batch_size': (self.batched_items / self.batches) if self.batches else 0.0,
+                'last_batch_ms': round(self.last_batch_ms, 2),
+            }
@@ -0,0 +1,237 @@
+import os
+import json
+import shutil
+import threading
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+import faiss
+
+from utils.metastore import MetaStore
+from utils.bm25 import BM25Index
+
+
+def _atomic_write(path: str, write_fn, binary: bool = False) -> None:
+    # Write to a temp file, fsync, then rename over the target so readers
+    # never observe a half-written file.
+    tmp = f'{path}.tmp'
+    mode = 'wb' if binary else 'w'
+    kwargs = {} if binary else {'encoding': 'utf-8'}
+    with open(tmp, mode, **kwargs) as f:
+        write_fn(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# IO_FLAG_MMAP only maps IVF inverted lists; flat codes (the IndexIDMap2 base)
+# need IO_FLAG_MMAP_IFC, which older faiss builds lack
+_MMAP_FLAGS = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+
+# On-disk layout: a compacted base (FAISS index + columnar metadata) plus an ordered
+# list of segments in manifest.json. An 'add' segment holds the vectors and metas
+# of one index_chunks call, a 'delete' segment the ids dropped by one remove_file.
+# The manifest is the commit point: segment files are written first and only
+# become part of the store once a manifest listing them is renamed into place.
+
+
+class SegmentLog:
+
+    MANIFEST_VERSION = 1
+
+    def __init__(self, vector_dir: str, logger) -> None:
+        self.vector_dir = vector_dir
+        self.logger = logger
+        self.segment_dir = os.path.join(vector_dir, 'segments')
+        self.manifest_path = os.path.join(vector_dir, 'manifest.json')
+        os.makedirs(self.segment_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.manifest = self._read_manifest()
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        base = None
+        # Stores written before the segment log existed are adopted as the base
+        if os.path.exists(os.path.join(self.vector_dir, 'faiss.index')) and \
+                os.path.exists(os.path.join(self.vector_dir, 'metadata.jsonl')):
+            base = {'index': 'faiss.index', 'metadata': 'metadata.jsonl'}
+        return {'version': self.MANIFEST_VERSION, 'generation': 0, 'next_segment': 1, 'base': base, 'segments': []}
+
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        manifest = {**manifest, 'generation': int(manifest.get('generation', 0)) + 1}
+        _atomic_write(self.manifest_path, lambda f: json.dump(manifest, f, indent=2))
+        self.manifest = manifest
+
+    def reload(self) -> bool:
+        # Re-read the manifest another process may have replaced; True if it changed
+        with self._lock:
+            manifest = self._read_manifest()
+            changed = manifest.get('generation') != self.manifest.get('generation')
+            self.manifest = manifest
+        return changed
+
+    @property
+    def generation(self) -> int:
+        return int(self.manifest.get('generation', 0))
+
+    @property
+    def num_segments(self) -> int:
+        return len(self.manifest.get('segments', []))
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.vector_dir, name)
+
+    # Reading
+
+    def load_base_index(self, mmap: bool = False):
+        base = self.manifest.get('base')
+        if not base:
+            return None
+        # Memory-mapped bases share their pages between processes and must not be modified
+        return faiss.read_index(self._path(base['index']), _MMAP_FLAGS if mmap else 0)
+
+    def load_base(self, mmap: bool = False):
+        if not self.manifest.get('base'):
+            return None, MetaStore()
+        return self.load_base_index(mmap), self.load_base_meta()
+
+    def load_base_meta(self) -> MetaStore:
+        base = self.manifest.get('base')
+        if not base:
+            return MetaStore()
+        meta_path = self._path(base['metadata'])
+        if os.path.isdir(meta_path):
+            return MetaStore.load(meta_path)
+        # JSONL bases from older versions; rewritten as columns on the next compaction.
+        # Rows without ids predate the id map, where the row number was the id.
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        for i, m in enumerate(rows):
+            m.setdefault('vector_id', i)
+        return MetaStore.from_rows(rows)
+
+    def load_bm25(self) -> Optional[BM25Index]:
+        # BM25 postings saved with the base (memory-mapped); None for bases written without them
+        base = self.manifest.get('base') or {}
+        if not base.get('bm25'):
+            return None
+        return BM25Index.load(self._path(base['bm25']))
+
+    def load_ann(self, index_type: str, mmap: bool = False):
+        # (approximate index over the base vectors, ids it still holds after deletion) or
+        # (None, 0) when the base has none of this type. IVF lists are memory-mapped
+        # with mmap=True; HNSW graphs are always read into memory.
+        base = self.manifest.get('base') or {}
+        if not base.get('ann') or base.get('ann_type') != index_type:
+            return None, 0
+        index = faiss.read_index(self._path(base['ann']), _MMAP_FLAGS if mmap else 0)
+        return index, int(base.get('ann_stale', 0))
+
+    def iter_segments(self, after_seq: int = 0):
+        for seg in self.manifest.get('segments', []):
+            if seg['seq'] <= after_seq:
+                continue
+            if seg['kind'] == 'add':
+                vectors = np.load(self._path(seg['vectors']))
+                with open(self._path(seg['metadata']), 'r', encoding='utf-8') as f:
+                    metas = [json.loads(line) for line in f]
+                yield 'add', vectors, metas
+            elif seg['kind'] == 'delete':
+                with open(self._path(seg['ids']), 'r', encoding='utf-8') as f:
+                    ids = json.load(f)
+                yield 'delete', np.asarray(ids, dtype='int64'), None
+
+    # Appending
+
+    def append_add(self, vectors: np.ndarray, metas: List[Dict[str, Any]], next_vector_id: int) -> None:
+        with self._lock:
+            manifest = dict(self.manifest)
+            seq = int(manifest.get('next_segment', 1))
+            vec_name = os.path.join('segments', f'seg-{seq:06d}.npy')
+            meta_name = os.path.join('segments', f'seg-{seq:06d}.jsonl')
+            _atomic_write(self._path(vec_name), lambda f: np.save(f, vectors), binary=True)
+            _atomic_write(self._path(meta_name), lambda f: f.writelines(
+                json.dumps(m, ensure_ascii=False) + '\n' for m in metas))
+            manifest['segments'] = manifest.get('segments', []) + [
+                {'seq': seq, 'kind': 'add', 'vectors': vec_name, 'metadata': meta_name}
+            ]
+            manifest['next_segment'] = seq + 1
+            # Kept in the manifest so ids stay unique even after the newest ones are deleted
+            manifest['next_vector_id'] = max(int(manifest.get('next_vector_id', 0)), next_vector_id)
+            self._write_manifest(manifest)
+
+    def append_delete(self, ids: List[int]) -> None:
+        with self._lock:
+            manifest = dict(self.manifest)
+            seq = int(manifest.get('next_segment', 1))
+            ids_name = os.path.join('segments', f'seg-{seq:06d}.del.json')
+            _atomic_write(self._path(ids_name), lambda f: json.dump([int(i) for i in ids], f))
+            manifest['segments'] = manifest.get('segments', []) + [{'seq': seq, 'kind': 'delete', 'ids': ids_name}]
+            manifest['next_segment'] = seq + 1
+            self._write_manifest(manifest)
+
+    # Compaction
+
+    def compact(self, index, meta: MetaStore, upto_seq: Optional[int] = None, bm25: Optional[BM25Index] = None,
+                ann=None, ann_type: Optional[str] = None, ann_stale: int = 0) -> None:
+        # index/meta become the new base covering every segment up to upto_seq;
+        # segments appended after that snapshot stay and are replayed on top of it.
+        # BM25 postings and an approximate index of the same snapshot are saved
+        # with it, so other processes load them instead of rebuilding.
+        with self._lock:
+            # Every compaction gets new file names, even with no segments in between,
+            # so files the current manifest points to are never written over
+            seq = max(int(self.manifest.get('next_base', 0)), int(self.manifest.get('next_segment', 1)))
+            self.manifest = {**self.manifest, 'next_base': seq + 1}
+        entry = {'index': f'base-{seq:06d}.index', 'metadata': f'base-{seq:06d}.meta'}
+        # The heavy writes happen outside the lock so appends are not blocked
+        faiss.write_index(index, self._path(entry['index']) + '.tmp')
+        os.replace(self._path(entry['index']) + '.tmp', self._path(entry['index']))
+        self._write_dir(entry['metadata'], meta.save)
+        if bm25 is not None:
+            entry['bm25'] = f'base-{seq:06d}.bm25'
+            self._write_dir(entry['bm25'], bm25.save)
+        if ann is not None:
+            entry.update({'ann': f'base-{seq:06d}.ann', 'ann_type': ann_type, 'ann_stale': int(ann_stale)})
+            faiss.write_index(ann, self._path(entry['ann']) + '.tmp')
+            os.replace(self._path(entry['ann']) + '.tmp', self._path(entry['ann']))
+        with self._lock:
+            manifest = dict(self.manifest)
+            old_base = manifest.get('base')
+            folded = [s for s in manifest.get('segments', []) if upto_seq is None or s['seq'] <= upto_seq]
+            manifest['segments'] = [s for s in manifest.get('segments', []) if s not in folded]
+            manifest['base'] = entry
+            self._write_manifest(manifest)
+        # Old files are unreachable once the new manifest is in place
+        stale = [old_base.get(k) for k in ('index', 'metadata', 'bm25', 'ann')] if old_base else []
+        for seg in folded:
+            stale.extend(seg.get(k) for k in ('vectors', 'metadata', 'ids'))
+        for name in stale:
+            if not name or name in entry.values():
+                continue
+            try:
+                if os.path.isdir(self._path(name)):
+                    shutil.rmtree(self._path(name))
+                else:
+                    os.remove(self._path(name))
+            except OSError:
+                pass
+        self.logger.info('Compacted %d segments into %s', len(folded), entry['index'])
+
+    def _write_dir(self, name: str, save) -> None:
+        # Leftovers of a compaction that failed before its manifest was written
+        for path in (self._path(name) + '.tmp', self._path(name)):
+            shutil.rmtree(path, ignore_errors=True)
+        try:
+            save(self._path(name) + '.tmp')
+            os.replace(self._path(name) + '.tmp', self._path(name))
+        except Exception:
+            shutil.rmtree(self._path(name) + '.tmp', ignore_errors=True)
+            raise
+
+    def last_seq(self) -> int:
+        segments = self.manifest.get('segments', [])
+        return int(segments[-1]['seq']) if segments else 0
@@ -0,0 +1,400 @@
+import os
+import re
+import json
+import shutil
+import threading
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.segments import _atomic_write
+
+
+_SAFE_NAME_RE = re.compile(r'[0-9A-Za-z_\-]+')
+
+# Rows per block of the min/max statistics kept for numeric columns; filters
+# skip blocks whose range cannot match
+BLOCK_ROWS = 65536
+
+
+def _kind_of(series: pd.Series):
+    # (kind, numpy dtype) a column is stored as
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype) and not series.isna().any():
+        return 'bool', 'bool'
+    if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+        if pd.api.types.is_extension_array_dtype(dtype) or dtype.kind not in 'iuf':
+            return 'num', 'float64'
+        return 'num', np.dtype(dtype).name
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'datetime', 'datetime64[ns]'
+    return 'str', None
+
+
+def _merge_kind(old, new):
+    # Widest storage that holds both the stored rows and a new batch
+    if old == new:
+        return old
+    if old[0] in ('num', 'bool') and new[0] in ('num', 'bool'):
+        return 'num', np.result_type(np.dtype(old[1]), np.dtype(new[1])).name
+    return 'str', None
+
+
+def _fill_kind(kind):
+    # Storage able to represent rows missing from a batch
+    if kind[0] == 'num' and np.dtype(kind[1]).kind in 'iub':
+        return 'num', 'float64'
+    if kind[0] == 'bool':
+        return 'num', 'float64'
+    return kind
+
+
+def _fill(kind, n: int):
+    if kind[0] == 'str':
+        return [''] * n
+    if kind[0] == 'datetime':
+        return np.full(n, np.datetime64('NaT'), dtype='datetime64[ns]')
+    return np.full(n, np.nan, dtype=kind[1])
+
+
+def _encode(series: pd.Series, kind) -> Any:
+    if kind[0] == 'str':
+        return ['' if v is None or (isinstance(v, float) and np.isnan(v)) else str(v)
+                for v in series.astype(object).tolist()]
+    if kind[0] == 'datetime':
+        if getattr(series.dt, 'tz', None) is not None:
+            series = series.dt.tz_convert('UTC').dt.tz_localize(None)
+        return series.to_numpy(dtype='datetime64[ns]')
+    if kind[0] == 'bool':
+        return series.to_numpy(dtype='bool')
+    return series.to_numpy(dtype=kind[1], na_value=np.nan) if np.dtype(kind[1]).kind == 'f' \
+        else series.to_numpy(dtype=kind[1])
+
+
+def _stringify(values: np.ndarray) -> List[str]:
+    return ['' if pd.isna(v) else str(v) for v in pd.Series(values).tolist()]
+
+
+class ColumnarTable:
+    # Read side of one stored table. Fixed-width columns are memory-mapped and
+    # sliced on demand; string columns are an offsets array into a UTF-8 blob and
+    # only the requested rows are decoded.
+    def __init__(self, path: str, schema: Dict[str, Any]) -> None:
+        self.path = path
+        self.schema = schema
+        self.filename = schema.get('filename')
+        self.num_rows = int(schema['rows'])
+        self._columns = {c['name']: c for c in schema['columns']}
+        self._maps: Dict[str, Any] = {}
+
+    @property
+    def columns(self) -> List[str]:
+        return [c['name'] for c in self.schema['columns']]
+
+    def kind(self, name: str) -> Optional[str]:
+        col = self._columns.get(name)
+        return col['kind'] if col else None
+
+    def _map(self, name: str, suffix: str, dtype: str, length: int):
+        key = f'{name}\0{suffix}'
+        arr = self._maps.get(key)
+        if arr is None:
+            if length == 0:
+                arr = np.zeros(0, dtype=dtype)
+            else:
+                arr = np.memmap(os.path.join(self.path, self._columns[name]['file'] + suffix),
+                                dtype=dtype, mode='r', shape=(length,))
+            self._maps[key] = arr
+        return arr
+
+    def values(self, name: str, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        col = self._columns[name]
+        stop = self.num_rows if stop is None else min(stop, self.num_rows)
+        start = min(start, stop)
+        if col['kind'] != 'str':
+            return np.asarray(self._map(name, '.bin', col['dtype'], self.num_rows)[start:stop])
+        ends = self._map(name, '.off', 'int64', self.num_rows)
+        size = int(ends[-1]) if self.num_rows else 0
+        blob = self._map(name, '.bin', 'uint8', size)
+        bounds = np.concatenate([[int(ends[start - 1]) if start else 0], ends[start:stop]]).astype('int64')
+        raw = bytes(blob[bounds[0]:bounds[-1]])
+        rel = (bounds - bounds[0]).tolist()
+        out = np.empty(stop - start, dtype=object)
+        out[:] = [raw[rel[i]:rel[i + 1]].decode('utf-8') for i in range(stop - start)]
+        return out
+
+    def take(self, name: str, rows: np.ndarray) -> np.ndarray:
+        # Values at the given row numbers; only those rows' pages (or bytes) are read
+        col = self._columns[name]
+        rows = np.asarray(rows, dtype='int64')
+        if col['kind'] != 'str':
+            return np.asarray(self._map(name, '.bin', col['dtype'], self.num_rows)[rows])
+        ends = self._map(name, '.off', 'int64', self.num_rows)
+        blob = self._map(name, '.bin', 'uint8', int(ends[-1]) if self.num_rows else 0)
+        stops = np.asarray(ends[rows], dtype='int64')
+        starts = np.where(rows > 0, np.asarray(ends[np.maximum(rows - 1, 0)], dtype='int64'), 0)
+        out = np.empty(len(rows), dtype=object)
+        out[:] = [bytes(blob[a:b]).decode('utf-8') for a, b in zip(starts.tolist(), stops.tolist())]
+        return out
+
+    def candidate_ranges(self, filters: List[Any]) -> List[Any]:
+        # (start, stop) row ranges that may hold rows matching every numeric
+        # (column, op, value) filter, judged from the per-block min/max only
+        keep = np.ones((self.num_rows + BLOCK_ROWS - 1) // BLOCK_ROWS, dtype=bool)
+        for name, op, value in filters:
+            blocks = self._columns.get(name, {}).get('blocks')
+            if blocks is None or len(blocks) != len(keep):
+                continue
+            for b, (lo, hi) in enumerate(blocks):
+                if lo is None:
+                    # Only missing values: nothing but != can match
+                    keep[b] &= op == 'ne'
+                elif op == 'gt':
+                    keep[b] &= hi > value
+                elif op == 'ge':
+                    keep[b] &= hi >= value
+                elif op == 'lt':
+                    keep[b] &= lo < value
+                elif op == 'le':
+                    keep[b] &= lo <= value
+                elif op == 'eq':
+                    keep[b] &= lo <= value <= hi
+        ranges = []
+        for b in np.nonzero(keep)[0].tolist():
+            start, stop = b * BLOCK_ROWS, min(self.num_rows, (b + 1) * BLOCK_ROWS)
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], stop)
+            else:
+                ranges.append((start, stop))
+        return ranges
+
+    def schema_column(self, name: str) -> Dict[str, Any]:
+        # Storage kind, dtype and (for numeric columns) count/sum/min/max computed
+        # at write time, so aggregates need no column data
+        return self._columns.get(name) or {}
+
+    def head(self, n: int) -> pd.DataFrame:
+        return self.to_frame(stop=n)
+
+    def to_frame(self, columns: Optional[List[str]] = None, start: int = 0,
+                 stop: Optional[int] = None) -> pd.DataFrame:
+        names = [c for c in (columns or self.columns) if c in self._columns]
+        return pd.DataFrame({name: self.values(name, start, stop) for name in names}, columns=names)
+
+
+class TableStore:
+    # One cleaned table per tabular file under vectorstore/tables/<file_hash>/:
+    # a column file per column plus schema.json with the row count, storage kind and
+    # aggregates of each column. Appends write past the committed row count (a column
+    # widened by the batch is rewritten to files of a new generation) and then
+    # atomically replace schema.json, so readers never see a partial batch.
+    def __init__(self, config, logger, read_only: bool = False) -> None:
+        self.logger = logger
+        self.read_only = read_only
+        self.root = os.path.join(config.vector_dir, 'tables')
+        if not read_only:
+            os.makedirs(self.root, exist_ok=True)
+        # file_hash -> (schema version, table); reopened when schema.json is replaced
+        self._open: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _dir(self, file_hash: str) -> Optional[str]:
+        if not file_hash or not _SAFE_NAME_RE.fullmatch(file_hash):
+            return None
+        return os.path.join(self.root, file_hash)
+
+    @staticmethod
+    def _read_schema(path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(path, 'schema.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, file_hash: str) -> Optional[ColumnarTable]:
+        path = self._dir(file_hash)
+        if path is None:
+            return None
+        try:
+            st = os.stat(os.path.join(path, 'schema.json'))
+            mtime = (st.st_mtime_ns, st.st_ino)
+        except OSError:
+            self._open.pop(file_hash, None)
+            return None
+        cached = self._open.get(file_hash)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        schema = self._read_schema(path)
+        if schema is None:
+            return None
+        table = ColumnarTable(path, schema)
+        self._open[file_hash] = (mtime, table)
+        return table
+
+    def has(self, file_hash: str) -> bool:
+        path = self._dir(file_hash)
+        return path is not None and os.path.exists(os.path.join(path, 'schema.json'))
+
+    def hashes(self) -> List[str]:
+        try:
+            return [name for name in os.listdir(self.root) if self.has(name)]
+        except OSError:
+            return []
+
+    def forget(self, file_hash: str) -> None:
+        self._open.pop(file_hash, None)
+
+    def remove(self, file_hash: str) -> None:
+        self.forget(file_hash)
+        path = self._dir(file_hash)
+        if path is not None and not self.read_only:
+            shutil.rmtree(path, ignore_errors=True)
+
+    # Writing
+
+    def append(self, file_hash: str, filename: str, df: pd.DataFrame) -> None:
+        path = self._dir(file_hash)
+        if path is None or self.read_only or df is None or not len(df.columns):
+            return
+        with self._lock:
+            os.makedirs(path, exist_ok=True)
+            schema = self._read_schema(path) or {'filename': filename, 'rows': 0, 'columns': []}
+            # Column files replaced by the previous append; readers have had a batch to move on
+            self._remove_files(path, schema.pop('retired', []))
+            retired = []
+            n_old, n_new = int(schema['rows']), len(df)
+            cols = {c['name']: c for c in schema['columns']}
+            seen = set()
+            for i in range(len(df.columns)):
+                name = str(df.columns[i])
+                if name in seen:
+                    continue
+                seen.add(name)
+                series = df.iloc[:, i]
+                kind = _kind_of(series)
+                col = cols.get(name)
+                if col is None:
+                    if n_old:
+                        kind = _fill_kind(kind)
+                    col = {'name': name, 'file': str(len(schema['columns'])), 'kind': kind[0], 'dtype': kind[1]}
+                    if kind[0] == 'num':
+                        col['agg'] = {}
+                    schema['columns'].append(col)
+                    cols[name] = col
+                    self._write(path, col, 0, _fill(kind, n_old))
+                target = _merge_kind((col['kind'], col['dtype']), kind)
+                if target != (col['kind'], col['dtype']):
+                    retired.append(self._convert(path, col, n_old, target))
+                values = _encode(series, target)
+                self._write(path, col, n_old, values)
+                self._update_agg(col, values)
+            for name, col in cols.items():
+                if name not in seen and n_new:
+                    target = _fill_kind((col['kind'], col['dtype']))
+                    if target != (col['kind'], col['dtype']):
+                        retired.append(self._convert(path, col, n_old, target))
+                    self._write(path, col, n_old, _fill(target, n_new))
+            schema['rows'] = n_old + n_new
+            schema['filename'] = filename
+            if retired:
+                schema['retired'] = retired
+            _atomic_write(os.path.join(path, 'schema.json'), lambda f: json.dump(schema, f))
+            self.forget(file_hash)
+
+    def _write(self, path: str, col: Dict[str, Any], at_row: int, values) -> None:
+        # Writes rows starting at at_row, dropping anything an interrupted append left behind
+        base = os.path.join(path, col['file'])
+        if col['kind'] != 'str':
+            arr = np.ascontiguousarray(values, dtype=col['dtype'])
+            self._write_at(base + '.bin', at_row * arr.dtype.itemsize, arr.tobytes())
+            if col['kind'] == 'num':
+                self._update_blocks(col, at_row, arr)
+            return
+        start = 0
+        if at_row:
+            start = int(np.memmap(base + '.off', dtype='int64', mode='r', shape=(at_row,))[-1])
+        encoded = [v.encode('utf-8') for v in values]
+        ends = start + np.cumsum([len(b) for b in encoded], dtype='int64') if encoded else np.zeros(0, dtype='int64')
+        self._write_at(base + '.bin', start, b''.join(encoded))
+        self._write_at(base + '.off', at_row * 8, ends.astype('int64').tobytes())
+
+    @staticmethod
+    def _write_at(file_path: str, offset: int, data: bytes) -> None:
+        with open(file_path, 'r+b' if os.path.exists(file_path) else 'w+b') as f:
+            f.seek(offset)
+            f.truncate()
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _convert(self, path: str, col: Dict[str, Any], rows: int, target) -> str:
+        # Rewrites the stored rows of a column in a wider kind (int -> float, anything -> str)
+        # into files of a new generation; the committed schema.json keeps pointing at the old
+        # ones until it is replaced. Returns the old file name for later removal.
+        current = ColumnarTable(path, {'rows': rows, 'columns': [col]}).values(col['name'])
+        old = col['file']
+        gen = int(col.get('gen', 0)) + 1
+        col['gen'] = gen
+        col['file'] = f"{old.split('-', 1)[0]}-{gen}"
+        # Left over by an append that never committed
+        self._remove_files(path, [col['file']])
+        col['kind'], col['dtype'] = target
+        col.pop('agg', None)
+        col.pop('blocks', None)
+        if target[0] == 'str':
+            values = _stringify(current) if len(current) else []
+        else:
+            values = current.astype(target[1])
+            col['agg'] = {}
+            self._update_agg(col, values)
+        self._write(path, col, 0, values)
+        return old
+
+    @staticmethod
+    def _remove_files(path: str, names: List[str]) -> None:
+        for name in names:
+            for suffix in ('.bin', '.off'):
+                try:
+                    os.remove(os.path.join(path, name + suffix))
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _update_agg(col: Dict[str, Any], values) -> None:
+        if col['kind'] != 'num' or not len(values):
+            return
+        arr = np.asarray(values)
+        valid = arr[~np.isnan(arr)] if arr.dtype.kind == 'f' else arr
+        if not len(valid):
+            return
+        cast = float if arr.dtype.kind == 'f' else int
+        agg = col.setdefault('agg', {})
+        agg['count'] = int(agg.get('count', 0)) + len(valid)
+        agg['sum'] = cast(agg.get('sum', 0)) + cast(valid.sum())
+        agg['min'] = cast(valid.min()) if 'min' not in agg else min(agg['min'], cast(valid.min()))
+        agg['max'] = cast(valid.max()) if 'max' not in agg else max(agg['max'], cast(valid.max()))
+
+    @staticmethod
+    def _update_blocks(col: Dict[str, Any], at_row: int, values: np.ndarray) -> None:
+        blocks = col.setdefault('blocks', [])
+        b = at_row // BLOCK_ROWS
+        # A partially filled last block is merged with the new rows
+        del blocks[b + (1 if at_row % BLOCK_ROWS else 0):]
+        arr = np.asarray(values, dtype='float64')
+        pos = 0
+        while pos < len(arr):
+            end = min(len(arr), (b + 1) * BLOCK_ROWS - at_row)
+            chunk = arr[pos:end]
+            valid = chunk[~np.isnan(chunk)]
+            lo, hi = (float(valid.min()), float(valid.max())) if len(valid) else (None, None)
+            if b < len(blocks):
+                old_lo, old_hi = blocks[b]
+                if old_lo is not None:
+                    lo = old_lo if lo is None else min(lo, old_lo)
+                    hi = old_hi if hi is None else max(hi, old_hi)
+                blocks[b] = [lo, hi]
+            else:
+                blocks.append([lo, hi])
+            pos = end
+            b += 1
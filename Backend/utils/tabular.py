@@ -1,39 +1,371 @@
-from typing import List, Optional, Any
+from typing import List, Dict, Optional, Any
 import re
+import numpy as np
 import pandas as pd
 
 
+_AGG_WORDS = {
+    'sum': 'sum', 'total': 'sum',
+    'avg': 'avg', 'average': 'avg', 'mean': 'avg',
+    'max': 'max', 'maximum': 'max', 'highest': 'max', 'largest': 'max',
+    'min': 'min', 'minimum': 'min', 'lowest': 'min', 'smallest': 'min',
+    'count': 'count', 'how many': 'count', 'number of': 'count',
+}
+_AGG_RE = re.compile(r'\b(' + '|'.join(sorted(_AGG_WORDS, key=len, reverse=True)) + r')\b')
+
+# Clause keywords; each clause runs until the next keyword
+_CLAUSE_RE = re.compile(
+    r'\b(where|with|having|whose|(?:sort(?:ed)?|order(?:ed)?)\s+by|group(?:ed)?\s+by|per|by|'
+    r'(?:top|bottom|first|limit)\s+\d+)\b')
+
+_OPS = [
+    ('greater than or equal to', 'ge'), ('less than or equal to', 'le'),
+    ('greater than', 'gt'), ('more than', 'gt'), ('above', 'gt'), ('over', 'gt'),
+    ('less than', 'lt'), ('below', 'lt'), ('under', 'lt'),
+    ('at least', 'ge'), ('at most', 'le'),
+    ('is not', 'ne'), ('not', 'ne'), ('equal to', 'eq'), ('equals', 'eq'), ('is', 'eq'),
+    ('contains', 'contains'), ('like', 'contains'),
+    ('>=', 'ge'), ('<=', 'le'), ('!=', 'ne'), ('<>', 'ne'), ('==', 'eq'), ('=', 'eq'), ('>', 'gt'), ('<', 'lt'),
+]
+_OP_RE = re.compile(r'^\s*(' + '|'.join(re.escape(w) if not w[0].isalpha() else r'\b' + re.escape(w) + r'\b'
+                                        for w, _ in _OPS) + r')\s*(.+?)\s*$')
+_OP_NAMES = dict(_OPS)
+
+_COMPARE = {'gt': np.greater, 'ge': np.greater_equal, 'lt': np.less, 'le': np.less_equal,
+            'eq': np.equal, 'ne': np.not_equal}
+
+_COL_TOKEN_RE = re.compile(r'§(\d+)§')
+
+# A column followed by a comparison: a filter the clauses must have picked up
+_FILTER_HINT_RE = re.compile(r'§\d+§\s*(?:is\s+)?(?:' + '|'.join(
+    re.escape(w) if not w[0].isalpha() else r'\b' + re.escape(w) + r'\b'
+    for w, op in _OPS if op not in ('eq', 'ne', 'contains')) + r')')
+
+_ASC_RE = re.compile(r'\b(asc|ascending|lowest|smallest)\b')
+_DESC_RE = re.compile(r'\b(desc|descending|highest|largest)\b')
+
+
+class QueryPlan:
+    # What the planner understood: optional aggregate over a column, grouping,
+    # filters (column, op, value), sort (column, ascending) and a row limit
+    def __init__(self) -> None:
+        self.op: Optional[str] = None
+        self.column: Optional[str] = None
+        self.group_by: Optional[str] = None
+        self.filters: List[Any] = []
+        self.sort: Optional[Any] = None
+        self.limit: Optional[int] = None
+        self.rows_requested = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'op': self.op, 'column': self.column, 'group_by': self.group_by,
+                'filters': [list(f) for f in self.filters], 'sort': list(self.sort) if self.sort else None,
+                'limit': self.limit}
+
+
 class TabularQueryEngine:
-    def __init__(self, logger) -> None:
+    def __init__(self, config, logger) -> None:
         self.logger = logger
+        # Most rows returned by row-listing queries
+        self.max_rows = config.tabular_max_rows
 
     def looks_tabular_query(self, q: str) -> bool:
         ql = q.lower()
-        return any(k in ql for k in ['sum', 'average', 'avg', 'top', 'max', 'min']) and any(k in ql for k in ['column', 'col', 'by', 'rows'])
+        return any(k in ql for k in ['sum', 'average', 'avg', 'mean', 'total', 'count', 'how many', 'top', 'max',
+                                     'min', 'where', 'sort', 'order by', 'group by']) \
+            and any(k in ql for k in ['column', 'col', 'by', 'per', 'rows', 'where', 'records'])
 
-    def execute(self, q: str, frames: List[pd.DataFrame]) -> Optional[Any]:
-        if not frames:
+    # Planning
+
+    def plan(self, q: str, tables: List[Any]) -> Optional[QueryPlan]:
+        # None when the question does not name anything the tables hold
+        columns: List[str] = []
+        kinds: Dict[str, str] = {}
+        for table in tables:
+            for name in table.columns:
+                if name not in kinds:
+                    columns.append(name)
+                    kinds[name] = table.kind(name)
+        text = ' ' + q.lower() + ' '
+        # Column names become atomic tokens first, so 'price per unit' is never split at 'per'
+        for i in sorted(range(len(columns)), key=lambda i: -len(columns[i])):
+            words = [re.escape(w) for w in re.split(r'[\s_]+', columns[i].lower()) if w]
+            if words:
+                # Plurals too: 'top 3 regions' names the region column
+                text = re.sub(r'(?<![\w§])' + r'[\s_]+'.join(words) + r'(?:e?s)?(?![\w§])', f' §{i}§ ', text)
+
+        def column_in(fragment: str) -> Optional[str]:
+            m = _COL_TOKEN_RE.search(fragment)
+            return columns[int(m.group(1))] if m else None
+
+        plan = QueryPlan()
+        plan.rows_requested = bool(re.search(r'\b(rows?|records?)\b', text))
+        clauses = list(_CLAUSE_RE.finditer(text))
+        lead = text[:clauses[0].start()] if clauses else text
+        agg = _AGG_RE.search(lead)
+        if agg:
+            plan.op = _AGG_WORDS[agg.group(1)]
+            plan.column = column_in(lead[agg.end():])
+            if plan.op != 'count' and plan.column is None:
+                return None
+        # Set by top/bottom: the direction of the sort that follows, and the column
+        # named in between ('top 3 regions by ...')
+        top_ascending: Optional[bool] = None
+        top_column: Optional[str] = None
+        for i, clause in enumerate(clauses):
+            keyword = re.sub(r'\s+', ' ', clause.group(1))
+            body = text[clause.end():clauses[i + 1].start() if i + 1 < len(clauses) else len(text)]
+            head = keyword.split(' ')[0]
+            if head in ('top', 'bottom', 'first', 'limit'):
+                plan.limit = int(keyword.split(' ')[1])
+                if head in ('top', 'bottom'):
+                    top_ascending = head == 'bottom'
+                    top_column = column_in(body)
+                    if top_column and plan.op is None:
+                        plan.sort = (top_column, top_ascending)
+                    elif plan.op is not None:
+                        # top N groups by the aggregate
+                        plan.sort = (None, top_ascending)
+            elif keyword in ('where', 'with', 'having', 'whose'):
+                for cond in re.split(r'\s+and\s+(?=§)', body.strip()):
+                    parsed = self._parse_filter(cond, columns, kinds)
+                    if parsed is None:
+                        return None
+                    plan.filters.append(parsed)
+            elif head in ('sort', 'sorted', 'order', 'ordered'):
+                col = column_in(body)
+                if col is None and not (plan.op and re.search(r'\b(sum|avg|average|count|max|min|value)\b', body)):
+                    return None
+                plan.sort = (col, self._ascending(body, top_ascending))
+            else:
+                # by / per / group by: grouping under an aggregate, otherwise a sort
+                col = column_in(body)
+                if col is None:
+                    return None
+                agg = _AGG_RE.search(body)
+                if plan.op is not None:
+                    plan.group_by = col
+                elif top_ascending is not None and agg and top_column and top_column != col:
+                    # 'top 3 regions by total revenue': groups ranked by the aggregate
+                    plan.op, plan.column, plan.group_by = _AGG_WORDS[agg.group(1)], col, top_column
+                    plan.sort = (None, top_ascending)
+                else:
+                    plan.sort = (col, self._ascending(body, top_ascending))
+        if plan.op is None and not plan.filters and plan.sort is None and plan.limit is None:
+            return None
+        if not plan.filters and _FILTER_HINT_RE.search(text):
+            # A comparison the clauses did not pick up; answering without it
+            # would return unfiltered rows
+            return None
+        if plan.op is None and plan.column is None and not plan.rows_requested and not plan.filters \
+                and (plan.sort is None or plan.sort[0] is None):
+            # e.g. 'top 3 risks': nothing ties the question to a table
+            return None
+        return plan
+
+    @staticmethod
+    def _ascending(body: str, default: Optional[bool]) -> bool:
+        # Explicit asc/desc words win, then the direction of a preceding top/bottom
+        if _DESC_RE.search(body):
+            return False
+        if _ASC_RE.search(body):
+            return True
+        return True if default is None else default
+
+    @staticmethod
+    def _parse_filter(cond: str, columns: List[str], kinds: Dict[str, str]):
+        m = re.match(r'\s*§(\d+)§(.*)$', cond)
+        if not m:
             return None
+        col = columns[int(m.group(1))]
+        # 'is greater than' reads as 'greater than'
+        rest = re.sub(r'^\s*is\s+(?=(?:greater|more|less|above|over|below|under|at|equal|like)\b)', '', m.group(2))
+        om = _OP_RE.match(rest)
+        if not om:
+            return None
+        op = _OP_NAMES[om.group(1)]
+        raw = om.group(2).strip().strip('\'"')
+        kind = kinds.get(col)
+        if kind in ('num', 'bool') and op != 'contains':
+            if raw in ('true', 'yes'):
+                return col, op, 1.0
+            if raw in ('false', 'no'):
+                return col, op, 0.0
+            try:
+                return col, op, float(raw.replace(',', ''))
+            except ValueError:
+                return None
+        if kind == 'datetime' and op != 'contains':
+            try:
+                return col, op, np.datetime64(pd.Timestamp(raw).tz_localize(None), 'ns')
+            except (ValueError, TypeError):
+                return None
+        return col, op, raw
+
+    # Execution
+
+    def _matching_rows(self, table, filters: List[Any]) -> Optional[np.ndarray]:
+        # Row numbers passing every filter, or None for all rows. Numeric filters
+        # are pushed down to the block statistics first, and each filter column is
+        # read only within the surviving ranges.
+        if not filters:
+            return None
+        if any(table.kind(col) is None for col, _, _ in filters):
+            return np.zeros(0, dtype='int64')
+        numeric = [f for f in filters if table.kind(f[0]) in ('num', 'bool') and f[1] in _COMPARE]
+        parts = []
+        for start, stop in table.candidate_ranges(numeric):
+            mask = np.ones(stop - start, dtype=bool)
+            for col, op, value in filters:
+                values = table.values(col, start, stop)
+                mask &= self._compare(values, op, value, table.kind(col))
+                if not mask.any():
+                    break
+            parts.append(np.nonzero(mask)[0] + start)
+        return np.concatenate(parts) if parts else np.zeros(0, dtype='int64')
+
+    @staticmethod
+    def _compare(values: np.ndarray, op: str, value: Any, kind: str) -> np.ndarray:
+        if kind == 'str' or op == 'contains':
+            series = pd.Series(values, dtype=object).astype(str).str.lower()
+            if op == 'contains':
+                return series.str.contains(str(value), regex=False).to_numpy(dtype=bool)
+            values, value = series.to_numpy(), str(value)
+        try:
+            return np.asarray(_COMPARE[op](values, value), dtype=bool)
+        except TypeError:
+            # The column holds another type in this file than the filter was parsed for
+            return np.zeros(len(values), dtype=bool)
+
+    def _column(self, table, col: str, rows: Optional[np.ndarray]) -> np.ndarray:
+        return table.values(col) if rows is None else table.take(col, rows)
+
+    def execute(self, q: str, tables: List[Any]) -> Optional[Any]:
+        # tables are ColumnarTable objects (utils/tables.py), already scoped to the
+        # requested file(s)
+        if not tables:
+            return None
+        plan = self.plan(q, tables)
+        if plan is None:
+            return None
+        self.logger.info('Tabular plan: %s', plan.to_dict())
+        if plan.op is not None and plan.group_by is None:
+            return self._aggregate(plan, tables)
+        if plan.op is not None:
+            return self._grouped(plan, tables)
+        return self._rows(plan, tables)
+
+    def _aggregate(self, plan: QueryPlan, tables: List[Any]) -> Optional[float]:
+        if not plan.filters:
+            if plan.op == 'count' and plan.column is None:
+                return sum(t.num_rows for t in tables)
+            # Answered from the aggregates stored with each table
+            holders = [t for t in tables if t.kind(plan.column) == 'num']
+            if plan.op == 'count':
+                return sum(int((t.schema_column(plan.column).get('agg') or {}).get('count', 0)) for t in holders) \
+                    if holders else None
+            return self._combine(holders, plan.column, plan.op) if holders else None
+        values = []
+        for table in tables:
+            rows = self._matching_rows(table, plan.filters)
+            if plan.column is None:
+                values.append(np.zeros(len(rows)))
+            elif table.kind(plan.column) in ('num', 'bool'):
+                values.append(np.asarray(table.take(plan.column, rows), dtype='float64'))
+            elif plan.op == 'count' and table.kind(plan.column) is not None:
+                values.append(np.zeros(len(rows)))
+        if not values:
+            return None
+        arr = np.concatenate(values)
+        if plan.op == 'count':
+            return int(len(arr) if plan.column is None else np.count_nonzero(~np.isnan(arr)))
+        arr = arr[~np.isnan(arr)]
+        if not len(arr):
+            return None
+        return float({'sum': np.sum, 'avg': np.mean, 'max': np.max, 'min': np.min}[plan.op](arr))
+
+    def _grouped(self, plan: QueryPlan, tables: List[Any]) -> List[Dict[str, Any]]:
+        frames = []
+        for table in tables:
+            if table.kind(plan.group_by) is None:
+                continue
+            # count works on any column, the other aggregates need numbers
+            kind = table.kind(plan.column) if plan.column is not None else None
+            if plan.column is not None and (kind is None or plan.op != 'count' and kind not in ('num', 'bool')):
+                continue
+            rows = self._matching_rows(table, plan.filters)
+            frame = {'key': self._column(table, plan.group_by, rows)}
+            if plan.column is not None:
+                values = self._column(table, plan.column, rows)
+                frame['value'] = values if plan.op == 'count' else np.asarray(values, dtype='float64')
+            frames.append(pd.DataFrame(frame))
+        if not frames:
+            return []
         df = pd.concat(frames, ignore_index=True)
-        ql = q.lower()
+        func = {'sum': 'sum', 'avg': 'mean', 'max': 'max', 'min': 'min', 'count': 'count'}[plan.op]
+        grouped = df.groupby('key', sort=True)
+        result = grouped.size() if plan.column is None else grouped['value'].agg(func)
+        label = plan.op if plan.column is None else f'{plan.op}_{plan.column}'
+        if plan.sort is not None:
+            if plan.sort[0] == plan.group_by:
+                result = result.sort_index(ascending=plan.sort[1])
+            else:
+                result = result.sort_values(ascending=plan.sort[1])
+        result = result.head(min(plan.limit or self.max_rows, self.max_rows))
+        return [{plan.group_by: k, label: v} for k, v in zip(result.index.tolist(), result.tolist())]
 
-        # top rows
-        m = re.search(r'top\s+(\d+)', ql)
-        if m:
-            n = int(m.group(1))
-            return df.head(n).to_dict(orient='records')
-
-        # sum/avg over a column
-        col_match = re.search(r'column\s+([a-zA-Z0-9_\- ]+)', ql)
-        if col_match:
-            col = col_match.group(1).strip().replace(' ', '_')
-            if col in df.columns:
-                if 'sum' in ql:
-                    return float(df[col].sum())
-                if 'avg' in ql or 'average' in ql:
-                    return float(df[col].mean())
-                if 'max' in ql:
-                    return float(df[col].max())
-                if 'min' in ql:
-                    return float(df[col].min())
-        return None
+    def _rows(self, plan: QueryPlan, tables: List[Any]) -> List[Dict[str, Any]]:
+        limit = min(plan.limit or self.max_rows, self.max_rows)
+        picked = []
+        for table in tables:
+            rows = self._matching_rows(table, plan.filters)
+            if plan.sort is None:
+                # Without a sort only the first `limit` matches are read
+                rows = np.arange(min(limit, table.num_rows)) if rows is None else rows[:limit]
+                picked.append((table, rows, None))
+                limit -= len(rows)
+                if limit <= 0:
+                    break
+                continue
+            col, ascending = plan.sort
+            if table.kind(col) is None:
+                continue
+            if rows is None:
+                rows = np.arange(table.num_rows)
+            keys = self._column(table, col, rows)
+            if len(rows) > limit:
+                # Partial selection instead of a full sort
+                keys_num = np.asarray(keys, dtype='float64') if table.kind(col) in ('num', 'bool') else None
+                if keys_num is not None:
+                    keyed = np.where(np.isnan(keys_num), np.inf if ascending else -np.inf, keys_num)
+                    part = np.argpartition(keyed if ascending else -keyed, limit - 1)[:limit]
+                    rows, keys = rows[part], keys[part]
+            picked.append((table, rows, keys))
+        frames = []
+        for table, rows, keys in picked:
+            if not len(rows):
+                continue
+            frame = pd.DataFrame({name: table.take(name, rows) for name in table.columns}, columns=table.columns)
+            if keys is not None:
+                frame['__key'] = keys
+            frames.append(frame)
+        if not frames:
+            return []
+        df = pd.concat(frames, ignore_index=True)
+        if plan.sort is not None:
+            df = df.sort_values('__key', ascending=plan.sort[1], kind='stable', na_position='last').drop(columns='__key')
+        return df.head(min(plan.limit or self.max_rows, self.max_rows)).to_dict(orient='records')
+
+    @staticmethod
+    def _combine(tables: List[Any], col: str, op: str) -> Optional[float]:
+        aggs = [t.schema_column(col).get('agg') or {} for t in tables]
+        aggs = [a for a in aggs if a.get('count')]
+        if not aggs:
+            return None
+        if op == 'sum':
+            return float(sum(a['sum'] for a in aggs))
+        if op == 'avg':
+            return float(sum(a['sum'] for a in aggs)) / sum(a['count'] for a in aggs)
+        if op == 'max':
+            return float(max(a['max'] for a in aggs))
+        return float(min(a['min'] for a in aggs))
@@ -1,60 +1,367 @@
 import os
-import json
 import io
-from typing import List, Dict, Any
+import time
+import random
+import threading
+from typing import List, Dict, Any, Optional, Callable
 
 import pandas as pd
 import numpy as np
 import faiss
 
+from utils.segments import SegmentLog
+from utils.metastore import MetaStore
+from utils.tables import TableStore
+from utils.bm25 import BM25Index
+from utils.ann import INDEX_TYPES, build_ann_index, supports_remove, search_params
+
 
 class VectorStore:
+    READ_ONLY = False
+
     def __init__(self, config, logger, embedding_service) -> None:
         self.config = config
         self.logger = logger
         self.embedding = embedding_service
-        self.index_path = os.path.join(config.vector_dir, 'faiss.index')
-        self.meta_path = os.path.join(config.vector_dir, 'metadata.jsonl')
-        self.tabular_frames: List[Any] = []
+        # One columnar table per tabular file, kept next to the index
+        self.tables = TableStore(config, logger, read_only=self.READ_ONLY)
+        # The compacted base is memory-mapped read-only; vectors added since live in
+        # the in-memory delta (_index) and base ids deleted since are masked at search
+        self._base = None
+        self._deleted: set = set()
+        self._index = self._new_index(config.faiss_dim)
+        # Chunk metadata, ordered by vector id (the id stored in the FAISS id map)
+        self._meta = MetaStore()
+        self._next_id = 0
+        self._bm25 = BM25Index()
+        self._lock = threading.RLock()
+        self._compacting = False
+        # Held for a whole compaction so an explicit compact() and the background
+        # one never write the same base at once
+        self._compact_lock = threading.Lock()
+        # Callbacks (event, vector_ids) run after chunks are added or removed
+        self._listeners: List[Callable[[str, List[int]], None]] = []
+        if config.faiss_index_type not in INDEX_TYPES:
+            logger.warning('Unknown FAISS_INDEX %r, falling back to flat', config.faiss_index_type)
+            config.faiss_index_type = 'flat'
+        # Optional approximate index serving unscoped queries; the flat vectors
+        # stay the source of truth for scoped search, recall checks and rebuilds
+        self._ann = None
+        self._ann_stale = 0
+        self._ann_building = False
+        # Built since the last compaction, so not yet saved with the base
+        self._ann_unsaved = False
         os.makedirs(config.vector_dir, exist_ok=True)
-        self._index = faiss.IndexFlatIP(config.faiss_dim)
-        self._metas: List[Dict[str, Any]] = []
+        self._segments = SegmentLog(config.vector_dir, logger)
         self._load()
+        self._maybe_compact()
+        self._maybe_build_ann()
+
+    def subscribe(self, callback: Callable[[str, List[int]], None]) -> None:
+        self._listeners.append(callback)
+
+    def _notify(self, event: str, vector_ids: List[int]) -> None:
+        for callback in self._listeners:
+            try:
+                callback(event, vector_ids)
+            except Exception:
+                self.logger.exception('Vector store listener failed on %s', event)
+
+    @staticmethod
+    def _new_index(dim: int):
+        # ID-addressable so chunks can be removed without re-embedding the corpus
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
 
     def _load(self) -> None:
-        if os.path.exists(self.index_path) and os.path.exists(self.meta_path):
+        try:
+            base, self._meta = self._segments.load_base(mmap=True)
+            if base is not None and not isinstance(base, faiss.IndexIDMap2):
+                # Legacy base: copied into memory until the next compaction
+                base = self._migrate_legacy_index(base)
+            self._base = base
+            self._deleted = set()
+            self._index = self._new_index(base.d if base is not None else self.config.faiss_dim)
+            if self.config.faiss_index_type != 'flat':
+                # Saved with the base; the replay below keeps it up to date
+                self._ann, self._ann_stale = self._segments.load_ann(self.config.faiss_index_type)
+            # Replay only what happened since the last compaction
+            for kind, payload, metas in self._segments.iter_segments():
+                if kind == 'add':
+                    self._apply_add(payload, metas)
+                else:
+                    self._apply_delete(payload)
+            # never hand out an id twice, even after the highest ids were removed
+            self._next_id = max(int(self._segments.manifest.get('next_vector_id', 0)), self._meta.max_id + 1)
+            self._build_derived()
+        except Exception:
+            self.logger.warning('Failed to load existing index, starting fresh')
+            self._base, self._deleted = None, set()
+            self._index = self._new_index(self.config.faiss_dim)
+            self._meta = MetaStore()
+            self._bm25 = BM25Index()
+            self._ann, self._ann_stale = None, 0
+
+    def _build_derived(self) -> None:
+        # BM25 postings saved with the base are loaded memory-mapped, so only chunks
+        # from later segments are tokenized; afterwards maintained by
+        # index_chunks/remove_file
+        bm25 = None
+        try:
+            bm25 = self._segments.load_bm25()
+        except Exception:
+            self.logger.warning('Failed to load saved BM25 postings, rebuilding them')
+        self._bm25 = self._caught_up(bm25 or BM25Index())
+        self._sync_tables()
+
+    def _caught_up(self, bm25: BM25Index) -> BM25Index:
+        # Brings postings saved for an earlier snapshot up to the current chunks
+        ids = self._meta.ids
+        base_ids = bm25.base_ids
+        for vid in np.setdiff1d(base_ids, ids).tolist():
+            bm25.remove(vid)
+        added = np.setdiff1d(ids, base_ids) if len(base_ids) else ids
+        for vid, pos in zip(added.tolist(), self._meta.positions(added).tolist()):
+            bm25.add(vid, self._bm25_text(pos))
+        return bm25
+
+    def _bm25_text(self, pos: int) -> str:
+        # Prefer actual text content for BM25
+        text = self._meta.text(pos)
+        if text:
+            return text
+        _, filename, file_type, chunk_type = self._meta.describe(pos)
+        return ' '.join([str(filename or ''), str(file_type or ''), str(chunk_type or '')])
+
+    def _apply_add(self, vectors: np.ndarray, metas: List[Dict[str, Any]]) -> None:
+        if vectors.shape[1] != self._index.d:
+            # rebuild index with correct dim
+            self._index = self._new_index(vectors.shape[1])
+            self._base, self._deleted = None, set()
+            self._ann = None
+        ids = np.asarray([m['vector_id'] for m in metas], dtype='int64')
+        vectors = np.ascontiguousarray(vectors, dtype='float32')
+        self._index.add_with_ids(vectors, ids)
+        # A reader's approximate index is the one saved with the base and stays read-only
+        if self._ann is not None and not self.READ_ONLY:
+            self._ann.add_with_ids(vectors, ids)
+        self._meta.append(metas)
+
+    def _apply_delete(self, ids: np.ndarray) -> None:
+        ids = np.asarray(ids, dtype='int64')
+        self._index.remove_ids(ids)
+        if self._base is not None:
+            # Base rows stay in the file until the next compaction
+            self._deleted.update(ids.tolist())
+        if self._ann is not None and not self.READ_ONLY:
+            if supports_remove(self._ann):
+                self._ann.remove_ids(ids)
+            else:
+                # HNSW cannot delete; stale hits are skipped at search time
+                self._ann_stale += len(ids)
+        self._meta.delete(ids)
+
+    def _migrate_legacy_index(self, index):
+        # Older stores used a bare IndexFlatIP where the row number was the id.
+        # Copy the stored vectors into an id map instead of re-embedding them.
+        vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d), dtype='float32')
+        ids = np.arange(index.ntotal, dtype='int64')
+        migrated = self._new_index(index.d)
+        if len(ids):
+            migrated.add_with_ids(vectors, ids)
+        self.logger.info('Migrated legacy FAISS index with %d vectors to an id map', index.ntotal)
+        return migrated
+
+    def _sync_tables(self) -> None:
+        # Tables are written at upload time; stores from before that (or a crash
+        # between the segment and the table write) get theirs rebuilt once from the
+        # chunks' persisted CSV text
+        self._drop_orphan_tables()
+        if self.READ_ONLY:
+            return
+        missing: Dict[str, List[int]] = {}
+        for pos in self._meta.positions_of_type('tabular'):
+            file_hash = self._meta.describe(int(pos))[0]
+            if not self.tables.has(file_hash):
+                missing.setdefault(file_hash, []).append(int(pos))
+        for file_hash, positions in missing.items():
+            frames = []
+            for pos in positions:
+                text = self._meta.text(pos)
+                if text:
+                    try:
+                        frames.append(pd.read_csv(io.StringIO(text)))
+                    except Exception:
+                        # Skip if cannot reconstruct
+                        pass
+            if frames:
+                self.tables.append(file_hash, self._meta.describe(positions[0])[1], pd.concat(frames, ignore_index=True))
+                self.logger.info('Rebuilt columnar table for %s from %d chunks', file_hash, len(frames))
+
+    def _maybe_compact(self) -> None:
+        # Fold accumulated segments into a fresh base in the background so
+        # restarts replay a bounded log and uploads never rewrite the corpus.
+        # Also run once a new approximate index exists, so readers get it
+        with self._lock:
+            if self._compacting or (self._segments.num_segments < self.config.compact_segments
+                                    and not self._ann_unsaved):
+                return
+            self._compacting = True
+        threading.Thread(target=self.compact, daemon=True).start()
+
+    def compact(self) -> None:
+        with self._compact_lock:
             try:
-                self._index = faiss.read_index(self.index_path)
-                with open(self.meta_path, 'r', encoding='utf-8') as f:
-                    self._metas = [json.loads(line) for line in f]
-                # Reconstruct tabular frames from persisted CSV text if available
-                self.tabular_frames = []
-                for m in self._metas:
-                    if m.get('chunk_type') == 'tabular' and m.get('text'):
-                        try:
-                            df = pd.read_csv(io.StringIO(m['text']))
-                            self.tabular_frames.append(df)
-                        except Exception:
-                            # Skip if cannot reconstruct
-                            pass
+                with self._lock:
+                    self._compacting = True
+                    if self._segments.num_segments == 0 and not self._ann_unsaved:
+                        return
+                    base, deleted = self._base, set(self._deleted)
+                    delta = faiss.clone_index(self._index)
+                    meta = self._meta.copy()
+                    bm25 = self._bm25.snapshot()
+                    built = self._ann
+                    ann = faiss.clone_index(built) if built is not None else None
+                    ann_stale = self._ann_stale
+                    upto = self._segments.last_seq()
+                # The merged flat index is held in memory only while it is written
+                index = self._merged(base, deleted, delta)
+                self._segments.compact(index, meta, upto_seq=upto, bm25=bm25, ann=ann,
+                                       ann_type=self.config.faiss_index_type, ann_stale=ann_stale)
+                del index, delta
+                # Serve from the files just saved, so changes are not held twice
+                new_base = self._segments.load_base_index(mmap=True)
+                new_meta = self._segments.load_base_meta()
+                saved = self._segments.load_bm25()
+                with self._lock:
+                    self._swap_meta(new_meta, meta.ids)
+                    self._swap_base(new_base, meta.ids)
+                    if saved is not None:
+                        self._bm25 = self._caught_up(saved)
+                    # Only once saved; an index built during the compaction waits for the next
+                    if self._ann is built:
+                        self._ann_unsaved = False
             except Exception:
-                self.logger.warning('Failed to load existing index, starting fresh')
+                self.logger.exception('Failed to compact vector store')
+            finally:
+                self._compacting = False
+
+    def _swap_meta(self, saved: MetaStore, base_ids: np.ndarray) -> None:
+        # Chunk texts of the snapshot are now read from the saved (memory-mapped)
+        # blob; only chunks added since stay in memory
+        ids = self._meta.ids
+        added = np.setdiff1d(ids, base_ids)
+        saved.delete(np.setdiff1d(base_ids, ids))
+        saved.append(self._meta.get(int(pos)) for pos in self._meta.positions(added))
+        self._meta = saved
+
+    def _swap_base(self, base, base_ids: np.ndarray) -> None:
+        # The delta keeps only vectors added since the compaction snapshot, the
+        # mask only base ids deleted since
+        ids = self._meta.ids
+        added = np.setdiff1d(ids, base_ids)
+        delta = self._new_index(base.d)
+        if len(added):
+            delta.add_with_ids(self._index.reconstruct_batch(added), added)
+        self._base, self._index = base, delta
+        self._deleted = set(np.setdiff1d(base_ids, ids).tolist())
+
+    def _iter_stored(self, base, deleted: set, delta, block: int = 65536):
+        # (ids, vectors) blocks of the live base rows followed by the delta,
+        # reconstructed from the memory-mapped base a block at a time
+        masked = np.fromiter(deleted, dtype='int64', count=len(deleted))
+        for index, drop in ((base, masked), (delta, None)):
+            if index is None or index.ntotal == 0:
+                continue
+            ids = faiss.vector_to_array(index.id_map).astype('int64')
+            for start in range(0, len(ids), block):
+                part = ids[start:start + block]
+                vectors = index.index.reconstruct_n(start, len(part))
+                if drop is not None and len(drop):
+                    keep = ~np.isin(part, drop)
+                    part, vectors = part[keep], vectors[keep]
+                yield part, vectors
+
+    def _merged(self, base, deleted: set, delta):
+        merged = self._new_index(delta.d)
+        for ids, vectors in self._iter_stored(base, deleted, delta):
+            merged.add_with_ids(vectors, ids)
+        return merged
+
+    def _stored_vectors(self):
+        with self._lock:
+            base, deleted, delta = self._base, set(self._deleted), faiss.clone_index(self._index)
+        parts = list(self._iter_stored(base, deleted, delta))
+        if not parts:
+            return np.zeros((0, delta.d), dtype='float32'), np.zeros(0, dtype='int64')
+        return np.vstack([v for _, v in parts]), np.concatenate([i for i, _ in parts])
+
+    def _vectors_of(self, ids: np.ndarray) -> np.ndarray:
+        # Stored vectors of live ids, from the delta or else the base
+        ids = np.asarray(ids, dtype='int64')
+        in_delta = np.isin(ids, faiss.vector_to_array(self._index.id_map))
+        vectors = np.zeros((len(ids), self._index.d), dtype='float32')
+        if in_delta.any():
+            vectors[in_delta] = self._index.reconstruct_batch(ids[in_delta])
+        if (~in_delta).any():
+            vectors[~in_delta] = self._base.reconstruct_batch(ids[~in_delta])
+        return vectors
+
+    def _maybe_build_ann(self) -> None:
+        if self.config.faiss_index_type == 'flat':
+            return
+        with self._lock:
+            if self._ann_building:
+                return
+            if len(self._meta) < self.config.ann_train_threshold:
+                # Too small to be worth training; flat search is exact and fast here
+                self._ann = None
+                return
+            if self._ann is not None and self._ann_stale <= 0.1 * len(self._meta):
+                return
+            self._ann_building = True
+        threading.Thread(target=self.build_ann, daemon=True).start()
 
-    def _persist(self) -> None:
+    def build_ann(self) -> None:
         try:
-            faiss.write_index(self._index, self.index_path)
-            with open(self.meta_path, 'w', encoding='utf-8') as f:
-                for m in self._metas:
-                    f.write(json.dumps(m, ensure_ascii=False) + '\n')
+            with self._lock:
+                self._ann_building = True
+            vectors, ids = self._stored_vectors()
+            started = time.time()
+            ann = build_ann_index(self.config, vectors, ids)
+            with self._lock:
+                # Catch up with uploads and deletes that happened while training
+                added = np.setdiff1d(self._meta.ids, ids)
+                if len(added):
+                    ann.add_with_ids(self._vectors_of(added), added)
+                removed = np.setdiff1d(ids, self._meta.ids)
+                stale = 0
+                if len(removed):
+                    if supports_remove(ann):
+                        ann.remove_ids(removed)
+                    else:
+                        stale = len(removed)
+                self._ann = ann
+                self._ann_stale = stale
+                self._ann_unsaved = True
+            del vectors
+            self.logger.info('Built %s index over %d vectors in %.1fs',
+                             self.config.faiss_index_type, len(ids), time.time() - started)
         except Exception:
-            self.logger.warning('Failed to persist index')
+            self.logger.exception('Failed to build %s index', self.config.faiss_index_type)
+        finally:
+            self._ann_building = False
+        self._maybe_compact()
 
-    def index_chunks(self, chunks: List[Dict[str, Any]], file_hash: str, filename: str, file_type: str) -> None:
+    def index_chunks(self, chunks: List[Dict[str, Any]], file_hash: str, filename: str, file_type: str,
+                     progress=None, append: bool = False) -> None:
+        # append=True adds to chunks of the same file indexed by earlier calls
+        # (the batches of a streamed upload)
         texts: List[str] = []
         metas: List[Dict[str, Any]] = []
+        frames: List[pd.DataFrame] = []
         for ch in chunks:
             if ch['type'] == 'tabular':
-                self.tabular_frames.append(ch['dataframe'])
+                frames.append(ch['dataframe'])
                 text_repr = ch['dataframe'].to_csv(index=False)
                 texts.append(text_repr)
                 content_text = text_repr
@@ -73,87 +380,391 @@ class VectorStore:
             metas.append(meta)
         if not texts:
             return
-        # Use a cache key that depends on file hash and number of chunks to avoid shape mismatch
-        cache_key = f"{file_hash}_{len(texts)}"
-        vectors = self.embedding.embed(texts, cache_key=cache_key)
+        # Chunks seen before (re-uploads, edited documents) come from the per-chunk cache
+        batch = self.config.embed_batch_size
+        parts = []
+        for start in range(0, len(texts), batch):
+            parts.append(self.embedding.embed(texts[start:start + batch]))
+            # Batches let long-running ingestion jobs report progress
+            if progress:
+                progress(min(1.0, (start + batch) / len(texts)))
+        vectors = np.vstack(parts)
         if vectors.ndim == 1:
             vectors = vectors.reshape(1, -1)
-        if vectors.shape[1] != self._index.d:
-            # rebuild index with correct dim
-            self._index = faiss.IndexFlatIP(vectors.shape[1])
-        self._index.add(vectors)
-        self._metas.extend(metas)
-        self._persist()
-
-    def search(self, query: str, top_k: int) -> List[Dict[str, Any]]:
-        if getattr(self._index, 'ntotal', 0) == 0:
-            return []
-        qv = self.embedding.embed([query])[0].reshape(1, -1)
-        scores, ids = self._index.search(qv, top_k)
-        results: List[Dict[str, Any]] = []
-        for rank, idx in enumerate(ids[0]):
-            if idx == -1 or idx >= len(self._metas):
+        # Everything below happens under the lock, so a file becomes searchable all at once
+        with self._lock:
+            if not append and self._meta.has_file(file_hash):
+                # Same content was indexed by a concurrent job in the meantime
+                self.logger.info('Skipping duplicate content %s (%s)', file_hash, filename)
+                return
+            for offset, meta in enumerate(metas):
+                meta['vector_id'] = self._next_id + offset
+            # Persist the segment before exposing it, so a crash never leaves
+            # searchable chunks that would be lost on restart
+            self._segments.append_add(vectors, metas, next_vector_id=self._next_id + len(metas))
+            start = len(self._meta)
+            self._apply_add(vectors, metas)
+            for pos in range(start, len(self._meta)):
+                self._bm25.add(int(self._meta.ids[pos]), self._bm25_text(pos))
+            self._next_id += len(metas)
+            if frames:
+                try:
+                    self.tables.append(file_hash, filename, pd.concat(frames, ignore_index=True))
+                except Exception:
+                    # Rebuilt from the chunk text on the next start
+                    self.logger.exception('Failed to write columnar table for %s', filename)
+        self._notify('add', [m['vector_id'] for m in metas])
+        self._maybe_compact()
+        self._maybe_build_ann()
+
+    def ids_for(self, file_hash: str = None, filename: str = None) -> Optional[np.ndarray]:
+        # None means unrestricted; an empty array means nothing matches
+        if not file_hash and not filename:
+            return None
+        with self._lock:
+            return self._meta.ids_for(file_hash or None, filename or None)
+
+    def search(self, query: str, top_k: int, allowed_ids: Optional[np.ndarray] = None,
+               nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self.search_many([query], top_k, allowed_ids=allowed_ids, nprobe=nprobe, ef_search=ef_search)[0]
+
+    def search_many(self, queries: List[str], top_k: int, allowed_ids: Optional[np.ndarray] = None,
+                    nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        # All queries are embedded together and answered by a single multi-row FAISS search
+        if not len(self._meta) or not queries:
+            return [[] for _ in queries]
+        if allowed_ids is not None:
+            if len(allowed_ids) == 0:
+                return [[] for _ in queries]
+            top_k = min(top_k, len(allowed_ids))
+        qv = np.ascontiguousarray(self.embedding.embed_queries(queries), dtype='float32')
+        with self._lock:
+            if allowed_ids is not None or self._ann is None:
+                indexes = (self._base, self._index)
+            elif self.READ_ONLY:
+                # A reader's approximate index covers the base only
+                indexes = (self._ann, self._index)
+            else:
+                indexes = (self._ann,)
+            scores, ids = self._search_indexes(qv, top_k, indexes, allowed_ids, nprobe, ef_search)
+            return self._results(scores, ids, top_k)
+
+    def _search_indexes(self, qv: np.ndarray, k: int, indexes, allowed_ids: Optional[np.ndarray] = None,
+                        nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        # Hits of every index merged per query by score; missing slots are -1 with -inf scores
+        score_parts, id_parts = [], []
+        for index in indexes:
+            if index is None or index.ntotal == 0:
                 continue
-            meta = self._metas[idx]
-            results.append({'score': float(scores[0][rank]), **meta})
-        return results
+            fetch = min(k, index.ntotal)
+            params = None
+            if index is self._ann:
+                params = search_params(self.config, nprobe=nprobe, ef_search=ef_search)
+                # Deleted ids HNSW could not drop are skipped in _results
+                fetch = min(k + min(self._ann_stale, k), index.ntotal)
+            selector = None
+            if allowed_ids is not None:
+                # Restrict inside FAISS so scoped queries never lose hits to other files
+                selector = faiss.IDSelectorBatch(allowed_ids)
+            elif self._deleted and (index is self._base or (index is self._ann and self.READ_ONLY)):
+                masked = faiss.IDSelectorBatch(np.fromiter(self._deleted, dtype='int64', count=len(self._deleted)))
+                selector = faiss.IDSelectorNot(masked)
+            if selector is not None:
+                params = params or faiss.SearchParameters()
+                params.sel = selector
+            scores, ids = index.search(qv, fetch) if params is None else index.search(qv, fetch, params=params)
+            score_parts.append(scores)
+            id_parts.append(ids)
+        if not id_parts:
+            return np.zeros((len(qv), 0), dtype='float32'), np.zeros((len(qv), 0), dtype='int64')
+        scores, ids = np.hstack(score_parts), np.hstack(id_parts)
+        scores = np.where(ids < 0, -np.inf, scores)
+        order = np.argsort(-scores, axis=1, kind='stable')
+        return np.take_along_axis(scores, order, 1), np.take_along_axis(ids, order, 1)
+
+    def _results(self, scores: np.ndarray, ids: np.ndarray, top_k: int) -> List[List[Dict[str, Any]]]:
+        all_results: List[List[Dict[str, Any]]] = []
+        for row in range(len(ids)):
+            results: List[Dict[str, Any]] = []
+            for rank, pos in enumerate(self._meta.positions(ids[row])):
+                if pos < 0:
+                    continue
+                results.append({'score': float(scores[row][rank]), **self._meta.get(int(pos))})
+            all_results.append(results[:top_k])
+        return all_results
+
+    def recall_check(self, k: int = 10, sample: int = 100, queries: Optional[List[str]] = None,
+                     nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> Dict[str, Any]:
+        # Compare the approximate index against exact flat search to pick nprobe/efSearch
+        report: Dict[str, Any] = {
+            'index_type': self.config.faiss_index_type,
+            'ntotal': len(self._meta),
+            'ann_ready': self._ann is not None,
+        }
+        if self._ann is None or not len(self._meta):
+            return report
+        # The flat vectors holding the same ids as the approximate index
+        exact_indexes = (self._base,) if self.READ_ONLY else (self._base, self._index)
+        if queries:
+            qv = np.ascontiguousarray(self.embedding.embed(queries, use_cache=False), dtype='float32').reshape(len(queries), -1)
+        else:
+            with self._lock:
+                all_ids = self._meta.ids
+                if self.READ_ONLY:
+                    all_ids = np.setdiff1d(all_ids, faiss.vector_to_array(self._index.id_map))
+                if not len(all_ids):
+                    return report
+                picked = np.random.default_rng(0).choice(all_ids, size=min(sample, len(all_ids)), replace=False)
+                qv = self._vectors_of(picked)
+        params = search_params(self.config, nprobe=nprobe, ef_search=ef_search)
+        with self._lock:
+            started = time.time()
+            _, exact = self._search_indexes(qv, k, exact_indexes)
+            flat_ms = (time.time() - started) * 1000
+            started = time.time()
+            _, approx = self._search_indexes(qv, k, (self._ann,), nprobe=nprobe, ef_search=ef_search)
+            approx = approx[:, :k]
+            ann_ms = (time.time() - started) * 1000
+        hits = [len(set(a[a >= 0]) & set(e[e >= 0])) / max(1, int((e >= 0).sum())) for a, e in zip(approx, exact)]
+        report.update({
+            'k': k,
+            'queries': len(qv),
+            'nprobe': getattr(params, 'nprobe', None),
+            'ef_search': getattr(params, 'efSearch', None),
+            'recall': float(np.mean(hits)),
+            'flat_ms_per_query': flat_ms / len(qv),
+            'ann_ms_per_query': ann_ms / len(qv),
+        })
+        return report
+
+    def keyword_search(self, query: str, top_k: int, allowed_ids: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            hits = self._bm25.search(query, top_k, allowed_ids=allowed_ids)
+            positions = self._meta.positions(np.asarray([vid for vid, _ in hits], dtype='int64'))
+            return [{'score': sc, **self._meta.get(int(pos))} for (_, sc), pos in zip(hits, positions) if pos >= 0]
+
+    def chunk_count(self, file_hash: str) -> int:
+        with self._lock:
+            return self._meta.count(file_hash)
+
+    def sample_texts(self, limit: int, seed: int = 0) -> List[str]:
+        with self._lock:
+            positions = list(range(len(self._meta)))
+            random.Random(seed).shuffle(positions)
+            texts = []
+            for pos in positions:
+                if len(texts) >= limit:
+                    break
+                text = self._meta.text(pos)
+                if text:
+                    texts.append(text)
+        return texts
 
     def list_files(self) -> List[Dict[str, Any]]:
-        summary: Dict[str, Dict[str, Any]] = {}
-        for m in self._metas:
-            key = m.get('file_hash') or m.get('filename')
-            if key not in summary:
-                summary[key] = {
-                    'file_hash': m.get('file_hash'),
-                    'filename': m.get('filename'),
-                    'file_type': m.get('file_type'),
-                    'num_chunks': 0
-                }
-            summary[key]['num_chunks'] += 1
-        return list(summary.values())
-
-    def _rebuild_index_from_metas(self) -> None:
-        texts: List[str] = []
-        for m in self._metas:
-            texts.append(m.get('text', ''))
-        if not texts:
-            # fresh empty index
-            self._index = faiss.IndexFlatIP(self._index.d if hasattr(self._index, 'd') else self.config.faiss_dim)
-            self.tabular_frames = []
-            self._persist()
-            return
-        vectors = self.embedding.embed(texts)
-        if vectors.ndim == 1:
-            vectors = vectors.reshape(1, -1)
-        self._index = faiss.IndexFlatIP(vectors.shape[1])
-        self._index.add(vectors)
-        # rebuild tabular frames
-        self.tabular_frames = []
-        for m in self._metas:
-            if m.get('chunk_type') == 'tabular' and m.get('text'):
-                try:
-                    df = pd.read_csv(io.StringIO(m['text']))
-                    self.tabular_frames.append(df)
-                except Exception:
-                    pass
-        self._persist()
+        with self._lock:
+            return self._meta.files()
 
     def remove_file(self, file_hash: str = None, filename: str = None) -> int:
-        before = len(self._metas)
         if not file_hash and not filename:
             return 0
-        new_metas: List[Dict[str, Any]] = []
-        for m in self._metas:
-            if file_hash and m.get('file_hash') == file_hash:
-                continue
-            if filename and m.get('filename') == filename:
-                continue
-            new_metas.append(m)
-        removed = before - len(new_metas)
-        if removed > 0:
-            self._metas = new_metas
-            self._rebuild_index_from_metas()
-        return removed
-
-    def get_tabular_frames(self):
-        return self.tabular_frames
+        with self._lock:
+            parts = []
+            if file_hash:
+                parts.append(self._meta.ids_for(file_hash=file_hash))
+            if filename:
+                parts.append(self._meta.ids_for(filename=filename))
+            removed_ids = np.unique(np.concatenate(parts)).tolist()
+            if not removed_ids:
+                return 0
+            self._segments.append_delete(removed_ids)
+            # Drop only the removed vectors; remaining vectors stay untouched
+            self._apply_delete(np.asarray(removed_ids, dtype='int64'))
+            for vid in removed_ids:
+                self._bm25.remove(vid)
+            self._drop_orphan_tables()
+        self._notify('remove', removed_ids)
+        self._maybe_compact()
+        self._maybe_build_ann()
+        return len(removed_ids)
+
+    def get_tables(self, file_hash: str = None, filename: str = None) -> List[Any]:
+        # Columnar tables of the indexed tabular files, in upload order; file_hash
+        # and/or filename restrict them the same way as scoped search
+        with self._lock:
+            live = self._meta.hashes('tabular')
+            hashes = [f['file_hash'] for f in self._meta.files() if f['file_hash'] in live
+                      and (not file_hash or f['file_hash'] == file_hash)
+                      and (not filename or f['filename'] == filename)]
+        return [t for t in (self.tables.get(h) for h in hashes) if t is not None]
+
+    def refresh(self) -> bool:
+        # This process writes every change itself, so there is nothing to pick up
+        return False
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'read_only': False,
+            'generation': self._segments.generation,
+            'segments': self._segments.num_segments,
+            'chunks': len(self._meta),
+            'mmap_base_vectors': int(self._base.ntotal) if self._base is not None else 0,
+            'delta_vectors': int(self._index.ntotal),
+            'masked_base_vectors': len(self._deleted),
+            'ann': self.config.faiss_index_type if self._ann is not None else None,
+            'tables': len(self.tables.hashes()),
+        }
+
+    def _drop_orphan_tables(self) -> None:
+        # Readers only close their handles; the writer deletes the files
+        live = self._meta.hashes()
+        for h in self.tables.hashes():
+            if h not in live:
+                self.tables.remove(h)
+
+
+class ReadOnlyVectorStore(VectorStore):
+    # Reader side of a multi-process deployment. The compacted base written by the
+    # writer is opened memory-mapped and read-only, so every reader shares its pages;
+    # so are the BM25 postings and approximate index saved with it. Segments appended
+    # since go into a small in-memory delta index and deletes of base vectors are
+    # masked at search time. A watcher thread follows the manifest generation and
+    # applies new segments, or reloads everything after a compaction.
+
+    # Attributes swapped in from a freshly loaded store on a full reload
+    READ_ONLY = True
+
+    _STATE = ('_segments', '_base', '_base_ref', '_deleted', '_applied_seq', '_index', '_meta',
+              '_next_id', '_bm25', '_ann', '_ann_stale')
+
+    def __init__(self, config, logger, embedding_service, watch: bool = True) -> None:
+        self._base_ref = None
+        self._applied_seq = 0
+        self._stale = False
+        # One refresh at a time: the watcher and request threads both call it
+        self._refresh_lock = threading.Lock()
+        super().__init__(config, logger, embedding_service)
+        if watch:
+            threading.Thread(target=self._watch, daemon=True, name='index-reload').start()
+
+    def _load(self) -> None:
+        try:
+            self._segments.reload()
+            base, self._meta = self._segments.load_base(mmap=True)
+            if base is not None and not isinstance(base, faiss.IndexIDMap2):
+                # Legacy base: copied into memory until the writer compacts it
+                base = self._migrate_legacy_index(base)
+            self._base = base
+            self._base_ref = self._segments.manifest.get('base')
+            self._ann, self._ann_stale = None, 0
+            if base is not None and self.config.faiss_index_type != 'flat':
+                # Covers the base vectors only; the delta is searched exactly
+                self._ann, self._ann_stale = self._segments.load_ann(self.config.faiss_index_type, mmap=True)
+            self._index = self._new_index(base.d if base is not None else self.config.faiss_dim)
+            self._deleted = set()
+            self._apply_segments()
+            self._build_derived()
+            self._stale = False
+        except Exception:
+            # Usually a compaction removed files mid-read; the watcher retries
+            self.logger.warning('Failed to load index snapshot, retrying on next reload')
+            self._base = None
+            self._ann, self._ann_stale = None, 0
+            self._index = self._new_index(self.config.faiss_dim)
+            self._meta = MetaStore()
+            self._bm25 = BM25Index()
+            self._stale = True
+
+    def _apply_segments(self) -> tuple:
+        added: List[int] = []
+        removed: List[int] = []
+        for kind, payload, metas in self._segments.iter_segments(after_seq=self._applied_seq):
+            if kind == 'add':
+                self._apply_add(payload, metas)
+                added.extend(int(m['vector_id']) for m in metas)
+            else:
+                self._apply_delete(payload)
+                removed.extend(int(i) for i in payload)
+        self._applied_seq = self._segments.last_seq()
+        return added, removed
+
+    def _maybe_compact(self) -> None:
+        pass
+
+    def _maybe_build_ann(self) -> None:
+        pass
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self.config.reload_interval)
+            try:
+                self.refresh()
+            except Exception:
+                self.logger.exception('Index reload failed')
+
+    def refresh(self) -> bool:
+        with self._refresh_lock:
+            if not self._segments.reload() and not self._stale:
+                return False
+            if self._segments.manifest.get('base') != self._base_ref or self._stale:
+                self._reload_all()
+            else:
+                self._apply_new_segments()
+            return True
+
+    def _apply_new_segments(self) -> None:
+        with self._lock:
+            added, removed = self._apply_segments()
+            for vid in removed:
+                self._bm25.remove(vid)
+            for vid in added:
+                pos = self._meta.pos(vid)
+                if pos is None:
+                    continue
+                self._bm25.add(vid, self._bm25_text(pos))
+            self._drop_orphan_tables()
+        self._after_reload(added, removed)
+
+    def _reload_all(self) -> None:
+        # Build the new snapshot off to the side, then swap it in at once
+        fresh = ReadOnlyVectorStore(self.config, self.logger, self.embedding, watch=False)
+        if fresh._stale:
+            self._stale = True
+            return
+        with self._lock:
+            before = self._meta.ids.copy()
+            for name in self._STATE:
+                setattr(self, name, getattr(fresh, name))
+            self._stale = False
+            after = self._meta.ids
+            added, removed = np.setdiff1d(after, before).tolist(), np.setdiff1d(before, after).tolist()
+        self._after_reload(added, removed)
+
+    def _after_reload(self, added: List[int], removed: List[int]) -> None:
+        if removed:
+            self._notify('remove', removed)
+        if added:
+            self._notify('add', added)
+        self.logger.info('Reloaded index generation %d (+%d / -%d chunks)',
+                         self._segments.generation, len(added), len(removed))
+
+    def _read_only(self, *args, **kwargs):
+        raise RuntimeError('This process serves a read-only index; changes go through the writer')
+
+    index_chunks = _read_only
+    remove_file = _read_only
+    compact = _read_only
+    build_ann = _read_only
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'read_only': True,
+            'generation': self._segments.generation,
+            'segments': self._segments.num_segments,
+            'chunks': len(self._meta),
+            'mmap_base_vectors': int(self._base.ntotal) if self._base is not None else 0,
+            'delta_vectors': int(self._index.ntotal),
+            'masked_base_vectors': len(self._deleted),
+            'ann': self.config.faiss_index_type if self._ann is not None else None,
+            'bm25_saved_docs': len(self._bm25.base_ids),
+            'tables': len(self.tables.hashes()),
+        }
@@ -0,0 +1,42 @@
+import os
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+ROLES = ('standalone', 'writer', 'reader', 'auto')
+
+# Held open for the life of the process; closing it would release the writer lock
+_writer_lock = None
+
+
+def resolve_role(config, logger) -> str:
+    # Decide whether this process writes the index or only serves reads. At most
+    # one process per vector_dir holds the writer lock at a time.
+    global _writer_lock
+    role = config.index_role
+    if role not in ROLES:
+        logger.warning('Unknown INDEX_ROLE %r, running standalone', role)
+        return 'standalone'
+    if role in ('standalone', 'reader'):
+        return role
+    if fcntl is None:
+        logger.warning('File locks are unavailable on this platform, running standalone')
+        return 'standalone'
+    os.makedirs(config.vector_dir, exist_ok=True)
+    handle = open(os.path.join(config.vector_dir, 'writer.lock'), 'a+')
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        if role == 'writer':
+            raise RuntimeError('Another process already holds the index writer lock')
+        return 'reader'
+    handle.seek(0)
+    handle.truncate()
+    handle.write(str(os.getpid()))
+    handle.flush()
+    _writer_lock = handle
+    return 'writer'